@@ -1,222 +1,815 @@
+import bisect
 import hashlib
-import hmac
+import json
 import logging
-import secrets
+import queue
 from datetime import datetime
 
-from bson.objectid import ObjectId
-from flask import Flask, jsonify, render_template, request
-from pymongo import MongoClient
+from flask import (
+    Blueprint,
+    Flask,
+    Response,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+)
+from werkzeug.local import LocalProxy
+
+from block_seed import random_seeds
+from dice_expr import compile_expression, plan_cache_stats, roll_expression
+from history import DEFAULT_PAGE_SIZE, LIST_FIELDS, MAX_PAGE_SIZE, encode_cursor
+from provably_fair import (
+    CURRENT_VERSION,
+    DICE_SIDES,
+    ROLL_V1,
+    parse_dice_type,
+    provably_fair_roll,
+)
+from services import Services, config_from_env
+from sessions import (
+    HASH_SIZE,
+    inclusion_proof,
+    new_session,
+    public_session,
+    tree_root,
+)
 
 logging.basicConfig(level=logging.INFO)
 
-# Blockchain access via Hive Nectar
-try:
-    from nectar.blockchain import (
-        Blockchain,
-    )  # hive-nectar package mirrors beem.blockchain
-except ImportError:
-    # Fallback in case import name differs or package missing
-    Blockchain = None
+bp = Blueprint("dice", __name__)
 
 
-# Connect to MongoDB
-mongo_client = MongoClient("mongodb://localhost:27017/")
-db = mongo_client["ultimate_dice"]
-rolls_collection = db["dice_rolls"]
+def services():
+    """The current app's `Services` (clients and caches, built on first use)."""
+    return current_app.extensions["dice"]
 
-app = Flask(__name__)
 
-# Initialize blockchain interface if available
-blockchain = None
-if Blockchain is not None:
-    try:
-        blockchain = Blockchain()
-    except Exception as e:
-        print(f"Warning: Failed to initialize Hive blockchain interface: {e}")
+# Roll storage: MongoDB by default, or sqlite:///path.db / memory://
+store = LocalProxy(lambda: services().store)
+# Newest rolls and recently viewed roll details are served from memory.
+# With several workers each cache re-syncs from Mongo after max_age seconds.
+recent_cache = LocalProxy(lambda: services().recent_cache)
+# Live feed of new rolls. One worker needs only the in-process broker; with
+# ROLL_FEED_BACKEND=mongo workers share rolls through a capped collection.
+roll_broker = LocalProxy(lambda: services().roll_broker)
+# Running fairness counters per die type, flushed to the store's stats
+# collection and served by /api/stats
+roll_stats = LocalProxy(lambda: services().roll_stats)
+metrics = LocalProxy(lambda: services().metrics)
+
+
+def create_app(config=None):
+    """Build the app from the environment plus `config` overrides.
+
+    Nothing is connected here: the roll store, Hive client, caches and
+    background threads are created per process on first use (see
+    services.py), so this is cheap and safe before a fork.
+    """
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    app.config.update(config or {})
+    dice = app.extensions["dice"] = Services(app.config)
+    dice.metrics.init_app(app)
+    dice.profiler.init_app(app)
+    app.register_blueprint(bp)
+    return app
+
 
+@bp.before_app_request
+def ensure_history_indexes():
+    # Created on the first request rather than at startup, so a Mongo outage
+    # does not stop the app from booting; retried until it succeeds.
+    services().ensure_indexes()
 
-@app.route("/verify")
+
+@bp.route("/verify")
 def verify_page():
     return render_template("proof_verify.html")
 
 
-# Helper to roll dice
-DICE_SIDES = {"d4": 4, "d6": 6, "d8": 8, "d10": 10, "d12": 12, "d20": 20, "d100": 100}
+def newest_rolls(limit):
+    """Return ``(rolls, more)`` for the newest rolls, from the cache if warm.
 
+    The cache holds whole documents (detail pages use them), so rolls are
+    projected to `LIST_FIELDS` here, matching filtered pages either way.
+    """
+    cached = recent_cache.recent(limit)
+    if cached is None:
+        rolls = store.recent(recent_cache.size)
+        recent_cache.warm(rolls)
+        cached = rolls[:limit], len(rolls) > limit
+    rolls, more = cached
+    listed = [
+        {k: v for k, v in roll.items() if k == "_id" or k in LIST_FIELDS}
+        for roll in rolls
+    ]
+    return listed, more
 
-def provably_fair_roll(dice_type, dice_count, server_seed, client_seed, nonce):
-    sides = DICE_SIDES.get(dice_type)
-    if not sides:
-        raise ValueError("Unsupported dice type")
-    # Compose message: client_seed:nonce
-    message = f"{client_seed}:{nonce}".encode()
-    # HMAC-SHA256(server_seed, message)
-    digest = hmac.new(server_seed.encode(), message, hashlib.sha256).hexdigest()
-    # Use digest to generate dice rolls
-    results = []
-    for i in range(dice_count):
-        # Take 8 hex digits per die (32 bits, more than enough)
-        start = i * 8
-        end = start + 8
-        chunk = digest[start:end]
-        if len(chunk) < 8:
-            # Extend digest if needed
-            chunk += digest[: 8 - len(chunk)]
-        num = int(chunk, 16)
-        roll = (num % sides) + 1
-        results.append(roll)
-    return results, digest
-
-
-@app.route("/")
+
+@bp.route("/")
 def index():
     # Show last 10 rolls (most recent first)
-    rolls = list(rolls_collection.find().sort("timestamp", -1).limit(10))
-    for roll in rolls:
-        roll["id"] = str(roll["_id"])
+    rolls, _ = newest_rolls(DEFAULT_PAGE_SIZE)
+    rolls = [dict(roll, id=str(roll["_id"])) for roll in rolls]
     return render_template("index.html", rolls=rolls)
 
 
-@app.route("/api/rolls", methods=["GET"])
+def roll_json(r):
+    return {
+        "id": str(r["_id"]),
+        "dice_type": r["dice_type"],
+        "roll_result": r["roll_result"],
+        "proof": r["proof"],
+        "timestamp": r["timestamp"].isoformat(),
+        "server_seed": r["server_seed"],
+        "client_seed": r["client_seed"],
+        "nonce": r["nonce"],
+        "modifier": r["modifier"],
+        "label": r["label"],
+        "block_num": r.get("block_num"),
+        "algo": r.get("algo", ROLL_V1),
+        "expression": r.get("expression"),
+        "total": r.get("total"),
+    }
+
+
+def publish_roll(roll):
+    payload = roll_json(roll)
+    roll_relay = services().roll_relay
+    if roll_relay is not None:
+        roll_relay.publish(payload)
+    else:
+        roll_broker.publish(payload)
+
+
+def optional_int(name):
+    value = request.args.get(name)
+    return int(value) if value not in (None, "") else None
+
+
+@bp.route("/api/rolls", methods=["GET"])
 def api_rolls():
-    # Return last 10 rolls as JSON
-    rolls = list(rolls_collection.find().sort("timestamp", -1).limit(10))
-    return jsonify(
-        [
-            {
-                "id": str(r["_id"]),
-                "dice_type": r["dice_type"],
-                "roll_result": r["roll_result"],
-                "proof": r["proof"],
-                "timestamp": r["timestamp"].isoformat(),
-                "server_seed": r["server_seed"],
-                "client_seed": r["client_seed"],
-                "nonce": r["nonce"],
-                "modifier": r["modifier"],
-                "label": r["label"],
-                "block_num": r.get("block_num"),
-            }
-            for r in rolls
-        ]
+    # Newest-first roll history, paged with ?before=/?after= cursors and
+    # filtered by label, dice_type and block_min/block_max
+    try:
+        limit = optional_int("limit") or DEFAULT_PAGE_SIZE
+        filters = {
+            "label": request.args.get("label"),
+            "dice_type": request.args.get("dice_type"),
+            "block_min": optional_int("block_min"),
+            "block_max": optional_int("block_max"),
+        }
+        filters = {k: v for k, v in filters.items() if v is not None}
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        before = request.args.get("before")
+        after = request.args.get("after")
+        if filters or before or after:
+            rolls, next_cursor, prev_cursor = store.page(
+                limit, before, after, filters, fields=LIST_FIELDS
+            )
+        else:
+            # The unfiltered first page is what every client polls
+            rolls, more = newest_rolls(limit)
+            next_cursor = encode_cursor(rolls[-1]) if more else None
+            prev_cursor = None
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    response = jsonify(
+        {
+            "rolls": [roll_json(r) for r in rolls],
+            "next": next_cursor,
+            "prev": prev_cursor,
+        }
     )
+    # Clients revalidate every time and get a 304 while history is unchanged
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
 
 
-@app.route("/roll/<string:roll_id>")
+@bp.route("/api/rolls/stream", methods=["GET"])
+def api_rolls_stream():
+    # Server-Sent Events feed of new rolls; resumes from Last-Event-ID
+    roll_relay = services().roll_relay
+    if roll_relay is not None:
+        roll_relay.start()
+    last_event_id = request.headers.get("Last-Event-ID")
+    response = Response(
+        roll_broker.subscribe(last_event_id), mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@bp.route("/roll/<string:roll_id>")
 def roll_detail(roll_id):
-    roll = rolls_collection.find_one({"_id": ObjectId(roll_id)})
+    timer = metrics.timer("roll_detail")
+    roll = recent_cache.get(roll_id)
     if roll is None:
-        return jsonify({"success": False, "message": "Roll not found"}), 404
+        roll = store.get(roll_id)
+        if roll is None:
+            return jsonify({"success": False, "message": "Roll not found"}), 404
+        recent_cache.put(roll)
+    timer.mark("lookup")
     # Recompute result and proof for verification
     try:
-        recomputed_result, recomputed_proof = provably_fair_roll(
-            roll["dice_type"].split("x")[-1],
-            int(roll["dice_type"].split("x")[0]) if "x" in roll["dice_type"] else 1,
-            roll["server_seed"],
-            roll["client_seed"],
-            roll["nonce"],
-        )
+        recomputed_result, recomputed_proof = recompute_roll(roll)
     except Exception as e:
         recomputed_result, recomputed_proof = [], f"Error: {e}"
     verified = (
         recomputed_proof == roll["proof"]
         and ",".join(map(str, recomputed_result)) == roll["roll_result"]
     )
-    return render_template(
+    timer.mark("hmac")
+    page = render_template(
         "roll_detail.html",
         roll=roll,
         verified=verified,
         recomputed_result=recomputed_result,
         recomputed_proof=recomputed_proof,
     )
+    timer.mark("render")
+    return page
 
 
-@app.route("/api/roll", methods=["POST"])
-def api_roll():
-    data = request.json
+MAX_DICE_COUNT = 10000
+MAX_BATCH_ROLLS = 10000
+MAX_BATCH_DICE = 100000
+MAX_VERIFY_BATCH = 10000
+MAX_VERIFY_BYTES = 8 * 1024 * 1024
+VERIFY_CHUNK = 1000  # rows verified (and streamed) at a time
+MAX_SERVED_SUPPORT = 10_000  # totals in a /api/distribution PMF
+
+
+def recompute_roll(roll):
+    """Re-derive ``(results, proof)`` for a stored roll document."""
+    server_seed = roll["server_seed"]
+    if server_seed is None and roll.get("session"):
+        # Cached session rolls may predate the seed reveal
+        session = store.get_session(roll["session"])
+        if session is None or session["status"] != "closed":
+            raise ValueError("Server seed is revealed when the session is closed")
+        server_seed = session["server_seed"]
+    if roll.get("expression"):
+        _, _, kept, _, proof = roll_expression(
+            roll["expression"], server_seed, roll["client_seed"], roll["nonce"]
+        )
+        return kept, proof
+    dice_type, dice_count = parse_dice_type(roll["dice_type"])
+    return provably_fair_roll(
+        dice_type,
+        dice_count,
+        server_seed,
+        roll["client_seed"],
+        roll["nonce"],
+        roll.get("algo", ROLL_V1),
+    )
+
+
+def parse_roll_spec(data):
+    """Validate a roll request body; returns (dice_type, count, modifier, label)."""
     dice_type = data.get("dice_type")
     dice_count = int(data.get("dice_count", 1))
     if dice_type not in DICE_SIDES:
-        return jsonify({"success": False, "message": "Unsupported dice type"}), 400
-    if not (1 <= dice_count <= 20):
-        return jsonify({"success": False, "message": "Dice count must be 1-20"}), 400
-    # Generate seeds from Hive blockchain if available
-    block_num = None
-    if blockchain is not None:
+        raise ValueError("Unsupported dice type")
+    if not (1 <= dice_count <= MAX_DICE_COUNT):
+        raise ValueError(f"Dice count must be 1-{MAX_DICE_COUNT}")
+    return dice_type, dice_count, int(data.get("modifier", 0)), data.get("label")
+
+
+def parse_batch_specs(data):
+    """Roll specs from ``{"rolls": [spec, ...]}`` or ``{"roll": spec, "count": N}``.
+
+    Raises ValueError with a message for the client.
+    """
+    raw_specs = data.get("rolls")
+    if raw_specs is None:
+        count = int(data.get("count", 1))
+        raw_specs = [data.get("roll") or {}] if 1 <= count <= MAX_BATCH_ROLLS else []
+        raw_specs *= count
+    if not isinstance(raw_specs, list) or not 1 <= len(raw_specs) <= MAX_BATCH_ROLLS:
+        raise ValueError(f"Batch must contain 1-{MAX_BATCH_ROLLS} rolls")
+    specs = []
+    for i, raw in enumerate(raw_specs):
         try:
-            latest_block = blockchain.get_current_block()
-            block_data = (
-                latest_block.as_json()
-                if hasattr(latest_block, "as_json")
-                else dict(latest_block)
-            )
-            logging.info(f"Fetched latest Hive block object: {latest_block}")
-            logging.info(f"Block data keys: {list(block_data.keys())}")
-            # logging.info(f"Block data: {block_data}")
-            # Common field names – adjust if Nectar differs
-            block_num = (
-                int(block_data.get("id")) if block_data.get("id") is not None else None
-            )
-            server_seed = block_data.get("block_id") or secrets.token_hex(16)
-            client_seed_base = block_data.get(
-                "transaction_merkle_root"
-            ) or secrets.token_hex(8)
-            salt = secrets.token_hex(4)  # 8-hex-char per-request salt
-            client_seed = f"{client_seed_base}{salt}"
-        except Exception as e:
-            print(f"Hive fetch error: {e}")
-            server_seed = secrets.token_hex(16)
-            client_seed = f"{secrets.token_hex(8)}{secrets.token_hex(4)}"
-    else:
-        server_seed = secrets.token_hex(16)
-        client_seed = f"{secrets.token_hex(8)}{secrets.token_hex(4)}"
+            specs.append(parse_roll_spec(raw))
+        except (ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f"Roll {i}: {e}") from e
+    if sum(spec[1] for spec in specs) > MAX_BATCH_DICE:
+        raise ValueError(f"Batch may roll at most {MAX_BATCH_DICE} dice in total")
+    return specs
+
+
+def next_seeds():
+    # Seeds come from the cached Hive head block when available
+    seed_provider = services().seed_provider
+    if seed_provider is not None:
+        return seed_provider.roll_seeds()
+    return random_seeds()
+
+
+def make_roll_doc(
+    dice_type, dice_count, results, proof, server_seed, client_seed, nonce, **extra
+):
+    doc = {
+        "dice_type": f"{dice_count}x{dice_type}",
+        "roll_result": ",".join(map(str, results)),
+        "proof": proof,
+        "server_seed": server_seed,
+        "client_seed": client_seed,
+        "nonce": nonce,
+        "algo": CURRENT_VERSION,
+        "timestamp": datetime.utcnow(),
+    }
+    doc.update(extra)
+    return doc
+
+
+@bp.route("/api/roll", methods=["POST"])
+def api_roll():
+    timer = metrics.timer("api_roll")
+    data = request.json
+    try:
+        dice_type, dice_count, modifier, label = parse_roll_spec(data)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    timer.mark("parse")
+    server_seed, client_seed, block_num = next_seeds()
     nonce = block_num or 0
-    logging.info(
-        f"Using seeds - server: {server_seed}, client: {client_seed}, nonce: {nonce}"
+    logging.debug(
+        "Using seeds - server: %s, client: %s, nonce: %s",
+        server_seed,
+        client_seed,
+        nonce,
     )
+    timer.mark("seed")
     results, proof = provably_fair_roll(
-        dice_type, dice_count, server_seed, client_seed, nonce
+        dice_type, dice_count, server_seed, client_seed, nonce, CURRENT_VERSION
     )
+    timer.mark("hmac")
     # Store in DB
-    modifier = int(data.get("modifier", 0))
-    label = data.get("label", None)
+    roll_doc = make_roll_doc(
+        dice_type,
+        dice_count,
+        results,
+        proof,
+        server_seed,
+        client_seed,
+        nonce,
+        modifier=modifier,
+        block_num=block_num,
+        label=label,
+    )
+    try:
+        store_roll(roll_doc)
+    except queue.Full:
+        return jsonify({"success": False, "message": "Server busy, please retry"}), 503
+    roll_id = str(roll_doc["_id"])
+    timer.mark("store")
+    roll_stats.record(dice_type, results)
+    timer.mark("stats")
+    response = jsonify(
+        {
+            "success": True,
+            "result": results,
+            "proof": proof,
+            "server_seed": server_seed,
+            "client_seed": client_seed,
+            "nonce": nonce,
+            "block_num": block_num,
+            "algo": CURRENT_VERSION,
+            "roll_id": roll_id,
+        }
+    )
+    timer.mark("encode")
+    return response
+
+
+def store_roll(roll_doc):
+    """Persist a new roll (or queue it in write-behind mode); raises queue.Full."""
+    write_behind = services().write_behind
+    if write_behind is not None:
+        write_behind.submit(roll_doc)
+    else:
+        store.insert(roll_doc)
+    recent_cache.add(roll_doc)
+    publish_roll(roll_doc)
+
+
+def expression_dice_type(plan):
+    """The ``dice_type`` stored for an expression roll.
+
+    One plain term of a supported die is stored as ``"3xd6"``, like the
+    rolls of `api_roll`, so history filters and fairness checks find it;
+    anything else keeps the expression.
+    """
+    if len(plan.terms) == 1:
+        term = plan.terms[0]
+        if term.plain and term.sign > 0 and f"d{term.sides}" in DICE_SIDES:
+            return f"{term.count}xd{term.sides}"
+    return str(plan)
+
+
+@bp.route("/api/roll/expr", methods=["POST"])
+def api_roll_expr():
+    # Dice expressions such as 2d6+1d8+3, 4d6kh3, 3d6! or 4d6r1; every die is
+    # drawn from one HMAC stream over the roll's seeds and nonce
+    timer = metrics.timer("api_roll_expr")
+    data = request.json or {}
+    server_seed, client_seed, block_num = next_seeds()
+    nonce = block_num or 0
+    timer.mark("seed")
+    try:
+        plan, total, kept, terms, proof = roll_expression(
+            data.get("expression"), server_seed, client_seed, nonce
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    timer.mark("hmac")
+    expression = str(plan)
     roll_doc = {
-        "dice_type": f"{dice_count}x{dice_type}",
-        "roll_result": ",".join(map(str, results)),
+        "dice_type": expression_dice_type(plan),
+        "expression": expression,
+        "roll_result": ",".join(map(str, kept)),
+        "total": total,
+        "terms": terms,
         "proof": proof,
         "server_seed": server_seed,
         "client_seed": client_seed,
         "nonce": nonce,
-        "modifier": modifier,
+        "algo": CURRENT_VERSION,
+        "modifier": plan.constant,
         "block_num": block_num,
-        "label": label,
+        "label": data.get("label"),
         "timestamp": datetime.utcnow(),
     }
-    inserted = rolls_collection.insert_one(roll_doc)
-    roll_id = str(inserted.inserted_id)
-    return jsonify(
+    try:
+        store_roll(roll_doc)
+    except queue.Full:
+        return jsonify({"success": False, "message": "Server busy, please retry"}), 503
+    timer.mark("store")
+    # Only uniform faces of a supported die belong in the fairness counters
+    for term, breakdown in zip(plan.terms, terms):
+        die = f"d{term.sides}"
+        if term.plain and die in DICE_SIDES:
+            roll_stats.record(die, breakdown["rolls"])
+    timer.mark("stats")
+    response = jsonify(
         {
             "success": True,
-            "result": results,
+            "expression": expression,
+            "total": total,
+            "result": kept,
+            "terms": terms,
+            "modifier": plan.constant,
             "proof": proof,
             "server_seed": server_seed,
             "client_seed": client_seed,
             "nonce": nonce,
             "block_num": block_num,
-            "roll_id": roll_id,
+            "algo": CURRENT_VERSION,
+            "roll_id": str(roll_doc["_id"]),
+        }
+    )
+    timer.mark("encode")
+    return response
+
+
+def batch_commitment(proofs):
+    """SHA-256 over the ordered roll proofs of a batch."""
+    return hashlib.sha256(":".join(proofs).encode()).hexdigest()
+
+
+@bp.route("/api/rolls/batch", methods=["POST"])
+def api_rolls_batch():
+    # Body is either {"rolls": [spec, ...]} or {"roll": spec, "count": N}.
+    # All rolls share one seed pair; roll i uses nonce base_nonce + i, so each
+    # one still verifies on its own through provably_fair_roll.
+    data = request.json or {}
+    try:
+        specs = parse_batch_specs(data)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    server_seed, client_seed, block_num = next_seeds()
+    base_nonce = block_num or 0
+    batch_label = data.get("label")
+    docs, rolls, proofs = [], [], []
+    for i, (dice_type, dice_count, modifier, label) in enumerate(specs):
+        nonce = base_nonce + i
+        results, proof = provably_fair_roll(
+            dice_type, dice_count, server_seed, client_seed, nonce, CURRENT_VERSION
+        )
+        proofs.append(proof)
+        rolls.append({"nonce": nonce, "result": results, "proof": proof})
+        docs.append(
+            make_roll_doc(
+                dice_type,
+                dice_count,
+                results,
+                proof,
+                server_seed,
+                client_seed,
+                nonce,
+                modifier=modifier,
+                block_num=block_num,
+                label=label if label is not None else batch_label,
+            )
+        )
+    commitment = batch_commitment(proofs)
+    for doc in docs:
+        doc["batch"] = commitment
+    roll_ids = store.insert_many(docs)
+    for doc, roll, spec in zip(docs, rolls, specs):
+        recent_cache.add(doc)
+        roll_stats.record(spec[0], roll["result"])
+    # Live clients only show the newest rolls, so a large batch is not
+    # replayed to them in full
+    for doc in docs[-DEFAULT_PAGE_SIZE:]:
+        publish_roll(doc)
+    for roll, roll_id in zip(rolls, roll_ids):
+        roll["roll_id"] = str(roll_id)
+    return jsonify(
+        {
+            "success": True,
+            "server_seed": server_seed,
+            "client_seed": client_seed,
+            "block_num": block_num,
+            "algo": CURRENT_VERSION,
+            "commitment": commitment,
+            "rolls": rolls,
         }
     )
 
 
+def head_block_num():
+    seed_provider = services().seed_provider
+    seed = seed_provider.current() if seed_provider is not None else None
+    return seed.block_num if seed is not None else None
+
+
+def session_not_found():
+    return jsonify({"success": False, "message": "Session not found"}), 404
+
+
+def session_tree(session_id):
+    """``(nonces, levels)`` of a closed session's Merkle tree, cached per app."""
+    return services().session_trees(session_id)
+
+
+@bp.route("/api/sessions", methods=["POST"])
+def api_session_create():
+    # Commit to a secret server seed by its hash; rolls made in the session
+    # use that seed, the session's client seed and nonces 0, 1, 2, ...
+    data = request.get_json(silent=True) or {}
+    session = new_session(
+        client_seed=data.get("client_seed"),
+        label=data.get("label"),
+        block_num=head_block_num(),
+    )
+    store.insert_session(session)
+    return jsonify({"success": True, "session": public_session(session)})
+
+
+@bp.route("/api/sessions/<string:session_id>", methods=["GET"])
+def api_session(session_id):
+    session = store.get_session(session_id)
+    if session is None:
+        return session_not_found()
+    return jsonify({"success": True, "session": public_session(session)})
+
+
+@bp.route("/api/sessions/<string:session_id>/rolls", methods=["POST"])
+def api_session_rolls(session_id):
+    # One roll spec, or a batch body as for /api/rolls/batch
+    data = request.json or {}
+    try:
+        if "rolls" in data or "roll" in data:
+            specs = parse_batch_specs(data)
+        else:
+            specs = [parse_roll_spec(data)]
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    session = store.get_session(session_id)
+    if session is None:
+        return session_not_found()
+    first_nonce = store.reserve_nonces(session_id, len(specs))
+    if first_nonce is None:
+        return jsonify({"success": False, "message": "Session is closed"}), 409
+    docs, rolls = [], []
+    for i, (dice_type, dice_count, modifier, label) in enumerate(specs):
+        nonce = first_nonce + i
+        results, proof = provably_fair_roll(
+            dice_type,
+            dice_count,
+            session["server_seed"],
+            session["client_seed"],
+            nonce,
+            CURRENT_VERSION,
+        )
+        rolls.append({"nonce": nonce, "result": results, "proof": proof})
+        docs.append(
+            make_roll_doc(
+                dice_type,
+                dice_count,
+                results,
+                proof,
+                None,  # revealed when the session is closed
+                session["client_seed"],
+                nonce,
+                modifier=modifier,
+                block_num=session.get("block_num"),
+                label=label if label is not None else session.get("label"),
+                session=str(session["_id"]),
+                server_seed_hash=session["server_seed_hash"],
+            )
+        )
+    roll_ids = store.insert_many(docs)
+    for doc, roll, spec in zip(docs, rolls, specs):
+        recent_cache.add(doc)
+        roll_stats.record(spec[0], roll["result"])
+    for doc in docs[-DEFAULT_PAGE_SIZE:]:
+        publish_roll(doc)
+    for roll, roll_id in zip(rolls, roll_ids):
+        roll["roll_id"] = str(roll_id)
+    return jsonify(
+        {
+            "success": True,
+            "session": str(session["_id"]),
+            "server_seed_hash": session["server_seed_hash"],
+            "client_seed": session["client_seed"],
+            "algo": CURRENT_VERSION,
+            "rolls": rolls,
+        }
+    )
+
+
+@bp.route("/api/sessions/<string:session_id>/close", methods=["POST"])
+def api_session_close(session_id):
+    # Stop new rolls, reveal the server seed on the session's rolls and
+    # publish the Merkle root over them. Safe to repeat or to resume.
+    session = store.get_session(session_id)
+    if session is None:
+        return session_not_found()
+    if session["status"] == "open":
+        store.update_session(session_id, {"status": "closing"}, "open")
+        session = store.get_session(session_id)
+    if session["status"] == "closing":
+        store.reveal_session_rolls(session_id, session["server_seed"])
+        services().session_trees.cache_clear()
+        nonces, levels = session_tree(str(session["_id"]))
+        closed = {
+            "status": "closed",
+            "merkle_root": tree_root(levels),
+            "rolls": len(nonces),
+            "closed": datetime.utcnow(),
+            "closed_block": head_block_num(),
+        }
+        store.update_session(session_id, closed, "closing")
+        session = store.get_session(session_id)
+    return jsonify({"success": True, "session": public_session(session)})
+
+
+@bp.route("/api/sessions/<string:session_id>/proof/<int:nonce>", methods=["GET"])
+def api_session_proof(session_id, nonce):
+    # O(log n) inclusion proof of one roll in a closed session's Merkle root;
+    # check it with sessions.verify_inclusion
+    session = store.get_session(session_id)
+    if session is None:
+        return session_not_found()
+    if session["status"] != "closed":
+        message = "Proofs are available once the session is closed"
+        return jsonify({"success": False, "message": message}), 409
+    nonces, levels = session_tree(str(session["_id"]))
+    index = bisect.bisect_left(nonces, nonce)
+    if index == len(nonces) or nonces[index] != nonce:
+        message = "No roll with that nonce in the session"
+        return jsonify({"success": False, "message": message}), 404
+    leaf = levels[0][index * HASH_SIZE : (index + 1) * HASH_SIZE]
+    response = jsonify(
+        {
+            "success": True,
+            "session": str(session["_id"]),
+            "merkle_root": session["merkle_root"],
+            "nonce": nonce,
+            "index": index,
+            "leaf": leaf.hex(),
+            "proof": inclusion_proof(levels, index),
+        }
+    )
+    response.cache_control.max_age = 3600
+    return response
+
+
+@bp.route("/api/distribution", methods=["GET"])
+def api_distribution():
+    # Exact PMF, mean, variance and percentiles of a dice expression's total,
+    # e.g. /api/distribution?expression=4d6kh3&percentiles=5,50,95
+    from distribution import plan_distribution, summary, support_bound
+
+    try:
+        percentiles = [
+            float(q) for q in request.args.get("percentiles", "").split(",") if q
+        ]
+        if any(not 0 <= q <= 100 for q in percentiles):
+            raise ValueError("Percentiles must be between 0 and 100")
+        plan = compile_expression(request.args.get("expression", ""))
+        if support_bound(plan) > MAX_SERVED_SUPPORT:
+            raise ValueError(
+                f"Distribution would have over {MAX_SERVED_SUPPORT} totals"
+            )
+        dist = plan_distribution(plan)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    stats = summary(dist, percentiles) if percentiles else summary(dist)
+    response = jsonify({"success": True, "expression": str(plan), **stats})
+    response.cache_control.max_age = 3600
+    return response
+
+
+@bp.route("/api/stats", methods=["GET"])
+def api_stats():
+    # Live per-die fairness statistics from the running counters:
+    # ?window=hour|day|all (default: all three) and optional ?die=d6
+    from roll_stats import WINDOWS
+
+    window = request.args.get("window")
+    if window is not None and window not in WINDOWS:
+        message = f"window must be one of {', '.join(WINDOWS)}"
+        return jsonify({"success": False, "message": message}), 400
+    die = request.args.get("die")
+    windows = {}
+    for name in [window] if window else WINDOWS:
+        snapshot = roll_stats.snapshot(name)
+        if die:
+            snapshot = {die: snapshot[die]} if die in snapshot else {}
+        windows[name] = snapshot
+    return jsonify({"success": True, "windows": windows, **roll_stats.stats()})
+
+
+@bp.route("/api/seed/status", methods=["GET"])
+def api_seed_status():
+    # Hit/miss/staleness counters for the head-block seed cache
+    seed_provider = services().seed_provider
+    if seed_provider is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **seed_provider.stats()})
+
+
+@bp.route("/api/write-behind/status", methods=["GET"])
+def api_write_behind_status():
+    # Queue depth, flush latency and spill counters for write-behind mode
+    write_behind = services().write_behind
+    if write_behind is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **write_behind.stats()})
+
+
+@bp.route("/api/cache/status", methods=["GET"])
+def api_cache_status():
+    # Hit rates for the recent-rolls ring, the roll detail LRU and the
+    # compiled dice-expression plans
+    return jsonify({**recent_cache.stats(), **plan_cache_stats()})
+
+
+@bp.route("/metrics", methods=["GET"], endpoint="metrics")
+def metrics_endpoint():
+    # Prometheus text format: request and per-phase latency histograms
+    if not metrics.enabled:
+        return Response("metrics disabled\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 # API endpoint to verify roll
-@app.route("/api/verify", methods=["POST"])
+@bp.route("/api/verify", methods=["POST"])
 def api_verify():
+    # Either dice_type/dice_count or a dice expression from /api/roll/expr.
+    # Without "algo" the roll is verified with the algorithm of the stored
+    # roll "roll_id", or else v1, which every roll used before "algo" existed
+    timer = metrics.timer("api_verify")
     data = request.json
-    dice_type = data.get("dice_type")
-    dice_count = int(data.get("dice_count", 1))
+    try:
+        check_verify_fields(data)
+        dice_count = int(data.get("dice_count", 1))
+        nonce = int(data.get("nonce", 0))
+        check_dice_count(dice_count)
+        roll_id = data.get("roll_id")
+        if roll_id is not None and not isinstance(roll_id, str):
+            raise ValueError("roll_id must be a string")
+    except (ValueError, TypeError) as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    expression = data.get("expression")
+    dice_type = data.get("dice_type") or expression
     server_seed = data.get("server_seed")
     client_seed = data.get("client_seed")
-    nonce = int(data.get("nonce", 0))
+    version = data.get("algo")
+    if not version and roll_id:
+        roll = recent_cache.get(roll_id) or store.get(roll_id)
+        if roll is None:
+            return jsonify({"success": False, "message": "Roll not found"}), 404
+        version = roll.get("algo", ROLL_V1)
+    version = version or ROLL_V1
     expected_result = data.get("result")
     expected_proof = data.get("proof")
     if not all(
@@ -230,16 +823,23 @@ def api_verify():
         ]
     ):
         return jsonify({"success": False, "message": "Missing parameters"}), 400
+    timer.mark("parse")
     try:
-        recomputed_result, recomputed_proof = provably_fair_roll(
-            dice_type, dice_count, server_seed, client_seed, nonce
-        )
+        if expression:
+            _, _, recomputed_result, _, recomputed_proof = roll_expression(
+                expression, server_seed, client_seed, nonce
+            )
+        else:
+            recomputed_result, recomputed_proof = provably_fair_roll(
+                dice_type, dice_count, server_seed, client_seed, nonce, version
+            )
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 400
+    timer.mark("hmac")
     # Compare
     result_match = list(map(str, recomputed_result)) == list(map(str, expected_result))
     proof_match = recomputed_proof == expected_proof
-    return jsonify(
+    response = jsonify(
         {
             "success": result_match and proof_match,
             "result_match": result_match,
@@ -248,9 +848,184 @@ def api_verify():
             "recomputed_proof": recomputed_proof,
         }
     )
+    timer.mark("encode")
+    return response
+
+
+# Fields of a roll submitted for verification that must be strings if given
+VERIFY_STRINGS = ("expression", "dice_type", "server_seed", "client_seed", "proof")
+
+
+def check_verify_fields(data):
+    """Raise ValueError unless the roll's dice, seed and proof fields are strings."""
+    if not isinstance(data, dict):
+        raise ValueError("Each roll must be an object")
+    for name in (*VERIFY_STRINGS, "algo"):
+        value = data.get(name)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{name} must be a string")
+
+
+def check_dice_count(dice_count):
+    if not 1 <= dice_count <= MAX_DICE_COUNT:
+        raise ValueError(f"Dice count must be 1-{MAX_DICE_COUNT}")
+
+
+def row_dice(row):
+    """Number of dice a verification row rolls; raises ValueError."""
+    if row[8]:
+        return compile_expression(row[8]).dice_count
+    return parse_dice_type(row[1])[1]
+
+
+def verify_item_row(item):
+    """Row tuple (see verification.py) for one roll submitted for verification."""
+    check_verify_fields(item)
+    expression = item.get("expression")
+    dice_type = item.get("dice_type")
+    dice_count = int(item.get("dice_count", 1))
+    result = item.get("result")
+    if isinstance(result, list):
+        result = ",".join(map(str, result))
+    required = [
+        expression or dice_type,
+        item.get("server_seed"),
+        item.get("client_seed"),
+        result,
+        item.get("proof"),
+    ]
+    if not all(required):
+        raise ValueError("Missing parameters")
+    if not expression and "x" not in dice_type:
+        dice_type = f"{dice_count}x{dice_type}"
+    row = (
+        item.get("id"),
+        expression or dice_type,
+        result,
+        item["proof"],
+        item["server_seed"],
+        item["client_seed"],
+        int(item.get("nonce", 0)),
+        item.get("algo", ROLL_V1),
+        expression,
+    )
+    if not expression:
+        check_dice_count(row_dice(row))
+    return row
+
+
+def verify_batch_items(entries):
+    """Verify ``(item, row or error)`` entries; yields per-roll result dicts."""
+    from verification import verify_rows
+
+    for start in range(0, len(entries), VERIFY_CHUNK):
+        chunk = entries[start : start + VERIFY_CHUNK]
+        rows = [row for _, row in chunk if isinstance(row, tuple)]
+        outcomes = iter(verify_rows(rows))
+        for item, row in chunk:
+            if not isinstance(row, tuple):
+                yield {**item, "success": False, "error": row}
+                continue
+            outcome = next(outcomes)
+            entry = {
+                **item,
+                "success": outcome.ok,
+                "result_match": outcome.result_ok,
+                "proof_match": outcome.proof_ok,
+            }
+            if outcome.error:
+                entry["error"] = outcome.error
+            yield entry
+
+
+@bp.route("/api/verify/batch", methods=["POST"])
+def api_verify_batch():
+    # {"rolls": [roll, ...]} with /api/verify bodies, and/or {"ids": [...]}
+    # of stored rolls (fetched in one query). Batches above VERIFY_CHUNK
+    # rolls, or any batch with ?stream=1, are verified and streamed out
+    # chunk by chunk.
+    timer = metrics.timer("api_verify_batch")
+    request.max_content_length = MAX_VERIFY_BYTES
+    data = request.get_json(silent=True) or {}
+    rolls, ids = data.get("rolls") or [], data.get("ids") or []
+    if not isinstance(rolls, list) or not isinstance(ids, list):
+        return jsonify(
+            {"success": False, "message": "rolls and ids must be lists"}
+        ), 400
+    if not 1 <= len(rolls) + len(ids) <= MAX_VERIFY_BATCH:
+        message = f"Batch must contain 1-{MAX_VERIFY_BATCH} rolls or ids"
+        return jsonify({"success": False, "message": message}), 400
+    entries = []
+    for i, item in enumerate(rolls):
+        head = {"index": i}
+        if isinstance(item, dict) and item.get("id") is not None:
+            head["id"] = item["id"]
+        try:
+            entries.append((head, verify_item_row(item)))
+        except (ValueError, TypeError) as e:
+            entries.append((head, str(e)))
+    timer.mark("parse")
+    if ids:
+        from verification import FIELDS as VERIFY_FIELDS
+        from verification import doc_row
+
+        docs = store.get_many(ids, fields=VERIFY_FIELDS)
+        for roll_id in ids:
+            doc = docs.get(str(roll_id))
+            if doc is None:
+                entries.append(({"id": roll_id, "found": False}, "Roll not found"))
+            else:
+                entries.append(({"id": roll_id, "found": True}, doc_row(doc)))
+        timer.mark("fetch")
+    dice = 0
+    for _, row in entries:
+        if isinstance(row, tuple):
+            try:
+                dice += row_dice(row)
+            except ValueError:
+                pass  # verify_rows reports the row's own error
+    if dice > MAX_BATCH_DICE:
+        message = f"Batch must contain at most {MAX_BATCH_DICE} dice"
+        return jsonify({"success": False, "message": message}), 400
+
+    counts = {"checked": 0, "verified": 0, "failed": 0, "not_found": 0, "errors": 0}
+
+    def count(entry):
+        counts["checked"] += 1
+        if entry["success"]:
+            counts["verified"] += 1
+        elif entry.get("found") is False:
+            counts["not_found"] += 1
+        elif "result_match" not in entry:
+            counts["errors"] += 1
+        else:
+            counts["failed"] += 1
+        return entry
+
+    stream = request.args.get("stream") == "1" or len(entries) > VERIFY_CHUNK
+    if not stream:
+        results = [count(entry) for entry in verify_batch_items(entries)]
+        timer.mark("hmac")
+        response = jsonify(
+            {
+                "success": counts["verified"] == counts["checked"],
+                "counts": counts,
+                "results": results,
+            }
+        )
+        timer.mark("encode")
+        return response
+
+    def generate():
+        # Same document as above, with the totals after the results
+        yield '{"results": ['
+        for i, entry in enumerate(verify_batch_items(entries)):
+            yield ("," if i else "") + json.dumps(count(entry))
+        success = counts["verified"] == counts["checked"]
+        yield f'], "counts": {json.dumps(counts)}, "success": {json.dumps(success)}}}'
+
+    return Response(generate(), mimetype="application/json")
 
 
 if __name__ == "__main__":
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True)
+    create_app().run(debug=True)
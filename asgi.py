@@ -0,0 +1,242 @@
+"""ASGI entry point for the async roll path.
+
+    uvicorn asgi:app --workers 4
+
+Serves ``POST /api/roll`` (and ``GET /api/seed/status`` for its seed cache)
+on one event loop per process, so thousands of rolls can be in flight
+without a thread each. Every other route stays on the Flask app in
+wsgi.py; send ``/api/roll`` to this server from the reverse proxy. Both
+read the same environment variables (see services.py).
+
+Per roll:
+
+* the head-block seed is requested as soon as the request arrives, so the
+  fetch overlaps with reading the body; rolls share one pending fetch and
+  a fresh cached block needs none (`CoalescedBlockSeeds`);
+* the HMAC runs on the event loop, or in the default executor above
+  `EXECUTOR_DICE` dice so a large roll does not stall other requests;
+* the insert goes through pymongo's `AsyncMongoClient` (or the SQLite and
+  memory stores in the executor), then the roll is published to the live
+  feed when ``ROLL_FEED_BACKEND=mongo``;
+* fairness counters are recorded in memory and flushed by `RollStats`'s
+  own thread, as in the Flask app.
+
+Nothing is opened at import: each worker opens its clients on ASGI
+lifespan startup, or on its first request if the server sends no lifespan
+events.
+"""
+
+import asyncio
+import json
+import logging
+
+from pymongo.errors import PyMongoError
+
+from app import make_roll_doc, parse_roll_spec, roll_json
+from block_seed import CoalescedBlockSeeds, random_seeds
+from provably_fair import CURRENT_VERSION, provably_fair_roll
+from roll_feed import AsyncRelayPublisher
+from roll_stats import RollStats
+from services import NectarBlockchain, check_config, config_from_env, installed
+from storage import RollStore, ThreadedAsyncStore, open_async_store, open_store
+
+log = logging.getLogger(__name__)
+
+EXECUTOR_DICE = 1000  # rolls of more dice are hashed off the event loop
+MAX_BODY = 64 * 1024
+
+JSON_HEADERS = [(b"content-type", b"application/json")]
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, limit=MAX_BODY):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if len(body) > limit:
+            raise BodyTooLarge
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send(
+        {"type": "http.response.start", "status": status, "headers": JSON_HEADERS}
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def error(status, message):
+    return status, {"success": False, "message": message}
+
+
+class RollService:
+    """The stores, seed cache and counters behind the async roll path."""
+
+    def __init__(self, config, async_store=None):
+        check_config(config)
+        self.config = config
+        self.async_store = async_store
+        self.store = None
+        self.seeds = None
+        self.stats = None
+        self.relay = None
+
+    def start(self):
+        """Open this process's clients; later calls do nothing."""
+        if self.stats is not None:
+            return
+        config = self.config
+        url = config["ROLL_STORE"]
+        # The synchronous store creates indexes and takes RollStats flushes
+        schema = config["ROLL_SCHEMA"]
+        if isinstance(url, RollStore):
+            self.store = url
+        else:
+            self.store = open_store(url, schema=schema)
+        if self.async_store is None:
+            if isinstance(url, str):
+                self.async_store = open_async_store(url, self.store, schema=schema)
+            else:
+                self.async_store = ThreadedAsyncStore(self.store)
+        if installed("nectar"):
+            self.seeds = CoalescedBlockSeeds(
+                NectarBlockchain(), max_age=config["BLOCK_SEED_MAX_AGE"]
+            )
+        if config["ROLL_FEED_BACKEND"] == "mongo":
+            self.relay = AsyncRelayPublisher(self.async_store.db)
+        self.stats = RollStats(
+            self.store, flush_interval=config["ROLL_STATS_FLUSH_INTERVAL"]
+        )
+
+    async def startup(self):
+        self.start()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.store.ensure_indexes)
+        except Exception as e:
+            log.warning("Could not ensure roll indexes: %s", e)
+
+    async def shutdown(self):
+        if self.stats is None:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.stats.flush)
+        await self.async_store.close()
+
+    async def next_seeds(self):
+        if self.seeds is not None:
+            return await self.seeds.roll_seeds()
+        return random_seeds()
+
+    async def api_roll(self, receive):
+        """``(status, payload)`` for one ``POST /api/roll``."""
+        seeds = asyncio.ensure_future(self.next_seeds())
+        try:
+            data = json.loads(await read_body(receive))
+            dice_type, dice_count, modifier, label = parse_roll_spec(data)
+        except BodyTooLarge:
+            seeds.cancel()
+            return error(413, "Request body too large")
+        except (ValueError, TypeError, AttributeError) as e:
+            seeds.cancel()
+            return error(400, str(e))
+        server_seed, client_seed, block_num = await seeds
+        nonce = block_num or 0
+        args = (dice_type, dice_count, server_seed, client_seed, nonce, CURRENT_VERSION)
+        if dice_count > EXECUTOR_DICE:
+            loop = asyncio.get_running_loop()
+            results, proof = await loop.run_in_executor(None, provably_fair_roll, *args)
+        else:
+            results, proof = provably_fair_roll(*args)
+        roll_doc = make_roll_doc(
+            dice_type,
+            dice_count,
+            results,
+            proof,
+            server_seed,
+            client_seed,
+            nonce,
+            modifier=modifier,
+            block_num=block_num,
+            label=label,
+        )
+        await self.async_store.insert(roll_doc)
+        if self.relay is not None:
+            try:
+                await self.relay.publish(roll_json(roll_doc))
+            except PyMongoError as e:
+                log.warning("Could not publish roll to the live feed: %s", e)
+        self.stats.record(dice_type, results)
+        return 200, {
+            "success": True,
+            "result": results,
+            "proof": proof,
+            "server_seed": server_seed,
+            "client_seed": client_seed,
+            "nonce": nonce,
+            "block_num": block_num,
+            "algo": CURRENT_VERSION,
+            "roll_id": str(roll_doc["_id"]),
+        }
+
+    def seed_status(self):
+        if self.seeds is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.seeds.stats()}
+
+
+class AsyncRollApp:
+    """The ASGI application: routes requests to a `RollService`."""
+
+    def __init__(self, service):
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        self.service.start()
+        path, method = scope["path"], scope["method"]
+        try:
+            if path == "/api/roll":
+                if method != "POST":
+                    status, payload = error(405, "Method not allowed")
+                else:
+                    status, payload = await self.service.api_roll(receive)
+            elif path == "/api/seed/status" and method == "GET":
+                status, payload = 200, self.service.seed_status()
+            else:
+                status, payload = error(404, "Not found")
+        except Exception:
+            log.exception("Error handling %s %s", method, path)
+            status, payload = error(500, "Internal server error")
+        await send_json(send, status, payload)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.service.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.service.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_asgi_app(config=None, async_store=None):
+    """Build the async roll app from the environment plus `config` overrides."""
+    settings = config_from_env()
+    settings.update(config or {})
+    return AsyncRollApp(RollService(settings, async_store=async_store))
+
+
+app = create_asgi_app()
@@ -0,0 +1,275 @@
+"""Background Hive head-block seed cache.
+
+`api_roll` used to call `Blockchain.get_current_block()` for every request,
+which put a network round-trip on the hot path of each roll. The
+`BlockSeedProvider` below polls the head block from a daemon thread once per
+Hive block interval and serves the latest block from memory. When the cached
+block is older than `max_age` the caller gets random `secrets` seeds instead,
+so a slow or unreachable node never blocks a roll.
+
+`CoalescedBlockSeeds` is the asyncio counterpart used by asgi.py. There
+is no thread: a request that finds the cached block too old awaits a fetch,
+but all requests in flight share one pending fetch, and the block is
+refreshed in the background once it is older than one block interval, so in
+steady state nobody waits.
+
+Both only need an object with a `get_current_block()` method, so a small
+local stand-in can replace the Nectar `Blockchain` in tests and benchmarks.
+"""
+
+import asyncio
+import logging
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+
+BLOCK_INTERVAL = 3.0  # seconds between Hive blocks
+DEFAULT_MAX_AGE = 3 * BLOCK_INTERVAL
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BlockSeed:
+    """The fields of a Hive block used to seed rolls."""
+
+    block_num: int | None
+    block_id: str
+    merkle_root: str
+    fetched_at: float
+
+
+def random_seeds():
+    """Return `(server_seed, client_seed, block_num)` from `secrets` only."""
+    return secrets.token_hex(16), f"{secrets.token_hex(8)}{secrets.token_hex(4)}", None
+
+
+def seeds_from(seed):
+    """Return `(server_seed, client_seed, block_num)` for one roll on `seed`.
+
+    The client seed is the block's merkle root plus an 8-hex random salt,
+    so simultaneous rolls against the same block stay unique.
+    """
+    return (
+        seed.block_id,
+        f"{seed.merkle_root}{secrets.token_hex(4)}",
+        seed.block_num,
+    )
+
+
+def block_seed_from(block, fetched_at):
+    """Extract the seed fields from a Nectar block object or plain dict."""
+    block_data = block.as_json() if hasattr(block, "as_json") else dict(block)
+    block_num = block_data.get("id")
+    return BlockSeed(
+        block_num=int(block_num) if block_num is not None else None,
+        block_id=block_data.get("block_id") or secrets.token_hex(16),
+        merkle_root=block_data.get("transaction_merkle_root") or secrets.token_hex(8),
+        fetched_at=fetched_at,
+    )
+
+
+class BlockSeedProvider:
+    """Keep the latest Hive head block cached and hand out roll seeds.
+
+    The refresher thread is started lazily on first use and restarted after a
+    fork, so the provider can be created at import time under gunicorn.
+    """
+
+    def __init__(
+        self,
+        blockchain,
+        interval=BLOCK_INTERVAL,
+        max_age=DEFAULT_MAX_AGE,
+        clock=time.monotonic,
+    ):
+        self.blockchain = blockchain
+        self.interval = interval
+        self.max_age = max_age
+        self.clock = clock
+        self._seed = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.refreshes = 0
+        self.fetch_errors = 0
+
+    # ------------------------------------------------------------------ thread
+
+    def start(self):
+        """Start the refresher thread for this process if it is not running."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="block-seed-refresher", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self):
+        """Fetch the head block once and update the cache."""
+        try:
+            block = self.blockchain.get_current_block()
+            seed = block_seed_from(block, self.clock())
+        except Exception as e:
+            with self._lock:
+                self.fetch_errors += 1
+            log.warning("Hive fetch error: %s", e)
+            return None
+        with self._lock:
+            self._seed = seed
+            self.refreshes += 1
+        return seed
+
+    # ------------------------------------------------------------------ reads
+
+    def current(self):
+        """Return the cached head block, or None if missing or stale."""
+        if self._pid != os.getpid():
+            self.start()
+        # Request threads share the counters, so count under the lock
+        with self._lock:
+            seed = self._seed
+            if seed is None:
+                self.misses += 1
+                return None
+            if self.clock() - seed.fetched_at > self.max_age:
+                self.stale += 1
+                self._wake.set()  # nudge the refresher instead of blocking
+                return None
+            self.hits += 1
+            return seed
+
+    def roll_seeds(self):
+        """Return `(server_seed, client_seed, block_num)` for one roll."""
+        seed = self.current()
+        if seed is None:
+            return random_seeds()
+        return seeds_from(seed)
+
+    def stats(self):
+        with self._lock:
+            seed = self._seed
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "refreshes": self.refreshes,
+                "fetch_errors": self.fetch_errors,
+                "block_num": seed.block_num if seed else None,
+                "age": round(self.clock() - seed.fetched_at, 3) if seed else None,
+                "max_age": self.max_age,
+            }
+
+
+class CoalescedBlockSeeds:
+    """Head-block seeds for asyncio code, with one shared fetch at a time.
+
+    Nectar has no asyncio client, so `get_current_block` runs in the
+    default executor. A caller waits at most `timeout` seconds for a block
+    and then gets random `secrets` seeds, as with `BlockSeedProvider`.
+    """
+
+    def __init__(
+        self,
+        blockchain,
+        interval=BLOCK_INTERVAL,
+        max_age=DEFAULT_MAX_AGE,
+        timeout=BLOCK_INTERVAL,
+        clock=time.monotonic,
+    ):
+        self.blockchain = blockchain
+        self.interval = interval
+        self.max_age = max_age
+        self.timeout = timeout
+        self.clock = clock
+        self._seed = None
+        self._pending = None
+        self.hits = 0
+        self.waits = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.refreshes = 0
+        self.fetch_errors = 0
+
+    def _fetch(self):
+        # Start a fetch unless one is already in flight; callers share it
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._refresh())
+        else:
+            self.coalesced += 1
+        return self._pending
+
+    async def _refresh(self):
+        loop = asyncio.get_running_loop()
+        try:
+            block = await loop.run_in_executor(None, self.blockchain.get_current_block)
+            seed = block_seed_from(block, self.clock())
+        except Exception as e:
+            self.fetch_errors += 1
+            log.warning("Hive fetch error: %s", e)
+            return None
+        finally:
+            self._pending = None
+        self._seed = seed
+        self.refreshes += 1
+        return seed
+
+    async def current(self):
+        """Return a fresh head block, waiting for a fetch only if needed."""
+        seed = self._seed
+        if seed is not None:
+            age = self.clock() - seed.fetched_at
+            if age <= self.max_age:
+                self.hits += 1
+                if age > self.interval:
+                    self._fetch()  # refresh in the background
+                return seed
+        self.waits += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._fetch()), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+
+    async def roll_seeds(self):
+        """Return `(server_seed, client_seed, block_num)` for one roll."""
+        seed = await self.current()
+        if seed is None:
+            return random_seeds()
+        return seeds_from(seed)
+
+    def stats(self):
+        seed = self._seed
+        return {
+            "hits": self.hits,
+            "waits": self.waits,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "refreshes": self.refreshes,
+            "fetch_errors": self.fetch_errors,
+            "block_num": seed.block_num if seed else None,
+            "age": round(self.clock() - seed.fetched_at, 3) if seed else None,
+            "max_age": self.max_age,
+        }
@@ -0,0 +1,233 @@
+"""Dice expression compiler and evaluator.
+
+An expression such as ``2d6+1d8+3`` or ``4d6kh3`` is parsed once into a
+`DicePlan` and kept in an LRU cache, so repeat expressions skip parsing.
+The grammar (case-insensitive, spaces ignored) is::
+
+    expr := ["+" | "-"] term (("+" | "-") term)*
+    term := INT | [INT] "d" (INT | "%") modifier*
+    modifier := ("kh" | "kl" | "dh" | "dl" | "k") INT   keep / drop highest or lowest
+              | "!" [">" INT]                          explode on the max face or >= INT
+              | "r" ["o"] ["<"] INT                    reroll faces == INT (or <= INT);
+                                                       "ro" rerolls only once
+
+Rerolls are applied first, then explosions, then keep/drop. Every die in an
+expression is drawn in order from one `DigestStream` over
+``(server_seed, client_seed, nonce)``, so an expression roll is verified by
+evaluating the same expression against the same seeds.
+"""
+
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+from provably_fair import DigestStream, roll_proof
+
+MAX_EXPRESSION_LENGTH = 200
+MAX_TERMS = 20
+MAX_DICE = 1000
+MAX_SIDES = 1_000_000
+MAX_REROLLS = 100  # per die, for repeating rerolls
+MAX_EXPLOSIONS = 100  # per die
+PLAN_CACHE_SIZE = 1024
+
+_TOKEN = re.compile(r"([+-])?(?:(\d*)d(\d+|%)((?:kh|kl|dh|dl|k|!|r)[^+-]*)?|(\d+))")
+_MODIFIER = re.compile(r"(kh|kl|dh|dl|k)(\d+)|!(?:>(\d+))?|r(o)?(<)?(\d+)")
+
+
+@dataclass(frozen=True)
+class DiceTerm:
+    """``count`` dice with ``sides`` faces and their modifiers."""
+
+    sign: int
+    count: int
+    sides: int
+    keep: tuple[str, int] | None = None  # ("kh" | "kl" | "dh" | "dl", n)
+    explode_at: int | None = None  # faces >= this explode
+    reroll_at: int | None = None  # faces <= this (or == with reroll_exact)
+    reroll_exact: bool = False
+    reroll_once: bool = False
+
+    def __str__(self):
+        text = f"{self.count}d{self.sides}"
+        if self.reroll_at is not None:
+            once = "o" if self.reroll_once else ""
+            lt = "" if self.reroll_exact else "<"
+            text += f"r{once}{lt}{self.reroll_at}"
+        if self.explode_at is not None:
+            text += "!" if self.explode_at == self.sides else f"!>{self.explode_at}"
+        if self.keep is not None:
+            text += f"{self.keep[0]}{self.keep[1]}"
+        return text
+
+    @property
+    def plain(self):
+        """True without rerolls, explosions or keep/drop: uniform faces."""
+        return self.keep is None and self.explode_at is None and self.reroll_at is None
+
+    def _rerolls(self, face):
+        if self.reroll_at is None:
+            return False
+        return face == self.reroll_at if self.reroll_exact else face <= self.reroll_at
+
+    def roll(self, stream):
+        """Draw this term's dice from `stream`; returns its breakdown dict."""
+        faces = stream.dice(self.sides, self.count)
+        rerolled = []
+        limit = 1 if self.reroll_once else MAX_REROLLS
+        for i, face in enumerate(faces):
+            tries = 0
+            while self._rerolls(face) and tries < limit:
+                rerolled.append(face)
+                face = stream.dice(self.sides, 1)[0]
+                tries += 1
+            faces[i] = face
+        if self.explode_at is not None:
+            pool = []
+            for face in faces:
+                pool.append(face)
+                for _ in range(MAX_EXPLOSIONS):
+                    if face < self.explode_at:
+                        break
+                    face = stream.dice(self.sides, 1)[0]
+                    pool.append(face)
+            faces = pool
+        kept = faces
+        if self.keep is not None:
+            op, n = self.keep
+            if op in ("dh", "dl"):
+                op, n = ("kl" if op == "dh" else "kh"), max(len(faces) - n, 0)
+            ranked = sorted(range(len(faces)), key=faces.__getitem__)
+            chosen = ranked[len(faces) - n :] if op == "kh" else ranked[:n]
+            kept = [faces[i] for i in sorted(chosen)]
+        return {
+            "term": ("-" if self.sign < 0 else "+") + str(self),
+            "rolls": faces,
+            "rerolled": rerolled,
+            "kept": kept,
+            "subtotal": self.sign * sum(kept),
+        }
+
+
+@dataclass(frozen=True)
+class DicePlan:
+    """A compiled expression: dice terms plus a constant."""
+
+    terms: tuple[DiceTerm, ...]
+    constant: int
+
+    def __str__(self):
+        parts = []
+        for term in self.terms:
+            parts.append(("-" if term.sign < 0 else "+") + str(term))
+        if self.constant or not parts:
+            parts.append(f"{self.constant:+d}")
+        return "".join(parts).lstrip("+")
+
+    @property
+    def dice_count(self):
+        return sum(term.count for term in self.terms)
+
+    def roll(self, server_seed, client_seed, nonce):
+        """Evaluate the plan against one roll's entropy stream.
+
+        Returns ``(total, kept_faces, breakdown, proof)``.
+        """
+        stream = DigestStream(server_seed, client_seed, nonce)
+        breakdown = [term.roll(stream) for term in self.terms]
+        kept = [face for term in breakdown for face in term["kept"]]
+        total = sum(term["subtotal"] for term in breakdown) + self.constant
+        return total, kept, breakdown, roll_proof(server_seed, client_seed, nonce)
+
+
+def _modifiers(text, count, sides):
+    """Parse the modifier suffix of one dice term into DiceTerm keywords."""
+    options = {}
+    pos = 0
+    while pos < len(text):
+        match = _MODIFIER.match(text, pos)
+        if match is None:
+            raise ValueError(f"Invalid dice modifier: {text[pos:]}")
+        keep_op, keep_n, explode_at, once, lt, reroll_at = match.groups()
+        if keep_op:
+            kind = "keep"
+            n = int(keep_n)
+            if n > count:
+                raise ValueError(f"Cannot keep or drop {n} of {count} dice")
+            value = ("kh" if keep_op == "k" else keep_op, n)
+        elif match.group(0).startswith("!"):
+            kind = "explode_at"
+            value = int(explode_at) if explode_at else sides
+            if not 1 < value <= sides:
+                raise ValueError(f"Explode threshold must be 2-{sides}")
+        else:
+            kind = "reroll_at"
+            value = int(reroll_at)
+            options["reroll_once"] = bool(once)
+            options["reroll_exact"] = not lt
+            covers_all = value >= sides if lt else sides == 1
+            if not 1 <= value <= sides or covers_all:
+                raise ValueError("Reroll must leave at least one face")
+        if kind in options:
+            raise ValueError(f"Repeated dice modifier: {match.group(0)}")
+        options[kind] = value
+        pos = match.end()
+    return options
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compile(text):
+    terms, constant = [], 0
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or (pos and not match.group(1)):
+            raise ValueError(f"Invalid dice expression near: {text[pos:]}")
+        sign_text, count, sides, modifiers, number = match.groups()
+        sign = -1 if sign_text == "-" else 1
+        if number is not None:
+            constant += sign * int(number)
+        else:
+            count = int(count) if count else 1
+            sides = 100 if sides == "%" else int(sides)
+            if not 1 <= count <= MAX_DICE:
+                raise ValueError(f"Dice count must be 1-{MAX_DICE}")
+            if not 1 <= sides <= MAX_SIDES:
+                raise ValueError(f"Dice sides must be 1-{MAX_SIDES}")
+            options = _modifiers(modifiers or "", count, sides)
+            terms.append(DiceTerm(sign, count, sides, **options))
+        pos = match.end()
+    if not terms:
+        raise ValueError("Dice expression needs at least one dice term")
+    if len(terms) > MAX_TERMS:
+        raise ValueError(f"At most {MAX_TERMS} dice terms")
+    plan = DicePlan(tuple(terms), constant)
+    if plan.dice_count > MAX_DICE:
+        raise ValueError(f"At most {MAX_DICE} dice per expression")
+    return plan
+
+
+def compile_expression(expression):
+    """Return the cached `DicePlan` for an expression; raises ValueError."""
+    if not isinstance(expression, str) or len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError("Invalid dice expression")
+    return _compile("".join(expression.split()).lower())
+
+
+def plan_cache_stats():
+    info = _compile.cache_info()
+    return {
+        "plan_hits": info.hits,
+        "plan_misses": info.misses,
+        "plan_size": info.currsize,
+        "plan_capacity": info.maxsize,
+    }
+
+
+def roll_expression(expression, server_seed, client_seed, nonce):
+    """Compile (or fetch) and evaluate an expression.
+
+    Returns ``(plan, total, kept_faces, breakdown, proof)``.
+    """
+    plan = compile_expression(expression)
+    return (plan, *plan.roll(server_seed, client_seed, nonce))
@@ -0,0 +1,338 @@
+"""Exact probability distributions for dice sums and dice expressions.
+
+A `Distribution` is a probability mass function over a contiguous range of
+integer totals: a float64 array of probabilities plus the smallest total.
+Sums of independent dice are built by convolution (direct for small
+supports, FFT once the arrays get long), and ``NdX`` is composed by
+splitting N in half, so ``100d6`` costs a handful of convolutions. Results
+are memoized per ``(count, sides)``, per dice term and per expression, in
+caches bounded by the total number of probabilities they hold, and a whole
+expression is the sum of its terms plus its constant. `support_bound`
+sizes an expression's PMF before anything is computed.
+
+Terms follow the same rules as `dice_expr`: rerolls are exact (including the
+reroll cap), keep/drop is computed by a dynamic program over face values,
+and exploding dice are expanded until the remaining probability mass is
+below float precision.
+"""
+
+import functools
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+
+import numpy as np
+
+from dice_expr import MAX_EXPLOSIONS, MAX_REROLLS, compile_expression
+
+FFT_THRESHOLD = 500  # convolve with FFT once both inputs are this long
+EXPLODE_EPSILON = 1e-15  # stop expanding explosions below this probability
+MAX_SUPPORT = 2_000_000  # largest PMF (number of totals) computed
+MAX_KEEP_WORK = 20_000_000  # rough operation budget for keep/drop terms
+CACHE_SUPPORT = 2_000_000  # probabilities held by each memo cache
+
+
+class Distribution:
+    """PMF over the totals ``offset .. offset + len(probs) - 1``."""
+
+    __slots__ = ("offset", "probs")
+
+    def __init__(self, offset, probs):
+        self.offset = int(offset)
+        self.probs = np.asarray(probs, dtype=np.float64)
+
+    @classmethod
+    def constant(cls, value):
+        return cls(value, [1.0])
+
+    @classmethod
+    def uniform(cls, sides):
+        return cls(1, np.full(sides, 1.0 / sides))
+
+    @property
+    def min(self):
+        return self.offset
+
+    @property
+    def max(self):
+        return self.offset + len(self.probs) - 1
+
+    @property
+    def values(self):
+        return np.arange(self.min, self.max + 1)
+
+    def __add__(self, other):
+        if isinstance(other, int):
+            return Distribution(self.offset + other, self.probs)
+        if len(self.probs) + len(other.probs) - 1 > MAX_SUPPORT:
+            raise ValueError("Distribution too large to compute")
+        return Distribution(
+            self.offset + other.offset, convolve(self.probs, other.probs)
+        )
+
+    def __neg__(self):
+        return Distribution(-self.max, self.probs[::-1])
+
+    def mean(self):
+        return float(self.values @ self.probs)
+
+    def variance(self):
+        centered = self.values - self.mean()
+        return float((centered * centered) @ self.probs)
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def entropy(self):
+        """Shannon entropy in bits."""
+        p = self.probs[self.probs > 0]
+        return float(-(p * np.log2(p)).sum())
+
+    def cdf(self):
+        return np.cumsum(self.probs)
+
+    def percentile(self, q):
+        """Smallest total whose cumulative probability is at least ``q`` percent."""
+        cdf = self.cdf()
+        index = np.searchsorted(cdf, min(q / 100, cdf[-1]) - 1e-12)
+        return self.offset + int(index)
+
+    def pmf(self):
+        """Return ``{total: probability}`` for totals with non-zero probability."""
+        return {int(v): float(p) for v, p in zip(self.values, self.probs) if p > 0}
+
+    def expected_counts(self, n):
+        """Expected number of each total in ``n`` samples, aligned with `values`."""
+        return self.probs * n
+
+
+def convolve(a, b):
+    """PMF of the sum of two independent variables."""
+    if min(len(a), len(b)) < FFT_THRESHOLD:
+        return np.convolve(a, b)
+    size = len(a) + len(b) - 1
+    out = np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)
+    # FFT round-off can leave tiny negatives where the probability is zero
+    np.clip(out, 0.0, None, out=out)
+    return out / out.sum()
+
+
+def _support_cache(fn):
+    """Memoize `fn` LRU-first, holding at most CACHE_SUPPORT probabilities.
+
+    Distributions larger than the whole budget are returned but not kept.
+    """
+    cache = OrderedDict()
+    lock = threading.Lock()
+    held = 0
+
+    @functools.wraps(fn)
+    def cached(*args):
+        nonlocal held
+        with lock:
+            if args in cache:
+                cache.move_to_end(args)
+                return cache[args]
+        dist = fn(*args)
+        with lock:
+            if args not in cache and len(dist.probs) <= CACHE_SUPPORT:
+                cache[args] = dist
+                held += len(dist.probs)
+                while held > CACHE_SUPPORT:
+                    held -= len(cache.popitem(last=False)[1].probs)
+        return dist
+
+    def cache_clear():
+        nonlocal held
+        with lock:
+            cache.clear()
+            held = 0
+
+    cached.cache_clear = cache_clear
+    return cached
+
+
+# ----------------------------------------------------------------- one die
+
+
+def _explode(first, chain, explode_at):
+    """PMF of a die with face PMF `first` whose faces >= `explode_at` add `chain`."""
+    sides = len(first)
+    out = np.zeros(len(chain.probs) + chain.offset + sides - 1)
+    out[: explode_at - 1] = first[: explode_at - 1]
+    for face in range(explode_at, sides + 1):
+        start = face + chain.offset - 1
+        out[start : start + len(chain.probs)] += first[face - 1] * chain.probs
+    return Distribution(1, np.trim_zeros(out, "b"))
+
+
+def _explode_depth(term):
+    """Explosions expanded per die: until the chain's mass is below epsilon."""
+    exploding = (term.sides - term.explode_at + 1) / term.sides
+    if exploding >= 1 - EXPLODE_EPSILON:
+        return MAX_EXPLOSIONS
+    depth = int(math.log(EXPLODE_EPSILON) / math.log(exploding)) + 1
+    return min(MAX_EXPLOSIONS, depth)
+
+
+def _die(term):
+    """PMF of a single die of `term` after rerolls and explosions.
+
+    As in `dice_expr.DiceTerm.roll`, only the die's first face is rerolled;
+    the dice added by explosions are plain draws.
+    """
+    sides = term.sides
+    uniform = np.full(sides, 1.0 / sides)
+    probs = uniform
+    if term.reroll_at is not None:
+        if term.reroll_exact:
+            rerolled = np.arange(1, sides + 1) == term.reroll_at
+        else:
+            rerolled = np.arange(1, sides + 1) <= term.reroll_at
+        r = rerolled.sum() / sides
+        limit = 1 if term.reroll_once else MAX_REROLLS
+        # A face survives on any of the first `limit` + 1 draws; a rerolled
+        # face is only kept when every reroll was used up
+        probs = np.where(
+            rerolled,
+            r**limit / sides,
+            (1 - r ** (limit + 1)) / (1 - r) / sides,
+        )
+    if term.explode_at is None:
+        return Distribution(1, probs)
+    depth = _explode_depth(term)
+    if depth * sides > MAX_SUPPORT:
+        raise ValueError("Exploding dice distribution too large to compute")
+    # Expand from the innermost allowed explosion outwards: a face below the
+    # threshold ends the chain, a face at or above it adds another draw
+    chain = Distribution(1, uniform)
+    for _ in range(depth - 1):
+        chain = _explode(uniform, chain, term.explode_at)
+    return _explode(probs, chain, term.explode_at)
+
+
+# ---------------------------------------------------------------- dice sums
+
+
+@_support_cache
+def dice_sum(count, sides):
+    """Exact PMF of the sum of ``count`` fair dice with ``sides`` faces."""
+    if count == 1:
+        return Distribution.uniform(sides)
+    half = count // 2
+    return dice_sum(half, sides) + dice_sum(count - half, sides)
+
+
+@_support_cache
+def _repeat(term, count):
+    """Sum of ``count`` dice of `term` (sign and count fields ignored)."""
+    if count == 1:
+        return _die(term)
+    half = count // 2
+    return _repeat(term, half) + _repeat(term, count - half)
+
+
+def _keep(term, faces):
+    """PMF of the kept dice total for a keep/drop term.
+
+    Walks face values from highest to lowest, tracking how many dice have
+    been placed and the kept total; with ``m`` dice placed, the ``min(m, k)``
+    highest are kept. Keep-lowest is keep-highest on mirrored faces.
+    """
+    n, sides = term.count, term.sides
+    op, k = term.keep
+    if op in ("dh", "dl"):
+        op, k = ("kl" if op == "dh" else "kh"), n - k
+    if k == 0:
+        return Distribution.constant(0)
+    if sides * n * n * k * sides > MAX_KEEP_WORK:
+        raise ValueError("Keep/drop distribution too large to compute")
+    probs = faces.probs if op == "kh" else faces.probs[::-1]
+    comb = [[math.comb(a, b) for b in range(n + 1)] for a in range(n + 1)]
+    # states[m][total] = probability that m dice show the faces seen so far
+    states = np.zeros((n + 1, k * sides + 1))
+    states[0, 0] = 1.0
+    for face in range(sides, 0, -1):
+        p = probs[face - 1]
+        powers = [p**c for c in range(n + 1)]
+        nxt = np.zeros_like(states)
+        for m in range(n + 1):
+            row = states[m]
+            if not row.any():
+                continue
+            for c in range(n - m + 1):
+                weight = comb[n - m][c] * powers[c]
+                if weight == 0:
+                    continue
+                shift = (min(m + c, k) - min(m, k)) * face
+                nxt[m + c, shift:] += weight * row[: len(row) - shift]
+        states = nxt
+    totals = states[n]
+    dist = Distribution(0, totals)
+    if op == "kl":
+        # Mirrored face v is really sides + 1 - v
+        dist = -dist + k * (sides + 1)
+    nonzero = np.nonzero(dist.probs)[0]
+    return Distribution(
+        dist.offset + nonzero[0], dist.probs[nonzero[0] : nonzero[-1] + 1]
+    )
+
+
+@_support_cache
+def term_distribution(term):
+    """Exact PMF of one `dice_expr.DiceTerm`, including its sign."""
+    unsigned = replace(term, sign=1)
+    if term.plain:
+        dist = dice_sum(term.count, term.sides)
+    elif term.keep is None:
+        dist = _repeat(replace(unsigned, count=1), term.count)
+    elif term.explode_at is not None:
+        raise ValueError("Keep/drop with exploding dice is not supported")
+    else:
+        dist = _keep(unsigned, _die(replace(unsigned, count=1, keep=None)))
+    return -dist if term.sign < 0 else dist
+
+
+def expression_distribution(expression):
+    """Exact PMF of a dice expression's total; raises ValueError."""
+    return plan_distribution(compile_expression(expression))
+
+
+@_support_cache
+def plan_distribution(plan):
+    """Exact PMF of a compiled `dice_expr.DicePlan`."""
+    dist = Distribution.constant(plan.constant)
+    for term in plan.terms:
+        dist = dist + term_distribution(term)
+    return dist
+
+
+def term_support(term):
+    """Upper bound on the number of totals of one dice term, computed cheaply."""
+    dice = term.count
+    if term.keep is not None:
+        op, n = term.keep
+        dice = n if op in ("kh", "kl") else term.count - n
+    largest = term.sides
+    if term.explode_at is not None:
+        largest *= _explode_depth(term) + 1
+    return dice * (largest - 1) + 1
+
+
+def support_bound(plan):
+    """Upper bound on the length of a `dice_expr.DicePlan`'s PMF."""
+    return sum(term_support(term) - 1 for term in plan.terms) + 1
+
+
+def summary(dist, percentiles=(1, 5, 25, 50, 75, 95, 99)):
+    """JSON-friendly description of a distribution."""
+    return {
+        "min": dist.min,
+        "max": dist.max,
+        "mean": dist.mean(),
+        "variance": dist.variance(),
+        "std": dist.std(),
+        "percentiles": {f"{q:g}": dist.percentile(q) for q in percentiles},
+        "pmf": dist.probs.tolist(),
+    }
@@ -0,0 +1,359 @@
+"""Statistical fairness tests over streams of stored rolls.
+
+`FairnessAccumulator` takes rolls in chunks, in storage order, and keeps
+only running totals per die type (e.g. ``"d6"``):
+
+* face counts, for a chi-square goodness-of-fit and a Kolmogorov-Smirnov
+  test against the uniform distribution;
+* lagged cross products of consecutive faces, for serial correlation;
+* runs above/below the middle face, for a Wald-Wolfowitz runs test;
+* face counts per position within multi-die rolls, for per-position bias;
+* roll count and face total per ``block_num``, for a dispersion test of
+  whether some blocks produce systematically high or low rolls.
+
+Each chunk is parsed and tallied with NumPy, so a whole table or collection
+is tested in one pass with memory bounded by the number of distinct blocks.
+`report` turns the totals into a JSON-friendly dict of statistics and
+p-values.
+"""
+
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from provably_fair import DICE_SIDES
+
+MAX_LAG = 3
+MAX_POSITIONS = 16  # per-position bias is tracked for the first N dice
+DEFAULT_ALPHA = 0.01
+
+
+# ------------------------------------------------------------- p-values
+
+
+def _upper_gamma_q(a, x):
+    """Regularized upper incomplete gamma function Q(a, x)."""
+    if x <= 0:
+        return 1.0
+    log_prefix = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        # Series for P(a, x)
+        term = total = 1.0 / a
+        n = a
+        for _ in range(10_000):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    # Continued fraction for Q(a, x) (modified Lentz)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 10_000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return math.exp(log_prefix) * h
+
+
+def chi2_sf(statistic, df):
+    """P(X >= statistic) for a chi-square distribution with `df` degrees."""
+    return _upper_gamma_q(df / 2, statistic / 2)
+
+
+def normal_two_sided(z):
+    """Two-sided p-value of a standard normal z score."""
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def kolmogorov_sf(d, n):
+    """Asymptotic P(D_n >= d) for the one-sample Kolmogorov-Smirnov statistic.
+
+    Conservative for discrete distributions such as dice faces.
+    """
+    if d <= 0:
+        return 1.0
+    root_n = math.sqrt(n)
+    lam = (root_n + 0.12 + 0.11 / root_n) * d
+    total = sum(
+        (-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam) for k in range(1, 101)
+    )
+    return min(1.0, max(0.0, 2 * total))
+
+
+def chi_square(observed, expected):
+    """Return ``(statistic, df, p_value)`` over cells with expected > 0."""
+    mask = expected > 0
+    observed, expected = observed[mask], expected[mask]
+    statistic = float(((observed - expected) ** 2 / expected).sum())
+    df = len(observed) - 1
+    return statistic, df, chi2_sf(statistic, df) if df > 0 else 1.0
+
+
+# ---------------------------------------------------------- accumulator
+
+
+def die_sides(die):
+    """Number of faces for a die name such as ``"d6"``; raises ValueError.
+
+    Only the dice the roll endpoints produce (`provably_fair.DICE_SIDES`)
+    are tested.
+    """
+    sides = DICE_SIDES.get(die)
+    if sides is None:
+        raise ValueError(f"Unsupported dice type: {die}")
+    return sides
+
+
+class _DieState:
+    def __init__(self, sides):
+        self.sides = sides
+        self.counts = np.zeros(sides + 1, dtype=np.int64)  # counts[face]
+        self.rolls = 0
+        self.out_of_range = 0
+        # Serial correlation: running sums over consecutive faces
+        self.sum = 0
+        self.sum_sq = 0
+        self.lag_products = np.zeros(MAX_LAG + 1, dtype=np.float64)
+        self.lag_pairs = np.zeros(MAX_LAG + 1, dtype=np.int64)
+        self.lag_first = np.zeros(MAX_LAG + 1, dtype=np.float64)
+        self.lag_second = np.zeros(MAX_LAG + 1, dtype=np.float64)
+        self.tail = np.zeros(0, dtype=np.int64)  # last MAX_LAG faces seen
+        # Runs above/below the middle face (the middle itself is skipped)
+        self.above = 0
+        self.below = 0
+        self.runs = 0
+        self.last_side = 0
+        self.positions = np.zeros((MAX_POSITIONS, sides + 1), dtype=np.int64)
+        self.blocks = defaultdict(lambda: [0, 0])  # block -> [rolls, face total]
+
+
+class FairnessAccumulator:
+    def __init__(self):
+        self.dice = {}
+        self.skipped = 0
+
+    def _state(self, die):
+        state = self.dice.get(die)
+        if state is None:
+            state = self.dice[die] = _DieState(die_sides(die))
+        return state
+
+    def add_rows(self, rows):
+        """Add one chunk of ``(die, result, block_num)`` rows in storage order.
+
+        ``die`` is a single die name (``"d6"``); ``result`` is the stored
+        comma-separated faces of one roll.
+        """
+        by_die = defaultdict(list)
+        for die, result, block_num in rows:
+            if not die or not result:
+                self.skipped += 1
+                continue
+            by_die[die].append((result, block_num))
+        for die, group in by_die.items():
+            try:
+                state = self._state(die)
+            except ValueError:
+                self.skipped += len(group)
+                continue
+            results, blocks = zip(*group)
+            self._add(state, results, blocks)
+
+    def _add(self, state, results, blocks):
+        try:
+            faces = np.fromstring(",".join(results), dtype=np.int64, sep=",")
+        except ValueError:
+            self.skipped += len(results)
+            return
+        lengths = np.fromiter((r.count(",") + 1 for r in results), np.int64)
+        if faces.size != lengths.sum():
+            self.skipped += len(results)
+            return
+        starts = np.cumsum(lengths) - lengths
+        invalid = (faces < 1) | (faces > state.sides)
+        if invalid.any():
+            # Drop whole rolls with impossible faces and count them
+            bad = np.logical_or.reduceat(invalid, starts)
+            state.out_of_range += int(bad.sum())
+            keep = np.flatnonzero(~bad).tolist()
+            if keep:
+                self._add(state, [results[i] for i in keep], [blocks[i] for i in keep])
+            return
+        state.rolls += len(results)
+        state.counts += np.bincount(faces, minlength=state.sides + 1)
+
+        # Serial correlation, including pairs that span the previous chunk
+        seq = np.concatenate([state.tail, faces]).astype(np.float64)
+        start = len(state.tail)
+        for lag in range(1, MAX_LAG + 1):
+            lo = max(start - lag, 0)
+            first, second = seq[lo : len(seq) - lag], seq[lo + lag :]
+            state.lag_products[lag] += float(first @ second)
+            state.lag_first[lag] += float(first.sum())
+            state.lag_second[lag] += float(second.sum())
+            state.lag_pairs[lag] += len(first)
+        state.tail = np.concatenate([state.tail, faces])[-MAX_LAG:]
+        state.sum += int(faces.sum())
+        state.sum_sq += int((faces * faces).sum())
+
+        # Runs above/below the middle face
+        doubled = 2 * faces - (state.sides + 1)
+        signs = np.sign(doubled[doubled != 0])
+        if len(signs):
+            state.above += int((signs > 0).sum())
+            state.below += int((signs < 0).sum())
+            changes = int((signs[1:] != signs[:-1]).sum())
+            state.runs += changes + int(signs[0] != state.last_side)
+            state.last_side = int(signs[-1])
+
+        # Face counts per position within each roll
+        positions = np.arange(len(faces)) - np.repeat(starts, lengths)
+        tracked = positions < MAX_POSITIONS
+        cells = positions[tracked] * (state.sides + 1) + faces[tracked]
+        state.positions += np.bincount(cells, minlength=state.positions.size).reshape(
+            state.positions.shape
+        )
+
+        # Per-roll totals grouped by block
+        totals = np.add.reduceat(faces, starts)
+        per_block = defaultdict(lambda: [0, 0])
+        for block, total, length in zip(blocks, totals.tolist(), lengths.tolist()):
+            if block is not None:
+                entry = per_block[block]
+                entry[0] += length
+                entry[1] += total
+        for block, (n, total) in per_block.items():
+            entry = state.blocks[block]
+            entry[0] += n
+            entry[1] += total
+
+    # -------------------------------------------------------------- report
+
+    def report(self, alpha=DEFAULT_ALPHA):
+        """Return every test's statistics and p-values, per die type."""
+        dice = {die: _die_report(state) for die, state in sorted(self.dice.items())}
+        suspicious = []
+        for die, tests in dice.items():
+            for name, p_value in _p_values(tests):
+                if p_value is not None and p_value < alpha:
+                    suspicious.append({"die": die, "test": name, "p_value": p_value})
+        return {
+            "alpha": alpha,
+            "skipped_rows": self.skipped,
+            "dice": dice,
+            "suspicious": suspicious,
+        }
+
+
+def _p_values(tests):
+    for name in ("chi_square", "ks", "runs", "block_clustering"):
+        if tests.get(name):
+            yield name, tests[name]["p_value"]
+    for entry in tests["serial_correlation"]:
+        yield f"serial_correlation_lag{entry['lag']}", entry["p_value"]
+    for entry in tests["position_bias"]:
+        yield f"position_bias_{entry['position']}", entry["p_value"]
+
+
+def _die_report(state):
+    sides = state.sides
+    observed = state.counts[1:].astype(np.float64)
+    n = int(observed.sum())
+    probs = np.full(sides, 1.0 / sides)
+    tests = {
+        "sides": sides,
+        "rolls": state.rolls,
+        "faces": n,
+        "out_of_range": state.out_of_range,
+        "chi_square": None,
+        "ks": None,
+        "serial_correlation": [],
+        "runs": None,
+        "position_bias": [],
+        "block_clustering": None,
+    }
+    if n == 0:
+        return tests
+
+    statistic, df, p_value = chi_square(observed, probs * n)
+    tests["chi_square"] = {"statistic": statistic, "df": df, "p_value": p_value}
+
+    d = float(np.abs(np.cumsum(observed) / n - np.cumsum(probs)).max())
+    tests["ks"] = {"statistic": d, "p_value": kolmogorov_sf(d, n)}
+
+    for lag in range(1, MAX_LAG + 1):
+        pairs = int(state.lag_pairs[lag])
+        if pairs < 3:
+            break
+        mean = state.sum / n
+        variance = state.sum_sq / n - mean * mean
+        covariance = (
+            state.lag_products[lag]
+            - mean * (state.lag_first[lag] + state.lag_second[lag])
+            + pairs * mean * mean
+        ) / pairs
+        r = covariance / variance if variance > 0 else 0.0
+        tests["serial_correlation"].append(
+            {"lag": lag, "r": r, "p_value": normal_two_sided(r * math.sqrt(pairs))}
+        )
+
+    n1, n2, runs = state.above, state.below, state.runs
+    total = n1 + n2
+    if n1 and n2 and total > 1:
+        expected = 2 * n1 * n2 / total + 1
+        variance = 2 * n1 * n2 * (2 * n1 * n2 - total) / (total * total * (total - 1))
+        z = (runs - expected) / math.sqrt(variance) if variance > 0 else 0.0
+        tests["runs"] = {
+            "runs": runs,
+            "expected": expected,
+            "z": z,
+            "p_value": normal_two_sided(z),
+        }
+
+    for position, counts in enumerate(state.positions):
+        counted = int(counts.sum())
+        if counted == 0 or (position == 0 and state.positions[1].sum() == 0):
+            # Single-die rolls only: position 0 is just the chi-square above
+            continue
+        statistic, df, p_value = chi_square(
+            counts[1:].astype(np.float64), probs * counted
+        )
+        tests["position_bias"].append(
+            {
+                "position": position,
+                "faces": counted,
+                "statistic": statistic,
+                "df": df,
+                "p_value": p_value,
+            }
+        )
+
+    if state.blocks:
+        mean = (sides + 1) / 2
+        variance = (sides * sides - 1) / 12
+        counts = np.array([entry[0] for entry in state.blocks.values()], np.float64)
+        totals = np.array([entry[1] for entry in state.blocks.values()], np.float64)
+        z = (totals - counts * mean) / np.sqrt(counts * variance)
+        statistic = float((z * z).sum())
+        tests["block_clustering"] = {
+            "blocks": len(counts),
+            "max_faces_per_block": int(counts.max()),
+            "statistic": statistic,
+            "df": len(counts),
+            "p_value": chi2_sf(statistic, len(counts)),
+        }
+    return tests
@@ -0,0 +1,151 @@
+"""Indexed, keyset-paginated roll history queries.
+
+Rolls are listed newest first by ``(timestamp, _id)``. A page cursor encodes
+both values of a boundary roll, so fetching the next page is an index range
+scan from that point instead of a skip over, or sort of, everything before
+it.
+"""
+
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from roll_schema import dice_type_query
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+# Fields shown by the history table and returned by /api/rolls
+LIST_FIELDS = {
+    "dice_type": 1,
+    "roll_result": 1,
+    "proof": 1,
+    "timestamp": 1,
+    "server_seed": 1,
+    "client_seed": 1,
+    "nonce": 1,
+    "modifier": 1,
+    "label": 1,
+    "block_num": 1,
+    "algo": 1,
+    "expression": 1,
+    "total": 1,
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def ensure_indexes(collection, legacy=True):
+    """Create the indexes used by the history queries (idempotent).
+
+    The ``dice_type`` index only serves documents in the legacy schema (see
+    roll_schema.py); it is left out once `legacy` is False.
+    """
+    newest = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+    collection.create_index(newest, name="timestamp_id")
+    collection.create_index([("label", ASCENDING), *newest], name="label_timestamp")
+    collection.create_index(
+        [("sides", ASCENDING), *newest],
+        name="sides_timestamp",
+        partialFilterExpression={"sides": {"$exists": True}},
+    )
+    if legacy:
+        collection.create_index(
+            [("dice_type", ASCENDING), *newest], name="dice_type_timestamp"
+        )
+    collection.create_index([("block_num", ASCENDING)], name="block_num")
+
+
+def to_millis(ts):
+    """Milliseconds since the epoch for a naive UTC datetime."""
+    return (ts - _EPOCH) // timedelta(milliseconds=1)
+
+
+def encode_cursor(roll):
+    """Return an opaque page cursor for a roll document."""
+    return f"{to_millis(roll['timestamp'])}-{roll['_id']}"
+
+
+def decode_cursor(cursor):
+    """Return ``(timestamp, ObjectId)`` for a cursor; raises ValueError."""
+    try:
+        millis, oid = cursor.split("-", 1)
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(oid)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def build_filter(
+    label=None, dice_type=None, block_min=None, block_max=None, legacy=True
+):
+    """Return a Mongo filter for the optional history filters.
+
+    ``dice_type`` matches a stored type exactly (``"3xd6"``) or, given a bare
+    die such as ``"d6"``, any number of that die; see
+    `roll_schema.dice_type_query` for `legacy`.
+    """
+    query = {}
+    if label is not None:
+        query["label"] = label
+    if dice_type:
+        query.update(dice_type_query(dice_type, legacy))
+    if block_min is not None or block_max is not None:
+        query["block_num"] = {}
+        if block_min is not None:
+            query["block_num"]["$gte"] = block_min
+        if block_max is not None:
+            query["block_num"]["$lte"] = block_max
+    return query
+
+
+def page_rolls(
+    collection,
+    limit=DEFAULT_PAGE_SIZE,
+    before=None,
+    after=None,
+    query=None,
+    fields=LIST_FIELDS,
+):
+    """Return ``(rolls, next_cursor, prev_cursor)`` for one page, newest first.
+
+    ``before`` pages towards older rolls and ``after`` towards newer ones.
+    ``next_cursor`` is None on the oldest page and ``prev_cursor`` is None
+    on the newest.
+    """
+    query = dict(query or {})
+    newer = after is not None
+    boundary = after if newer else before
+    if boundary is not None:
+        ts, oid = decode_cursor(boundary)
+        op = "$gt" if newer else "$lt"
+        past = [{"timestamp": {op: ts}}, {"timestamp": ts, "_id": {op: oid}}]
+        if "$or" in query:
+            query = {"$and": [query, {"$or": past}]}
+        else:
+            query["$or"] = past
+    direction = ASCENDING if newer else DESCENDING
+    cursor = (
+        collection.find(query, fields)
+        .sort([("timestamp", direction), ("_id", direction)])
+        .limit(limit + 1)
+    )
+    return finish_page(list(cursor), limit, before, after)
+
+
+def finish_page(rolls, limit, before=None, after=None):
+    """Turn up to ``limit + 1`` rolls fetched past a boundary into a page.
+
+    ``rolls`` are in fetch order: newest first for ``before`` (or no cursor),
+    oldest first for ``after``. Returns ``(rolls, next_cursor, prev_cursor)``.
+    """
+    newer = after is not None
+    more = len(rolls) > limit
+    rolls = rolls[:limit]
+    if newer:
+        rolls.reverse()
+    has_older = more if not newer else True
+    has_newer = more if newer else before is not None
+    next_cursor = encode_cursor(rolls[-1]) if rolls and has_older else None
+    prev_cursor = encode_cursor(rolls[0]) if rolls and has_newer else None
+    return rolls, next_cursor, prev_cursor
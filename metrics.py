@@ -0,0 +1,240 @@
+"""Request metrics and sampling profiler for the Flask app.
+
+`Metrics` keeps latency histograms in memory and renders them in the
+Prometheus text format for `/metrics`:
+
+* ``dice_request_seconds{endpoint}`` — whole requests, timed by
+  before/after-request hooks;
+* ``dice_phase_seconds{endpoint,phase}`` — phases inside the hot views
+  (seed fetch, HMAC, store insert, JSON encoding, ...), recorded with a
+  `PhaseTimer` whose `mark(phase)` closes the phase that just ended;
+* ``dice_responses_total{endpoint,status}``.
+
+With metrics disabled no hooks are registered and `timer` hands out a shared
+no-op timer, so the views pay one method call per phase. Each gunicorn
+worker keeps its own histograms; scrape workers individually or aggregate
+the series by instance.
+
+`SamplingProfiler` runs every Nth request under `cProfile` and writes the
+stats to ``<directory>/<endpoint>-<time>-<pid>-<n>.prof`` for `pstats` or
+snakeviz. It is off (no hooks at all) unless `every` is positive.
+"""
+
+import cProfile
+import itertools
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from a fast HMAC to a slow Hive node
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+UNTIMED_ENDPOINTS = frozenset({"static", "metrics"})
+
+
+def endpoint_name():
+    """The request's view name without its blueprint prefix."""
+    return (request.endpoint or "unmatched").rpartition(".")[2]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(counts) for labels, counts in self._series.items()}
+        for labels, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = _labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            plain = _labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{plain} {counts[-1]}")
+            lines.append(f"{self.name}_count{plain} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class PhaseTimer:
+    """Times consecutive phases of one request."""
+
+    __slots__ = ("histogram", "endpoint", "last")
+
+    def __init__(self, histogram, endpoint):
+        self.histogram = histogram
+        self.endpoint = endpoint
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """Record the time since the previous mark as `phase`."""
+        now = time.perf_counter()
+        self.histogram.observe(now - self.last, self.endpoint, phase)
+        self.last = now
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def mark(self, phase):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.requests = Histogram(
+            "dice_request_seconds", "Request latency in seconds.", ("endpoint",)
+        )
+        self.phases = Histogram(
+            "dice_phase_seconds",
+            "Latency of phases within a request in seconds.",
+            ("endpoint", "phase"),
+        )
+        self.responses = Counter(
+            "dice_responses_total", "Responses by status code.", ("endpoint", "status")
+        )
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _start_request_timer():
+            g.metrics_start = time.perf_counter()
+
+        @app.after_request
+        def _record_request(response):
+            start = g.pop("metrics_start", None)
+            endpoint = endpoint_name()
+            if start is not None and endpoint not in UNTIMED_ENDPOINTS:
+                self.requests.observe(time.perf_counter() - start, endpoint)
+                self.responses.inc(endpoint, str(response.status_code))
+            return response
+
+    def timer(self, endpoint):
+        """A `PhaseTimer` for one request, or a no-op timer when disabled."""
+        if not self.enabled:
+            return NULL_TIMER
+        return PhaseTimer(self.phases, endpoint)
+
+    def render(self):
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        for metric in (self.requests, self.phases, self.responses):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    def __init__(self, every=0, directory="profiles"):
+        self.every = every
+        self.directory = directory
+        self._counter = itertools.count(1)
+        self.written = 0
+
+    def init_app(self, app):
+        if self.every <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+
+        @app.before_request
+        def _maybe_profile():
+            if endpoint_name() in UNTIMED_ENDPOINTS:
+                return
+            n = next(self._counter)
+            if n % self.every:
+                return
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another request is being profiled (one profiler per process)
+                return
+            g.profile = (profile, n)
+
+        @app.teardown_request
+        def _dump_profile(exc):
+            sampled = g.pop("profile", None)
+            if sampled is None:
+                return
+            profile, n = sampled
+            profile.disable()
+            name = f"{endpoint_name()}-{int(time.time())}-{os.getpid()}-{n}.prof"
+            try:
+                profile.dump_stats(os.path.join(self.directory, name))
+                self.written += 1
+            except OSError as e:
+                log.warning("Could not write profile %s: %s", name, e)
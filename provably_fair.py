@@ -0,0 +1,176 @@
+"""Provably fair roll algorithms.
+
+Every roll is derived from HMAC-SHA256 keyed by the server seed. The proof
+stored with a roll is always `HMAC(server_seed, "client_seed:nonce")`; how the
+dice faces are drawn from it depends on the algorithm version recorded with
+the roll:
+
+* ``v1`` slices 8 hex digits (32 bits) per die out of the single proof digest
+  and maps them with ``num % sides``. Beyond 8 dice it re-uses the first
+  chunk, so it is kept only so that existing proofs keep verifying.
+* ``v2`` expands a counter-mode byte stream,
+  ``HMAC(server_seed, "client_seed:nonce:cursor")`` for cursor = 0, 1, ...,
+  reads only as many bytes per die as the number of sides needs, and rejects
+  out-of-range values so every face is exactly equally likely. It has no
+  practical limit on the number of dice.
+
+Hive rolls made in the same block share the block id as server seed, and
+batch and session rolls share one seed throughout, so the key is absorbed
+once per seed: `keyed_hmac` keeps a bounded LRU of `KeyedHmac` states and
+each message works on copies of them.
+"""
+
+import hashlib
+from functools import lru_cache
+
+DICE_SIDES = {"d4": 4, "d6": 6, "d8": 8, "d10": 10, "d12": 12, "d20": 20, "d100": 100}
+
+ROLL_V1 = "v1"
+ROLL_V2 = "v2"
+CURRENT_VERSION = ROLL_V2
+
+KEYED_CACHE_SIZE = 1024  # server seeds whose keyed HMAC state is kept
+_BLOCK_SIZE = 64  # SHA-256 block size in bytes
+_IPAD = bytes(x ^ 0x36 for x in range(256))
+_OPAD = bytes(x ^ 0x5C for x in range(256))
+
+
+class KeyedHmac:
+    """HMAC-SHA256 (RFC 2104) with the key already absorbed.
+
+    Holds the SHA-256 states after the inner and outer padded keys; a
+    message costs two state copies and two short hashes. This is what
+    ``hmac.new(key).copy()`` does, minus OpenSSL's comparatively slow HMAC
+    context copy. The states are never updated in place, so one instance
+    can be shared between threads.
+    """
+
+    __slots__ = ("_inner", "_outer")
+
+    def __init__(self, key):
+        if len(key) > _BLOCK_SIZE:
+            key = hashlib.sha256(key).digest()
+        key = key.ljust(_BLOCK_SIZE, b"\0")
+        self._inner = hashlib.sha256(key.translate(_IPAD))
+        self._outer = hashlib.sha256(key.translate(_OPAD))
+
+    def digest(self, message):
+        inner = self._inner.copy()
+        inner.update(message)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+
+@lru_cache(maxsize=KEYED_CACHE_SIZE)
+def keyed_hmac(server_seed):
+    """The shared `KeyedHmac` for a server seed."""
+    return KeyedHmac(server_seed.encode())
+
+
+def roll_proof(server_seed, client_seed, nonce):
+    """Return the hex proof digest committed to by a roll."""
+    return keyed_hmac(server_seed).digest(f"{client_seed}:{nonce}".encode()).hex()
+
+
+class DigestStream:
+    """Lazy HMAC-SHA256 counter-mode byte stream for one roll.
+
+    Each 32-byte block is the seed's keyed state (see `keyed_hmac`) applied
+    to ``client_seed:nonce:cursor``.
+    """
+
+    def __init__(self, server_seed, client_seed, nonce):
+        self._keyed = keyed_hmac(server_seed)
+        self._prefix = f"{client_seed}:{nonce}:".encode()
+        self.cursor = 0
+        self._buf = b""
+        self._pos = 0
+
+    def _next_block(self):
+        block = self._keyed.digest(self._prefix + str(self.cursor).encode())
+        self.cursor += 1
+        return block
+
+    def read(self, n):
+        """Return the next `n` bytes of the stream."""
+        while len(self._buf) - self._pos < n:
+            self._buf = self._buf[self._pos :] + self._next_block()
+            self._pos = 0
+        out = self._buf[self._pos : self._pos + n]
+        self._pos += n
+        return out
+
+    def randbelow(self, n):
+        """Return an unbiased integer in ``[0, n)``."""
+        width = max(1, ((n - 1).bit_length() + 7) // 8)
+        limit = (256**width // n) * n
+        while True:
+            value = int.from_bytes(self.read(width), "big")
+            if value < limit:
+                return value % n
+
+    def dice(self, sides, count):
+        """Return `count` unbiased faces in ``[1, sides]``."""
+        if sides <= 256:
+            # Fast path: one byte per draw, reading whole blocks at a time
+            limit = (256 // sides) * sides
+            results = []
+            while len(results) < count:
+                if self._pos >= len(self._buf):
+                    self._buf, self._pos = self._next_block(), 0
+                byte = self._buf[self._pos]
+                self._pos += 1
+                if byte < limit:
+                    results.append(byte % sides + 1)
+            return results
+        return [self.randbelow(sides) + 1 for _ in range(count)]
+
+
+def _roll_v1(sides, dice_count, server_seed, client_seed, nonce):
+    digest = roll_proof(server_seed, client_seed, nonce)
+    results = []
+    for i in range(dice_count):
+        # Take 8 hex digits per die (32 bits, more than enough)
+        start = i * 8
+        end = start + 8
+        chunk = digest[start:end]
+        if len(chunk) < 8:
+            # Extend digest if needed
+            chunk += digest[: 8 - len(chunk)]
+        num = int(chunk, 16)
+        roll = (num % sides) + 1
+        results.append(roll)
+    return results, digest
+
+
+def _roll_v2(sides, dice_count, server_seed, client_seed, nonce):
+    stream = DigestStream(server_seed, client_seed, nonce)
+    return stream.dice(sides, dice_count), roll_proof(server_seed, client_seed, nonce)
+
+
+ALGORITHMS = {ROLL_V1: _roll_v1, ROLL_V2: _roll_v2}
+
+
+def parse_dice_type(stored):
+    """Split a stored dice type such as ``"3xd6"`` into ``("d6", 3)``."""
+    if "x" in stored:
+        count, dice_type = stored.split("x", 1)
+        return dice_type, int(count)
+    return stored, 1
+
+
+def provably_fair_roll(
+    dice_type, dice_count, server_seed, client_seed, nonce, version=ROLL_V1
+):
+    """Return `(results, proof)` for a roll under the given algorithm version.
+
+    Rolls stored without a version predate ``v2`` and use ``v1``.
+    """
+    sides = DICE_SIDES.get(dice_type)
+    if not sides:
+        raise ValueError("Unsupported dice type")
+    algorithm = ALGORITHMS.get(version)
+    if algorithm is None:
+        raise ValueError(f"Unsupported roll algorithm: {version}")
+    return algorithm(sides, dice_count, server_seed, client_seed, nonce)
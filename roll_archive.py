@@ -0,0 +1,455 @@
+"""Columnar, memory-mapped archive of stored rolls for offline analysis.
+
+The analysis scripts otherwise re-read SQLite rows or roll documents and
+re-parse their comma-separated ``result`` strings on every run. An archive
+stores the rolls once, already parsed, as flat typed columns that are
+opened with `numpy.memmap`: a column is mapped rather than read into
+memory, so a pass over 100M faces is a few vectorised loops over the page
+cache with memory bounded by the chunk size.
+
+An archive is a directory of immutable segments plus ``manifest.json``.
+Each segment holds one source's rolls (a SQLite table, or a roll store) in
+storage order, one raw ``<column>.bin`` file per column. For ``n`` rolls:
+
+* ``faces`` — every face of every roll, uint8 (uint16 if a face is above
+  255);
+* ``offsets`` — int64, ``n + 1`` entries; roll ``i`` is
+  ``faces[offsets[i]:offsets[i + 1]]``;
+* ``sides`` — uint16 sides of the die, 0 for dice-expression rolls;
+* ``count`` — uint32 dice count;
+* ``modifier`` — int32;
+* ``block_num`` — int64 Hive block, -1 for rolls seeded without one;
+* ``timestamp`` — int64 microseconds since the epoch (UTC), 0 if unknown;
+* ``digest`` — the 32-byte HMAC proof, ``(n, 32)`` uint8 (zeros if none).
+
+`ArchiveWriter` appends segments (see scripts/archive_rolls.py). Each is
+written under a temporary name and listed in the manifest only once it is
+complete, together with a cursor per source (the last id exported) that
+the next export continues from, so readers only ever see whole segments.
+There should be one writer at a time.
+"""
+
+import json
+import os
+import re
+import shutil
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+DIGEST_SIZE = 32
+MAX_FACE = 0xFFFF
+FACE_CHUNK = 1 << 20  # faces per vectorised step when scanning
+ROLL_CHUNK = 1 << 18  # rolls per step when reading per-roll columns
+
+# Per-roll columns and their dtypes; faces and offsets are laid out apart
+COLUMNS = {
+    "sides": np.uint16,
+    "count": np.uint32,
+    "modifier": np.int32,
+    "block_num": np.int64,
+    "timestamp": np.int64,
+    "digest": np.uint8,
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_DIE = re.compile(r"d(\d+)")
+
+
+def column_layout(name, rolls, faces, face_dtype):
+    """``(dtype, shape)`` of a column file in a segment."""
+    if name == "faces":
+        return np.dtype(face_dtype), (faces,)
+    if name == "offsets":
+        return np.dtype(np.int64), (rolls + 1,)
+    if name == "digest":
+        return np.dtype(np.uint8), (rolls, DIGEST_SIZE)
+    return np.dtype(COLUMNS[name]), (rolls,)
+
+
+# ------------------------------------------------------------- encoding
+
+
+@lru_cache(maxsize=256)
+def sides_of(die):
+    """Sides of a single die name such as ``"d6"``; 0 for anything else."""
+    match = _DIE.fullmatch(die or "")
+    return int(match.group(1)) if match else 0
+
+
+def timestamp_micros(value):
+    """Microseconds since the epoch for a stored timestamp, or 0.
+
+    Accepts datetimes (naive ones are UTC, as `make_roll_doc` stores them),
+    ISO 8601 strings (the roll_* script tables) and epoch seconds.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return 0
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return (value - EPOCH) // timedelta(microseconds=1)
+    if isinstance(value, (int, float)):
+        return round(value * 1_000_000)
+    return 0
+
+
+def digest_bytes(proof):
+    """The 32 bytes of a hex proof, or zeros if it is missing or malformed."""
+    try:
+        digest = bytes.fromhex(proof)
+    except (TypeError, ValueError):
+        return bytes(DIGEST_SIZE)
+    return digest if len(digest) == DIGEST_SIZE else bytes(DIGEST_SIZE)
+
+
+def _parse_results(results):
+    """Return ``(faces, lengths, keep)`` for comma-separated result strings.
+
+    `keep` lists the indexes of the results that parsed, or is None when
+    all of them did.
+    """
+    lengths = np.fromiter((r.count(",") + 1 for r in results), np.int64, len(results))
+    try:
+        faces = np.fromstring(",".join(results), dtype=np.int64, sep=",")
+    except ValueError:
+        faces = None
+    if (
+        faces is not None
+        and faces.size == lengths.sum()
+        and faces.min() >= 1
+        and faces.max() <= MAX_FACE
+    ):
+        return faces, lengths, None
+    # Something in the chunk is malformed: find it row by row
+    keep, parsed = [], []
+    for i, result in enumerate(results):
+        try:
+            values = [int(x) for x in result.split(",")]
+        except ValueError:
+            continue
+        if 1 <= min(values) and max(values) <= MAX_FACE:
+            keep.append(i)
+            parsed.extend(values)
+    lengths = lengths[keep]
+    return np.array(parsed, dtype=np.int64), lengths, keep
+
+
+def encode_rows(rows):
+    """Parse one chunk of rows into column arrays; returns ``(columns, skipped)``.
+
+    Each row is ``(sides, count, modifier, result, proof, block_num,
+    timestamp)``, with `result` the stored comma-separated faces and
+    `count` None to take the number of faces. Rows without faces, or with
+    faces that are not integers in ``1..65535``, are skipped. `columns` is
+    None if no row is left.
+    """
+    total = len(rows)
+    rows = [row for row in rows if row[3]]
+    if rows:
+        faces, lengths, keep = _parse_results([row[3] for row in rows])
+        if keep is not None:
+            rows = [rows[i] for i in keep]
+    if not rows:
+        return None, total
+    n = len(rows)
+    sides, count, modifier, _, proof, block_num, timestamp = zip(*rows)
+    columns = {
+        "faces": faces,
+        "lengths": lengths,
+        "sides": np.array(sides, dtype=np.uint16),
+        "count": np.array(
+            [c if c is not None else size for c, size in zip(count, lengths.tolist())],
+            dtype=np.uint32,
+        ),
+        "modifier": np.array([m or 0 for m in modifier], dtype=np.int32),
+        "block_num": np.array(
+            [-1 if b is None else b for b in block_num], dtype=np.int64
+        ),
+        "timestamp": np.fromiter(map(timestamp_micros, timestamp), np.int64, n),
+        "digest": np.frombuffer(
+            b"".join(map(digest_bytes, proof)), dtype=np.uint8
+        ).reshape(n, DIGEST_SIZE),
+    }
+    return columns, total - n
+
+
+# -------------------------------------------------------------- reading
+
+
+def read_manifest(path):
+    """The archive's manifest, or an empty one if there is none yet."""
+    try:
+        manifest = json.loads((Path(path) / MANIFEST).read_text())
+    except FileNotFoundError:
+        return {
+            "version": FORMAT_VERSION,
+            "next_segment": 0,
+            "segments": [],
+            "cursors": {},
+        }
+    if manifest.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported roll archive version: {manifest.get('version')}")
+    return manifest
+
+
+class Segment:
+    """One segment's columns, memory-mapped on first access (``segment["faces"]``)."""
+
+    def __init__(self, path, meta):
+        self.path = Path(path)
+        self.name = meta["name"]
+        self.source = meta["source"]
+        self.rolls = meta["rolls"]
+        self.faces = meta["faces"]
+        self.face_dtype = np.dtype(meta["face_dtype"])
+        self._columns = {}
+
+    def __len__(self):
+        return self.rolls
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            dtype, shape = column_layout(name, self.rolls, self.faces, self.face_dtype)
+            column = self._columns[name] = np.memmap(
+                self.path / f"{name}.bin", dtype=dtype, mode="r", shape=shape
+            )
+        return column
+
+    def nbytes(self):
+        return sum(f.stat().st_size for f in self.path.glob("*.bin"))
+
+    def die_counts(self):
+        """Rolls per die name (``{"d6": n}``); expression rolls are left out."""
+        counts = Counter()
+        for start in range(0, self.rolls, ROLL_CHUNK):
+            sides, n = np.unique(
+                self["sides"][start : start + ROLL_CHUNK], return_counts=True
+            )
+            counts.update(
+                {f"d{s}": int(c) for s, c in zip(sides.tolist(), n.tolist()) if s}
+            )
+        return counts
+
+    def face_chunks(self, chunk=FACE_CHUNK):
+        """Yield the faces column in slices of at most `chunk` faces."""
+        faces = self["faces"]
+        for start in range(0, self.faces, chunk):
+            yield faces[start : start + chunk]
+
+    def columns(self, start, stop):
+        """Rolls ``start:stop`` as the column dict `encode_rows` returns."""
+        offsets = np.asarray(self["offsets"][start : stop + 1])
+        columns = {
+            "faces": self["faces"][offsets[0] : offsets[-1]],
+            "lengths": np.diff(offsets),
+        }
+        for name in COLUMNS:
+            columns[name] = self[name][start:stop]
+        return columns
+
+    def totals(self, chunk=ROLL_CHUNK):
+        """Yield ``(totals, sides, count)`` arrays, `chunk` rolls at a time.
+
+        Totals are the sums of each roll's faces, without the modifier.
+        """
+        for start in range(0, self.rolls, chunk):
+            stop = min(start + chunk, self.rolls)
+            offsets = np.asarray(self["offsets"][start : stop + 1])
+            faces = self["faces"][offsets[0] : offsets[-1]]
+            totals = np.add.reduceat(faces, offsets[:-1] - offsets[0], dtype=np.int64)
+            yield totals, self["sides"][start:stop], self["count"][start:stop]
+
+
+class RollArchive:
+    """Read-only view of an archive's segments."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        if not (self.path / MANIFEST).exists():
+            raise ValueError(f"No roll archive at {self.path}")
+        self.manifest = read_manifest(self.path)
+        self.segments = [
+            Segment(self.path / meta["name"], meta)
+            for meta in self.manifest["segments"]
+        ]
+
+    @property
+    def sources(self):
+        return sorted({segment.source for segment in self.segments})
+
+    def select(self, source=None):
+        """Segments of one source (all of them when `source` is None)."""
+        if source is None:
+            return list(self.segments)
+        segments = [s for s in self.segments if s.source == source]
+        if not segments:
+            raise ValueError(f"Source '{source}' not found in archive.")
+        return segments
+
+
+# -------------------------------------------------------------- writing
+
+
+def face_dtype(faces):
+    return np.dtype(np.uint8 if faces.max() <= 0xFF else np.uint16)
+
+
+class _SegmentFile:
+    """A segment being written under ``<name>.tmp``."""
+
+    def __init__(self, archive, name, source, dtype):
+        self.tmp = archive / f"{name}.tmp"
+        self.final = archive / name
+        self.face_dtype = dtype
+        self.meta = {
+            "name": name,
+            "source": source,
+            "rolls": 0,
+            "faces": 0,
+            "face_dtype": dtype.name,
+        }
+        self.tmp.mkdir()
+        self.files = {
+            column: open(self.tmp / f"{column}.bin", "wb")
+            for column in ("faces", "offsets", *COLUMNS)
+        }
+        self.files["offsets"].write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def write(self, columns):
+        files = self.files
+        files["faces"].write(columns["faces"].astype(self.face_dtype).tobytes())
+        ends = self.meta["faces"] + np.cumsum(columns["lengths"], dtype=np.int64)
+        files["offsets"].write(ends.tobytes())
+        for name, dtype in COLUMNS.items():
+            files[name].write(
+                np.ascontiguousarray(columns[name], dtype=dtype).tobytes()
+            )
+        self.meta["rolls"] += len(columns["lengths"])
+        self.meta["faces"] = int(ends[-1])
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        return self.meta
+
+    def discard(self):
+        self.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+class ArchiveWriter:
+    """Appends segments to an archive; use it as a context manager.
+
+    Rows added for a source go to one new segment (and another once its
+    faces need a wider dtype). Leaving the ``with`` block normally lists
+    the new segments and cursors in the manifest; on an exception they are
+    deleted and the manifest is left as it was.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest = read_manifest(self.path)
+        listed = {meta["name"] for meta in self.manifest["segments"]}
+        # Leftovers of an interrupted writer
+        for entry in self.path.iterdir():
+            if entry.name.endswith(".tmp") or (
+                entry.is_dir() and entry.name.isdigit() and entry.name not in listed
+            ):
+                if entry.is_dir():
+                    shutil.rmtree(entry)
+                else:
+                    entry.unlink()
+        self.skipped = Counter()
+        self._open = {}  # source -> _SegmentFile
+        self._closed = []
+        self._cursors = {}
+        self._dropped = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+
+    def cursor(self, source):
+        """The last id exported from `source`, or None."""
+        return self._cursors.get(source, self.manifest["cursors"].get(source))
+
+    def add(self, source, rows, cursor=None):
+        """Parse and append one chunk of rows (see `encode_rows`)."""
+        columns, skipped = encode_rows(rows)
+        self.skipped[source] += skipped
+        if columns is not None:
+            self.add_columns(source, columns)
+        if cursor is not None:
+            self._cursors[source] = cursor
+
+    def add_columns(self, source, columns):
+        if not len(columns["lengths"]):
+            return
+        dtype = face_dtype(columns["faces"])
+        segment = self._open.get(source)
+        if segment is not None and dtype.itemsize > segment.face_dtype.itemsize:
+            self._closed.append(self._open.pop(source))
+            segment.close()
+            segment = None
+        if segment is None:
+            segment = self._open[source] = _SegmentFile(
+                self.path, self._next_name(), source, dtype
+            )
+        segment.write(columns)
+
+    def compact(self, source):
+        """Rewrite a source's segments as one (per face dtype)."""
+        old = [s for s in RollArchive(self.path).segments if s.source == source]
+        if len(old) < 2:
+            return
+        for segment in old:
+            for start in range(0, len(segment), ROLL_CHUNK):
+                stop = min(start + ROLL_CHUNK, len(segment))
+                self.add_columns(source, segment.columns(start, stop))
+            self._dropped.add(segment.name)
+
+    def _next_name(self):
+        name = f"{self.manifest['next_segment']:06d}"
+        self.manifest["next_segment"] += 1
+        return name
+
+    def commit(self):
+        segments = self._closed + list(self._open.values())
+        self._closed, self._open = [], {}
+        for segment in segments:
+            segment.close()
+            segment.tmp.rename(segment.final)
+        manifest = self.manifest
+        manifest["segments"] = [
+            meta for meta in manifest["segments"] if meta["name"] not in self._dropped
+        ] + [segment.meta for segment in segments]
+        manifest["cursors"].update(self._cursors)
+        tmp = self.path / f"{MANIFEST}.tmp"
+        tmp.write_text(json.dumps(manifest, indent=2) + "\n")
+        os.replace(tmp, self.path / MANIFEST)
+        for name in self._dropped:
+            shutil.rmtree(self.path / name, ignore_errors=True)
+        self._dropped, self._cursors = set(), {}
+
+    def discard(self):
+        for segment in self._closed + list(self._open.values()):
+            segment.discard()
+        self._closed, self._open = [], {}
+        self._cursors, self._dropped = {}, set()
+        self.manifest = read_manifest(self.path)
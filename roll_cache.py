@@ -0,0 +1,110 @@
+"""In-process hot cache for recent rolls and roll detail lookups.
+
+The index page and `/api/rolls` show the same handful of newest rolls to
+every client, and `/roll/<id>` is usually opened right after a roll is made.
+`RecentRollsCache` keeps:
+
+* a ring buffer of the newest roll documents, appended to by `api_roll` on
+  insert and warmed from the database once, and
+* an LRU map of roll documents by id for detail pages.
+
+Each gunicorn worker has its own cache and only sees the rolls it inserted
+itself, so the ring is re-synced from the database once it is older than
+`max_age` seconds. `max_age=None` never re-syncs, which is right for a
+single worker.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class RecentRollsCache:
+    def __init__(self, size=100, detail_size=1024, max_age=None, clock=time.monotonic):
+        self.size = size
+        self.detail_size = detail_size
+        self.max_age = max_age
+        self.clock = clock
+        self._ring = deque(maxlen=size)
+        self._details = OrderedDict()
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self.hits = 0
+        self.misses = 0
+        self.detail_hits = 0
+        self.detail_misses = 0
+
+    # --------------------------------------------------------------- recent
+
+    def _fresh(self):
+        if self._synced_at is None:
+            return False
+        return self.max_age is None or self.clock() - self._synced_at <= self.max_age
+
+    def warm(self, rolls):
+        """Replace the ring with `rolls` (newest first) read from the database."""
+        with self._lock:
+            self._ring.clear()
+            self._ring.extend(rolls[: self.size])
+            self._synced_at = self.clock()
+            for roll in rolls:
+                self._remember(roll)
+
+    def add(self, roll):
+        """Record a newly inserted roll document."""
+        with self._lock:
+            self._ring.appendleft(roll)
+            self._remember(roll)
+
+    def recent(self, limit):
+        """Return ``(rolls, more)`` for the newest `limit` rolls, or None on a miss.
+
+        ``more`` is True when older rolls exist beyond the returned ones.
+        """
+        with self._lock:
+            if limit > self.size or not self._fresh():
+                self.misses += 1
+                return None
+            self.hits += 1
+            rolls = list(self._ring)
+        return rolls[:limit], len(rolls) > limit
+
+    # --------------------------------------------------------------- details
+
+    def _remember(self, roll):
+        key = str(roll["_id"])
+        self._details[key] = roll
+        self._details.move_to_end(key)
+        while len(self._details) > self.detail_size:
+            self._details.popitem(last=False)
+
+    def get(self, roll_id):
+        """Return a cached roll document by id, or None."""
+        with self._lock:
+            roll = self._details.get(roll_id)
+            if roll is None:
+                self.detail_misses += 1
+                return None
+            self._details.move_to_end(roll_id)
+            self.detail_hits += 1
+            return roll
+
+    def put(self, roll):
+        with self._lock:
+            self._remember(roll)
+
+    def stats(self):
+        def rate(hits, misses):
+            total = hits + misses
+            return round(hits / total, 4) if total else None
+
+        return {
+            "recent_hits": self.hits,
+            "recent_misses": self.misses,
+            "recent_hit_rate": rate(self.hits, self.misses),
+            "detail_hits": self.detail_hits,
+            "detail_misses": self.detail_misses,
+            "detail_hit_rate": rate(self.detail_hits, self.detail_misses),
+            "ring_size": len(self._ring),
+            "detail_size": len(self._details),
+        }
@@ -0,0 +1,165 @@
+"""Live roll feed for Server-Sent Events.
+
+`RollBroker` is an in-process fan-out: each published roll is encoded to
+JSON once, kept in a short backlog with an event id and handed to every
+subscriber. A client that reconnects with ``Last-Event-ID`` gets the events
+it missed from the backlog, or a ``reset`` event if it fell too far behind.
+
+With several gunicorn workers each worker has its own broker, so
+`CappedCollectionRelay` links them through a capped MongoDB collection:
+rolls are published by inserting into it, and one tailing thread per worker
+feeds whatever appears there into the local broker. Event ids are the
+ObjectIds of those inserts, so they mean the same thing in every worker.
+`AsyncRelayPublisher` inserts into the same collection from asyncio code.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+log = logging.getLogger(__name__)
+
+HEARTBEAT = 15.0  # seconds between keep-alive comments
+RETRY_MS = 3000  # client reconnect delay
+RESET_EVENT = "event: reset\ndata: {}\n\n"
+
+
+class RollBroker:
+    def __init__(self, backlog=256):
+        self._events = deque(maxlen=backlog)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self.published = 0
+
+    def publish(self, payload, event_id=None):
+        """Broadcast one roll payload (a JSON-serializable dict)."""
+        data = json.dumps(payload, separators=(",", ":"), default=str)
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event_id or str(self._seq), data))
+            self.published += 1
+            self._cond.notify_all()
+
+    def _position(self, last_event_id):
+        """Return the sequence number to resume after, or None if unknown."""
+        for seq, event_id, _ in self._events:
+            if event_id == last_event_id:
+                return seq
+        return None
+
+    def subscribe(self, last_event_id=None, heartbeat=HEARTBEAT):
+        """Yield SSE-formatted strings until the client disconnects."""
+        # Sent straight away so the server flushes headers and the browser
+        # treats the connection as open; also sets the reconnect delay.
+        yield f"retry: {RETRY_MS}\n\n"
+        with self._cond:
+            position = self._seq
+            resumed = self._position(last_event_id) if last_event_id else position
+        if resumed is None:
+            yield RESET_EVENT
+        else:
+            position = resumed
+        while True:
+            with self._cond:
+                if self._seq == position:
+                    self._cond.wait(heartbeat)
+                # Events after `position` were evicted from the backlog while
+                # this client was slow; it must reload history instead.
+                missed = bool(self._events) and self._events[0][0] > position + 1
+                pending = [] if missed else [e for e in self._events if e[0] > position]
+                position = self._seq
+            if missed:
+                yield RESET_EVENT
+            elif not pending:
+                yield ": keep-alive\n\n"
+            for _, event_id, data in pending:
+                yield f"id: {event_id}\nevent: roll\ndata: {data}\n\n"
+
+
+class CappedCollectionRelay:
+    """Share published rolls between worker processes via a capped collection."""
+
+    def __init__(self, db, broker, name="roll_events", size_bytes=1 << 20):
+        self.db = db
+        self.name = name
+        self.size_bytes = size_bytes
+        self.broker = broker
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def collection(self):
+        return self.db[self.name]
+
+    def _ensure_collection(self):
+        try:
+            self.db.create_collection(self.name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # already exists
+
+    def start(self):
+        """Start this process's tailing thread if it is not running."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Read the current tail position before returning, so a roll
+            # published right after this call is not skipped.
+            last_id = None
+            try:
+                self._ensure_collection()
+                newest = self.collection.find_one(sort=[("$natural", -1)])
+                last_id = newest["_id"] if newest else None
+            except PyMongoError as e:
+                log.warning("Roll feed tail error: %s", e)
+            threading.Thread(
+                target=self._tail, args=(last_id,), name="roll-feed-tail", daemon=True
+            ).start()
+
+    def publish(self, payload):
+        self.start()
+        self.collection.insert_one({"payload": payload})
+
+    def _tail(self, last_id):
+        while True:
+            try:
+                self._ensure_collection()
+                query = {"_id": {"$gt": last_id}} if last_id else {}
+                cursor = self.collection.find(
+                    query, cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    for doc in cursor:
+                        last_id = doc["_id"]
+                        self.broker.publish(doc["payload"], event_id=str(last_id))
+            except PyMongoError as e:
+                log.warning("Roll feed tail error: %s", e)
+            time.sleep(1)
+
+
+class AsyncRelayPublisher:
+    """Publish rolls to a `CappedCollectionRelay` from an asyncio database."""
+
+    def __init__(self, db, name="roll_events", size_bytes=1 << 20):
+        self.db = db
+        self.name = name
+        self.size_bytes = size_bytes
+        self._ready = False
+
+    async def publish(self, payload):
+        if not self._ready:
+            # An insert into a missing collection would create it uncapped
+            try:
+                await self.db.create_collection(
+                    self.name, capped=True, size=self.size_bytes
+                )
+            except CollectionInvalid:
+                pass  # already exists
+            self._ready = True
+        await self.db[self.name].insert_one({"payload": payload})
@@ -0,0 +1,158 @@
+"""Compact storage schema for roll documents in MongoDB.
+
+The app builds and reads rolls in one logical shape (see `make_roll_doc`):
+``dice_type`` as ``"3xd6"``, ``roll_result`` as ``"4,2,6"`` and the proof
+and seeds as hex strings. Stored like that, most of a roll's bytes are
+text: hex doubles the size of every digest, and the dice and faces are
+strings that are split again whenever they are used.
+
+Version 1 of the stored schema, marked ``"v": 1``, keeps every other field
+as it is and changes these:
+
+* ``dice_type`` becomes integer ``count`` and ``sides``; expression rolls
+  whose ``dice_type`` repeats their ``expression`` keep only the latter;
+* ``roll_result`` becomes ``faces``, BSON binary with one byte per face,
+  or an int array if a face is above 255;
+* ``proof``, ``server_seed`` and ``client_seed`` become BSON binary when
+  they are lowercase hex, as every generated value is. Anything else, such
+  as a client seed chosen for a session, stays a string, and so does any
+  value that would not convert back exactly.
+
+`MongoRollStore` writes documents through `encode_roll` (unless
+``ROLL_SCHEMA=legacy``) and reads every document through `decode_roll`,
+which passes documents without ``v`` through unchanged. A collection can
+therefore hold both shapes, while scripts/migrate_rolls.py rewrites it in
+place. `stored_fields` and `dice_type_query` translate projections and
+history filters to match either shape.
+"""
+
+import re
+
+SCHEMA_VERSION = 1
+COMPACT = "compact"
+LEGACY = "legacy"
+SCHEMAS = (COMPACT, LEGACY)
+
+HEX_FIELDS = ("proof", "server_seed", "client_seed")
+# Stored fields that a logical field is rebuilt from
+STORED_AS = {"dice_type": ("count", "sides", "expression"), "roll_result": ("faces",)}
+# Migration state, one document per roll collection (see migrate_rolls.py)
+STATE_COLLECTION = "roll_schema"
+
+_DICE = re.compile(r"([1-9][0-9]*)xd([1-9][0-9]*)")
+_DIE = re.compile(r"d([1-9][0-9]*)")
+
+
+def pack_hex(value):
+    """Bytes (BSON binary) for a lowercase hex string; anything else as is."""
+    if isinstance(value, str) and not len(value) % 2:
+        try:
+            packed = bytes.fromhex(value)
+        except ValueError:
+            return value
+        if packed.hex() == value:
+            return packed
+    return value
+
+
+def pack_faces(roll_result):
+    """``faces`` for a stored result string, or None if it would not round-trip."""
+    try:
+        faces = list(map(int, roll_result.split(",")))
+    except (AttributeError, ValueError):
+        return None
+    if ",".join(map(str, faces)) != roll_result:
+        return None
+    if max(faces) <= 0xFF and min(faces) >= 0:
+        return bytes(faces)
+    return faces
+
+
+def encode_roll(doc):
+    """The stored form of a logical roll document (a new dict)."""
+    stored = dict(doc)
+    stored["v"] = SCHEMA_VERSION
+    dice_type = doc.get("dice_type")
+    expression = doc.get("expression")
+    if expression and dice_type == expression:
+        del stored["dice_type"]
+    elif isinstance(dice_type, str):
+        match = _DICE.fullmatch(dice_type)
+        if match:
+            del stored["dice_type"]
+            stored["count"], stored["sides"] = map(int, match.groups())
+    if "roll_result" in doc:
+        faces = pack_faces(doc["roll_result"])
+        if faces is not None:
+            del stored["roll_result"]
+            stored["faces"] = faces
+    for name in HEX_FIELDS:
+        if name in stored:
+            stored[name] = pack_hex(stored[name])
+    return stored
+
+
+def decode_roll(doc):
+    """The logical form of a stored roll document of either shape, in place."""
+    if doc is None or "v" not in doc:
+        return doc
+    version = doc.pop("v")
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported roll schema version: {version}")
+    faces = doc.pop("faces", None)
+    if faces is not None:
+        doc["roll_result"] = ",".join(map(str, faces))
+    sides = doc.pop("sides", None)
+    count = doc.pop("count", None)
+    if sides is not None:
+        doc["dice_type"] = f"{count}xd{sides}"
+    elif "dice_type" not in doc and doc.get("expression"):
+        doc["dice_type"] = doc["expression"]
+    for name in HEX_FIELDS:
+        value = doc.get(name)
+        if isinstance(value, bytes):
+            doc[name] = value.hex()
+    return doc
+
+
+def stored_fields(fields):
+    """A projection of logical field names, extended for either stored shape."""
+    if not fields:
+        return fields
+    stored = dict(fields)
+    stored["v"] = 1
+    for name, sources in STORED_AS.items():
+        if stored.get(name):
+            stored.update(dict.fromkeys(sources, 1))
+    return stored
+
+
+def dice_type_query(dice_type, legacy=True):
+    """History filter for ``"3xd6"``, or any number of a bare ``"d6"``.
+
+    Matches compact documents by ``count``/``sides``, and legacy documents
+    by their ``dice_type`` string unless `legacy` is False.
+    """
+    if "x" in dice_type:
+        text = {"dice_type": dice_type}
+        match = _DICE.fullmatch(dice_type)
+        compact = match and {"count": int(match[1]), "sides": int(match[2])}
+    else:
+        text = {"dice_type": {"$regex": f"^[0-9]+x{re.escape(dice_type)}$"}}
+        match = _DIE.fullmatch(dice_type)
+        compact = match and {"sides": int(match[1])}
+    if not compact:
+        # Only an unusual dice_type, which is stored as a string either way
+        return text
+    if not legacy:
+        return compact
+    return {"$or": [text, compact]}
+
+
+def legacy_documents(db, collection="dice_rolls"):
+    """Whether a roll collection may still hold documents without ``v``.
+
+    True until migrate_rolls.py has finished with the collection.
+    """
+    state = db[STATE_COLLECTION].find_one({"_id": collection})
+    return state is None or state.get("legacy_documents", True)
@@ -0,0 +1,258 @@
+"""Running fairness statistics, updated as rolls are made.
+
+`RollStats.record` is called by the roll endpoints with each roll's die and
+faces. It adds to flat counters per die type in three kinds of bucket:
+
+* ``minute`` buckets, kept for the last hour,
+* ``hour`` buckets, kept for the last day,
+* one ``all`` bucket for all time.
+
+Counters are face counts (``face_<n>``), face counts per position within a
+roll (``pos_<i>_<n>``, first `MAX_POSITIONS` dice), ``rolls``, ``faces``,
+``sum``, ``sum_sq`` and lag-1 pair sums between consecutive faces
+(``lag_pairs``, ``lag_products``, ``lag_first``, ``lag_second``).
+
+Pending increments are flushed to the roll store's stats collection every
+`flush_interval` seconds by a background thread. The store only ever adds
+to counters, so every gunicorn worker flushes its own increments into the
+same documents. `snapshot` merges the stored buckets (re-read at most once
+per `cache_ttl` seconds) with this worker's unflushed increments; the cost
+depends on the number of buckets and faces, not on the number of rolls.
+"""
+
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from fairness import MAX_POSITIONS, chi_square, die_sides, normal_two_sided
+from storage import StorageError
+
+log = logging.getLogger(__name__)
+
+# window name -> (bucket period, bucket seconds, window seconds)
+WINDOWS = {
+    "hour": ("minute", 60, 3600),
+    "day": ("hour", 3600, 86400),
+    "all": ("all", None, None),
+}
+
+
+def _bucket(period_seconds, now):
+    return int(now // period_seconds * period_seconds) if period_seconds else 0
+
+
+class RollStats:
+    def __init__(self, store, flush_interval=10.0, cache_ttl=5.0, clock=time.time):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        self._pending = defaultdict(Counter)  # (die, period, bucket) -> counters
+        self._last_face = {}  # die -> last face recorded by this worker
+        self._loaded = {}  # window -> (loaded_at, docs)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def start(self):
+        """Start the flusher for this process (after fork, too)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Increments inherited from the parent are its to flush
+            self._pending.clear()
+        threading.Thread(target=self._run, name="roll-stats", daemon=True).start()
+        atexit.register(self.flush)
+
+    # --------------------------------------------------------------- record
+
+    def record(self, die, faces):
+        """Count one roll of `die` (e.g. ``"d6"``) with the given faces."""
+        if not faces:
+            return
+        self.start()
+        counters = Counter()
+        counters["rolls"] = 1
+        counters["faces"] = len(faces)
+        counters["sum"] = sum(faces)
+        counters["sum_sq"] = sum(f * f for f in faces)
+        for position, face in enumerate(faces):
+            counters[f"face_{face}"] += 1
+            if position < MAX_POSITIONS:
+                counters[f"pos_{position}_{face}"] += 1
+        now = self.clock()
+        with self._lock:
+            previous = self._last_face.get(die)
+            sequence = faces if previous is None else [previous, *faces]
+            self._last_face[die] = faces[-1]
+            if len(sequence) > 1:
+                counters["lag_pairs"] = len(sequence) - 1
+                counters["lag_first"] = sum(sequence[:-1])
+                counters["lag_second"] = sum(sequence[1:])
+                counters["lag_products"] = sum(
+                    a * b for a, b in zip(sequence, sequence[1:])
+                )
+            for period, seconds, _ in WINDOWS.values():
+                self._pending[(die, period, _bucket(seconds, now))].update(counters)
+
+    # ---------------------------------------------------------------- flush
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Keep flushing; the next round retries whatever is pending
+                log.exception("Roll stats flush crashed")
+
+    def flush(self):
+        """Write pending increments to the store and prune expired buckets."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(Counter)
+        if not pending:
+            return
+        updates = {key: dict(counters) for key, counters in pending.items()}
+        try:
+            self.store.increment_stats(updates)
+        except StorageError as e:
+            log.warning("Roll stats flush failed, will retry: %s", e)
+            self.flush_errors += 1
+            with self._lock:
+                for key, counters in pending.items():
+                    self._pending[key].update(counters)
+            return
+        self.flushes += 1
+        # Make the flushed counts visible through the store on the next read
+        self._loaded.clear()
+        # The counts are written; a failed prune is simply retried next time
+        now = self.clock()
+        try:
+            for period, seconds, window in WINDOWS.values():
+                if window:
+                    self.store.prune_stats(period, _bucket(seconds, now - window))
+        except StorageError as e:
+            log.warning("Roll stats prune failed: %s", e)
+            self.flush_errors += 1
+
+    # ------------------------------------------------------------- snapshot
+
+    def _stored(self, window):
+        period, seconds, length = WINDOWS[window]
+        now = self.clock()
+        cached = self._loaded.get(window)
+        if cached is None or now - cached[0] > self.cache_ttl:
+            since = _bucket(seconds, now - length) if length else 0
+            cached = self._loaded[window] = (now, self.store.load_stats(period, since))
+        return cached[1]
+
+    def totals(self, window):
+        """Return ``{die: Counter}`` of merged counters for a window."""
+        period, seconds, length = WINDOWS[window]
+        since = _bucket(seconds, self.clock() - length) if length else 0
+        totals = defaultdict(Counter)
+        for doc in self._stored(window):
+            counters = {
+                k: v for k, v in doc.items() if k not in ("die", "period", "bucket")
+            }
+            totals[doc["die"]].update(counters)
+        with self._lock:
+            for (die, p, bucket), counters in self._pending.items():
+                if p == period and bucket >= since:
+                    totals[die].update(counters)
+        return totals
+
+    def snapshot(self, window="all"):
+        """Live fairness statistics per die type for a window.
+
+        Counters stored under a die outside `provably_fair.DICE_SIDES` are
+        logged and left out.
+        """
+        out = {}
+        for die, counters in sorted(self.totals(window).items()):
+            try:
+                out[die] = describe(die, counters)
+            except ValueError as e:
+                log.warning("Skipping roll stats for %r: %s", die, e)
+        return out
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending_buckets": pending,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
+
+
+def describe(die, counters):
+    """Turn merged counters for one die into entropy, chi-square and moments."""
+    sides = die_sides(die)
+    n = counters.get("faces", 0)
+    faces = np.array([counters.get(f"face_{f}", 0) for f in range(1, sides + 1)])
+    out = {
+        "rolls": counters.get("rolls", 0),
+        "faces": n,
+        "face_counts": faces.tolist(),
+    }
+    if not n:
+        return out
+    probs = faces / n
+    nonzero = probs[probs > 0]
+    mean = counters["sum"] / n
+    variance = counters["sum_sq"] / n - mean * mean
+    statistic, df, p_value = chi_square(
+        faces.astype(np.float64), np.full(sides, n / sides)
+    )
+    out.update(
+        {
+            "entropy": float(-(nonzero * np.log2(nonzero)).sum()),
+            "ideal_entropy": math.log2(sides),
+            "mean": mean,
+            "expected_mean": (sides + 1) / 2,
+            "variance": variance,
+            "expected_variance": (sides * sides - 1) / 12,
+            "chi_square": {"statistic": statistic, "df": df, "p_value": p_value},
+        }
+    )
+    pairs = counters.get("lag_pairs", 0)
+    if pairs > 2 and variance > 0:
+        covariance = (
+            counters["lag_products"]
+            - mean * (counters["lag_first"] + counters["lag_second"])
+            + pairs * mean * mean
+        ) / pairs
+        r = covariance / variance
+        out["serial_correlation"] = {
+            "lag": 1,
+            "r": r,
+            "p_value": normal_two_sided(r * math.sqrt(pairs)),
+        }
+    positions = []
+    for position in range(MAX_POSITIONS):
+        counts = np.array(
+            [counters.get(f"pos_{position}_{f}", 0) for f in range(1, sides + 1)]
+        )
+        total = int(counts.sum())
+        if not total:
+            break
+        expected = np.full(sides, total / sides)
+        _, _, p = chi_square(counts.astype(np.float64), expected)
+        positions.append({"position": position, "faces": total, "p_value": p})
+    p_values = [p_value]
+    if "serial_correlation" in out:
+        p_values.append(out["serial_correlation"]["p_value"])
+    if len(positions) > 1:
+        out["position_bias"] = positions
+        p_values.extend(entry["p_value"] for entry in positions)
+    out["min_p_value"] = min(p_values)
+    return out
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""archive_rolls.py
+
+Export stored rolls into a columnar roll archive (see `roll_archive.py`)
+for the analysis scripts, appending only rolls not exported before.
+
+Usage:
+    python scripts/archive_rolls.py rolls.archive [table ...] [--db sqlite:///dice_fairness.db]
+    python scripts/archive_rolls.py rolls.archive --store mongodb://localhost:27017/ [--source store]
+    python scripts/archive_rolls.py rolls.archive --compact
+    python scripts/archive_rolls.py rolls.archive --info
+
+Without `--store` the named tables of the local SQLite database written by
+loadgen.py and roll_once.py are exported (default: every table), each as
+a source named after its table. With `--store` the rolls of that roll
+store are exported as one source (`--source`, default "store"). Each run
+parses the new rows once and appends them as a new segment; run it after
+loadgen.py or from cron next to roll_once.py to keep the archive current.
+
+`--compact` rewrites each source's segments as one, so many small
+incremental runs do not leave many small files. `--info` prints what the
+archive holds.
+
+Analysis scripts read the archive with `--archive rolls.archive`:
+
+    python scripts/entropy_test.py large_fast_rolls --archive rolls.archive
+    python scripts/plot_entropy_arc.py large_fast_rolls --archive rolls.archive
+    python scripts/plot_fairness.py --archive rolls.archive
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import dataset
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rollstream import CHUNK_ROWS, read_chunks  # noqa: E402
+
+from provably_fair import parse_dice_type  # noqa: E402
+from roll_archive import ArchiveWriter, RollArchive, sides_of  # noqa: E402
+from storage import open_store  # noqa: E402
+
+DB_URL = "sqlite:///dice_fairness.db"
+TABLE_COLUMNS = (
+    "dice_type",
+    "dice_count",
+    "modifier",
+    "result",
+    "proof",
+    "block_num",
+    "timestamp",
+)
+FIELDS = {
+    "dice_type": 1,
+    "roll_result": 1,
+    "proof": 1,
+    "modifier": 1,
+    "block_num": 1,
+    "timestamp": 1,
+    "expression": 1,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Export rolls to a columnar archive")
+    p.add_argument("archive", help="archive directory (created if missing)")
+    p.add_argument("tables", nargs="*", help="SQLite tables (default: all)")
+    p.add_argument("--db", default=DB_URL, help=f"SQLAlchemy DB URL ({DB_URL})")
+    p.add_argument("--store", help="export a roll store URL instead of SQLite tables")
+    p.add_argument("--source", default="store", help="source name for --store")
+    p.add_argument("--chunk", type=int, default=CHUNK_ROWS, help="rows per chunk")
+    p.add_argument("--compact", action="store_true", help="merge segments per source")
+    p.add_argument("--info", action="store_true", help="describe the archive")
+    return p.parse_intermixed_args()
+
+
+def export_table(writer, db_url, table, chunk_rows):
+    """Append a roll_* script table's rows after the last exported id."""
+    after = writer.cursor(table) or 0
+    exported = 0
+    for rows in read_chunks(db_url, table, TABLE_COLUMNS, after, chunk_rows=chunk_rows):
+        writer.add(
+            table,
+            [
+                (sides_of(die or "d6"), count, modifier, result, proof, block, ts)
+                for _, die, count, modifier, result, proof, block, ts in rows
+            ],
+            cursor=rows[-1][0],
+        )
+        exported += len(rows)
+    return exported
+
+
+def store_row(doc):
+    if doc.get("expression"):
+        sides, count = 0, None
+    else:
+        try:
+            die, count = parse_dice_type(doc.get("dice_type") or "")
+        except ValueError:
+            die, count = None, None
+        sides = sides_of(die)
+    return (
+        sides,
+        count,
+        doc.get("modifier"),
+        doc.get("roll_result"),
+        doc.get("proof"),
+        doc.get("block_num"),
+        doc.get("timestamp"),
+    )
+
+
+def export_store(writer, store, source, chunk_rows):
+    """Append a roll store's rolls after the last exported ``_id``."""
+    exported = 0
+    chunk = []
+    docs = store.stream_all(
+        after_id=writer.cursor(source), batch_size=chunk_rows, fields=FIELDS
+    )
+    for doc in docs:
+        chunk.append(doc)
+        if len(chunk) >= chunk_rows:
+            writer.add(source, [store_row(d) for d in chunk], str(chunk[-1]["_id"]))
+            exported += len(chunk)
+            chunk = []
+    if chunk:
+        writer.add(source, [store_row(d) for d in chunk], str(chunk[-1]["_id"]))
+        exported += len(chunk)
+    return exported
+
+
+def info(path) -> None:
+    archive = RollArchive(path)
+    print(f"{'source':<24} {'segments':>8} {'rolls':>14} {'faces':>16} {'MiB':>9}")
+    for source in archive.sources:
+        segments = archive.select(source)
+        rolls = sum(len(s) for s in segments)
+        faces = sum(s.faces for s in segments)
+        size = sum(s.nbytes() for s in segments) / 2**20
+        print(f"{source:<24} {len(segments):>8} {rolls:>14,} {faces:>16,} {size:>9.1f}")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.info:
+        info(args.archive)
+        return
+    started = time.perf_counter()
+    with ArchiveWriter(args.archive) as writer:
+        if args.compact:
+            for source in RollArchive(args.archive).sources:
+                writer.compact(source)
+            exported = {}
+        elif args.store:
+            store = open_store(args.store)
+            exported = {
+                args.source: export_store(writer, store, args.source, args.chunk)
+            }
+        else:
+            tables = args.tables or dataset.connect(args.db).tables
+            exported = {
+                table: export_table(writer, args.db, table, args.chunk)
+                for table in tables
+            }
+    for source, rows in exported.items():
+        skipped = writer.skipped[source]
+        note = f" ({skipped:,} without valid faces skipped)" if skipped else ""
+        print(f"{source}: {rows:,} new rolls{note}")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""bench_archive.py
+
+Face counting from SQLite tables versus a columnar roll archive.
+
+Usage:
+    python scripts/bench_archive.py [--rolls 1000000] [--dice 3]
+                                    [--archive-faces 100000000]
+
+Builds a temporary roll_* style SQLite table of `--rolls` rolls of
+`--dice` d6 and times:
+
+* ``sqlite`` — `scan_table`, what entropy_test.py and plot_entropy_arc.py
+  run on every invocation (one worker);
+* ``export`` — the one-off `archive_rolls.py` export of the table;
+* ``archive`` — `scan_archive` over the exported archive.
+
+Then a synthetic archive of `--archive-faces` faces is written straight
+from NumPy (no SQLite) and counted by `scan_archive` (entropy_test.py) and
+by the roll totals of plot_fairness.py. Peak Python-heap use (tracemalloc,
+which also sees NumPy buffers, on a second untimed call) is shown next to
+each timing; the memory-mapped columns themselves live in the page cache.
+"""
+
+import argparse
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rollstream import scan_archive, scan_table  # noqa: E402
+
+from roll_archive import (  # noqa: E402
+    DIGEST_SIZE,
+    ROLL_CHUNK,
+    ArchiveWriter,
+    RollArchive,
+)
+
+TABLE = "bench_rolls"
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="SQLite vs roll archive analysis")
+    p.add_argument("--rolls", type=int, default=1_000_000, help="SQLite table rolls")
+    p.add_argument("--dice", type=int, default=3, help="d6 per roll")
+    p.add_argument(
+        "--archive-faces",
+        type=int,
+        default=100_000_000,
+        help="faces in the synthetic archive (0: skip)",
+    )
+    return p.parse_args()
+
+
+def measured(fn, setup=None):
+    """``(result, seconds, peak MiB)``: a timed call, then a traced one.
+
+    tracemalloc slows allocation-heavy code down several times, so the
+    peak comes from a second call; `setup` runs before each.
+    """
+    if setup:
+        setup()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def report(name, faces, elapsed, peak):
+    print(
+        f"{name:<24} {faces:>13,} {elapsed:>9.2f} {faces / elapsed:>14,.0f}"
+        f" {peak:>9.1f}"
+    )
+
+
+def make_table(path, rolls, dice):
+    rng = random.Random(0)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        f"CREATE TABLE {TABLE} (id INTEGER PRIMARY KEY, dice_type TEXT,"
+        " dice_count INTEGER, modifier INTEGER, result TEXT, proof TEXT,"
+        " block_num INTEGER)"
+    )
+    batch = 100_000
+    for start in range(0, rolls, batch):
+        conn.executemany(
+            f"INSERT INTO {TABLE} (dice_type, dice_count, modifier, result, proof,"
+            " block_num) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    "d6",
+                    dice,
+                    0,
+                    ",".join(str(rng.randint(1, 6)) for _ in range(dice)),
+                    f"{rng.getrandbits(256):064x}",
+                    90_000_000 + i // 20,
+                )
+                for i in range(start, min(start + batch, rolls))
+            ),
+        )
+    conn.commit()
+    conn.close()
+
+
+def synthetic_archive(path, faces, dice):
+    rng = np.random.default_rng(0)
+    rolls = faces // dice
+    with ArchiveWriter(path) as writer:
+        for start in range(0, rolls, ROLL_CHUNK):
+            n = min(ROLL_CHUNK, rolls - start)
+            columns = {
+                "faces": rng.integers(1, 7, n * dice, dtype=np.uint8),
+                "lengths": np.full(n, dice, dtype=np.int64),
+                "sides": np.full(n, 6),
+                "count": np.full(n, dice),
+                "modifier": np.zeros(n),
+                "block_num": 90_000_000 + np.arange(start, start + n) // 20,
+                "timestamp": np.zeros(n),
+                "digest": np.zeros((n, DIGEST_SIZE)),
+            }
+            writer.add_columns("synthetic", columns)
+
+
+def roll_totals(path):
+    counts = np.zeros(0, dtype=np.int64)
+    for segment in RollArchive(path).segments:
+        for totals, _, _ in segment.totals():
+            more = np.bincount(totals)
+            if len(more) > len(counts):
+                more[: len(counts)] += counts
+                counts = more
+            else:
+                counts[: len(more)] += more
+    return counts
+
+
+def main() -> None:
+    from archive_rolls import export_table
+
+    args = parse_args()
+    print(f"{'':<24} {'faces':>13} {'seconds':>9} {'faces/sec':>14} {'peak MiB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "rolls.db"
+        db_url = f"sqlite:///{db_path}"
+        archive = Path(tmp) / "rolls.archive"
+        make_table(db_path, args.rolls, args.dice)
+        faces = args.rolls * args.dice
+
+        counts, elapsed, peak = measured(lambda: scan_table(db_url, TABLE))
+        report("sqlite scan_table", counts.total, elapsed, peak)
+
+        def export():
+            with ArchiveWriter(archive) as writer:
+                export_table(writer, db_url, TABLE, 50_000)
+
+        _, elapsed, peak = measured(
+            export, setup=lambda: shutil.rmtree(archive, ignore_errors=True)
+        )
+        report("export (once)", faces, elapsed, peak)
+        archived, elapsed, peak = measured(lambda: scan_archive(archive, TABLE))
+        report("archive scan_archive", archived.total, elapsed, peak)
+        if not np.array_equal(archived.counts, counts.counts):
+            raise SystemExit("archive counts differ from the SQLite table")
+
+        if args.archive_faces:
+            big = Path(tmp) / "synthetic.archive"
+            synthetic_archive(big, args.archive_faces, args.dice)
+            faces = RollArchive(big).segments[0].faces
+            counts, elapsed, peak = measured(lambda: scan_archive(big, "synthetic"))
+            report("synthetic scan_archive", counts.total, elapsed, peak)
+            totals, elapsed, peak = measured(lambda: roll_totals(big))
+            report("synthetic roll totals", faces, elapsed, peak)
+
+
+if __name__ == "__main__":
+    main()
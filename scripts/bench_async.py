@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""bench_async.py
+
+Compare the sync (Flask, one thread per request) and async (asgi.py) roll
+paths at high concurrency.
+
+Usage:
+    python scripts/bench_async.py [--concurrency 200] [--total 5000] [--dice 3]
+                                  [--store-latency 0.005] [--hive-latency 0.05]
+
+Runs in one process without MongoDB or a Hive node: both paths use the
+in-memory store behind an insert that takes `--store-latency` seconds
+(`time.sleep` for the sync path, `asyncio.sleep` for the async one, as the
+blocking and asyncio Mongo drivers would wait), and a stand-in
+`nectar.blockchain.Blockchain` whose head-block fetch takes
+`--hive-latency` seconds.
+
+The sync path is driven by `--concurrency` threads through Flask's test
+client, the async path by as many tasks calling the ASGI app directly, so
+neither pays for HTTP parsing. Each run starts cold with a burst of
+`--concurrency` rolls, which shows whether they were seeded from a Hive
+block or fell back to random seeds, then `--total` rolls are timed.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage import MemoryRollStore  # noqa: E402
+
+HIVE_LATENCY = 0.05
+SETTINGS = {
+    "ROLL_FEED_BACKEND": "memory",
+    "WRITE_BEHIND": False,
+    "ROLL_STATS_FLUSH_INTERVAL": 3600.0,
+}
+
+
+class FakeBlockchain:
+    """Offline stand-in for `nectar.blockchain.Blockchain`."""
+
+    def __init__(self, *args, **kwargs):
+        self.block_num = 90_000_000
+
+    def get_current_block(self):
+        time.sleep(HIVE_LATENCY)
+        self.block_num += 1
+        return {
+            "id": self.block_num,
+            "block_id": f"{self.block_num:040x}",
+            "transaction_merkle_root": f"{self.block_num * 7:040x}",
+        }
+
+
+def install_fake_nectar():
+    nectar = types.ModuleType("nectar")
+    nectar.blockchain = types.ModuleType("nectar.blockchain")
+    nectar.blockchain.Blockchain = FakeBlockchain
+    sys.modules["nectar"] = nectar
+    sys.modules["nectar.blockchain"] = nectar.blockchain
+
+
+class SlowMemoryStore(MemoryRollStore):
+    """Memory store whose inserts block like a round-trip to MongoDB."""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+
+    def insert_many(self, docs, ignore_duplicates=False):
+        time.sleep(self.latency)
+        return super().insert_many(docs, ignore_duplicates)
+
+
+class AsyncSlowStore:
+    """Async insert path that awaits like `AsyncMongoClient` would."""
+
+    def __init__(self, latency):
+        self.store = MemoryRollStore()
+        self.latency = latency
+
+    async def insert(self, doc):
+        await asyncio.sleep(self.latency)
+        return self.store.insert(doc)
+
+    async def close(self):
+        pass
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Sync vs async roll path benchmark")
+    p.add_argument("--concurrency", type=int, default=200, help="rolls in flight")
+    p.add_argument("--total", type=int, default=5000, help="timed rolls per path")
+    p.add_argument("--dice", type=int, default=3, help="d6 per roll")
+    p.add_argument("--store-latency", type=float, default=0.005, help="seconds")
+    p.add_argument("--hive-latency", type=float, default=HIVE_LATENCY, help="seconds")
+    return p.parse_args()
+
+
+# ------------------------------------------------------------- sync path
+
+
+def run_sync(args):
+    import app
+
+    flask_app = app.create_app(
+        {**SETTINGS, "ROLL_STORE": SlowMemoryStore(args.store_latency)}
+    )
+    body = {"dice_type": "d6", "dice_count": args.dice}
+    local = threading.local()
+
+    def roll(_):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = flask_app.test_client()
+        t0 = time.perf_counter()
+        resp = client.post("/api/roll", json=body)
+        elapsed = time.perf_counter() - t0
+        if resp.status_code != 200:
+            raise SystemExit(f"sync POST /api/roll: HTTP {resp.status_code}")
+        return elapsed, resp.get_json()["block_num"]
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        burst = list(pool.map(roll, range(args.concurrency)))
+        started = time.perf_counter()
+        timed = list(pool.map(roll, range(args.total)))
+        wall = time.perf_counter() - started
+    provider = flask_app.extensions["dice"].seed_provider
+    return burst, timed, wall, provider.stats()
+
+
+# ------------------------------------------------------------ async path
+
+
+async def asgi_call(asgi_app, method, path, payload):
+    sent = []
+    messages = [
+        {
+            "type": "http.request",
+            "body": json.dumps(payload).encode(),
+            "more_body": False,
+        }
+    ]
+
+    async def receive():
+        return messages.pop() if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    await asgi_app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+async def run_async_rolls(args):
+    import asgi
+
+    asgi_app = asgi.create_asgi_app(
+        {**SETTINGS, "ROLL_STORE": "memory://"},
+        async_store=AsyncSlowStore(args.store_latency),
+    )
+    body = {"dice_type": "d6", "dice_count": args.dice}
+
+    async def roll():
+        t0 = time.perf_counter()
+        status, payload = await asgi_call(asgi_app, "POST", "/api/roll", body)
+        elapsed = time.perf_counter() - t0
+        if status != 200:
+            raise SystemExit(f"async POST /api/roll: HTTP {status}")
+        return elapsed, payload["block_num"]
+
+    async def worker(count, out):
+        for _ in range(count):
+            out.append(await roll())
+
+    burst = await asyncio.gather(*(roll() for _ in range(args.concurrency)))
+    timed = []
+    per_worker, extra = divmod(args.total, args.concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(worker(per_worker + (i < extra), timed) for i in range(args.concurrency))
+    )
+    wall = time.perf_counter() - started
+    return burst, timed, wall, asgi_app.service.seed_status()
+
+
+def run_async(args):
+    return asyncio.run(run_async_rolls(args))
+
+
+# ------------------------------------------------------------- reporting
+
+
+def report(name, burst, timed, wall, seed_stats):
+    latency = np.array([elapsed for elapsed, _ in timed]) * 1000
+    p50, p99 = np.percentile(latency, [50, 99])
+    seeded = sum(block_num is not None for _, block_num in burst)
+    print(
+        f"{name:<6} {len(timed) / wall:>10,.0f} {p50:>9.2f} {p99:>9.2f}"
+        f" {seeded:>7}/{len(burst):<7} {seed_stats.get('refreshes', 0):>9}"
+    )
+
+
+def main() -> None:
+    global HIVE_LATENCY
+    args = parse_args()
+    HIVE_LATENCY = args.hive_latency
+    install_fake_nectar()
+    import app
+
+    app.logging.getLogger().setLevel("WARNING")
+    print(
+        f"{args.concurrency} in flight, {args.total} rolls of {args.dice}d6,"
+        f" {args.store_latency * 1000:g} ms inserts,"
+        f" {args.hive_latency * 1000:g} ms head-block fetches"
+    )
+    print(
+        f"{'path':<6} {'rolls/sec':>10} {'p50 ms':>9} {'p99 ms':>9}"
+        f" {'cold burst block-seeded':>23} {'fetches':>9}"
+    )
+    report("sync", *run_sync(args))
+    report("async", *run_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""bench_engine.py
+
+Compare the scalar `provably_fair_roll` loop with the vectorized NumPy engine
+in `roll_engine.py` at 10^3 ... 10^N rolls.
+
+Usage:
+    python scripts/bench_engine.py [--max-exp 7] [--dice d6] [--count 3] [--algo v1]
+
+The scalar path is skipped above `--scalar-max-exp` (default 6) because it
+takes minutes at 10^7. Vectorized runs are processed in chunks of
+`--chunk` rolls to keep memory flat. Every size also spot-checks that both
+paths agree.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from provably_fair import provably_fair_roll  # noqa: E402
+from roll_engine import bulk_roll, digests_hex  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark scalar vs NumPy roll engine")
+    p.add_argument("--max-exp", type=int, default=6, help="largest size 10^N")
+    p.add_argument("--scalar-max-exp", type=int, default=6)
+    p.add_argument("--dice", default="d6", help="dice type (default: d6)")
+    p.add_argument("--count", type=int, default=3, help="dice per roll")
+    p.add_argument("--algo", default="v1", help="roll algorithm version")
+    p.add_argument("--chunk", type=int, default=1_000_000)
+    return p.parse_args()
+
+
+def seeds(start: int, stop: int):
+    server = [f"{i // 1000:032x}" for i in range(start, stop)]
+    client = [f"{i:024x}" for i in range(start, stop)]
+    return server, client, list(range(start, stop))
+
+
+def bench_scalar(args, n: int) -> float:
+    server, client, nonces = seeds(0, n)
+    t0 = time.perf_counter()
+    for s, c, nonce in zip(server, client, nonces):
+        provably_fair_roll(args.dice, args.count, s, c, nonce, args.algo)
+    return time.perf_counter() - t0
+
+
+def bench_vector(args, n: int) -> float:
+    elapsed = 0.0
+    for start in range(0, n, args.chunk):
+        server, client, nonces = seeds(start, min(n, start + args.chunk))
+        t0 = time.perf_counter()
+        bulk_roll(args.dice, args.count, server, client, nonces, args.algo)
+        elapsed += time.perf_counter() - t0
+    return elapsed
+
+
+def check_identical(args) -> None:
+    server, client, nonces = seeds(0, 1000)
+    faces, digests = bulk_roll(args.dice, args.count, server, client, nonces, args.algo)
+    proofs = digests_hex(digests)
+    for i in range(0, 1000, 7):
+        expected = provably_fair_roll(
+            args.dice, args.count, server[i], client[i], nonces[i], args.algo
+        )
+        if expected != (faces[i].tolist(), proofs[i]):
+            raise SystemExit(f"Mismatch at roll {i}: {expected}")
+
+
+def main() -> None:
+    args = parse_args()
+    check_identical(args)
+    print(f"\n{args.count}x{args.dice} ({args.algo}), rolls/sec")
+    print(f"{'rolls':>12} {'scalar':>14} {'numpy':>14} {'speedup':>9}")
+    for exp in range(3, args.max_exp + 1):
+        n = 10**exp
+        vector = n / bench_vector(args, n)
+        if exp <= args.scalar_max_exp:
+            scalar = n / bench_scalar(args, n)
+            print(
+                f"{n:>12,} {scalar:>14,.0f} {vector:>14,.0f} {vector / scalar:>8.1f}x"
+            )
+        else:
+            print(f"{n:>12,} {'-':>14} {vector:>14,.0f} {'-':>9}")
+
+
+if __name__ == "__main__":
+    main()
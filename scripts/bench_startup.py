@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""bench_startup.py
+
+Cold-start and first-request latency of the Flask app.
+
+Usage:
+    python scripts/bench_startup.py [--runs 7] [--hive-delay 0.3]
+                                    [--store memory://] [--ref HEAD~1]
+
+Each run is a fresh interpreter that loads the app one of two ways:
+
+* ``app`` — as a script or test would: ``import app``, then `create_app()`
+  (or the module-level `app` of trees from before the factory);
+* ``wsgi`` — as the server does: ``import wsgi``, which also preloads the
+  modules the views import lazily;
+
+then times the first and second `POST /api/roll` and the first
+`GET /api/rolls` through Flask's test client. Medians over `--runs` are
+printed per tree and entry point.
+
+A stand-in `nectar.blockchain.Blockchain` that sleeps `--hive-delay`
+seconds on connect and a tenth of that per head block is registered first,
+so the cost of reaching a Hive node shows up without one
+(`--hive-delay -1` leaves the real module, if installed, in place).
+
+With `--ref` the same runs are made against that git revision (extracted
+with ``git archive`` into a temporary directory) for a before/after table.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+ENTRY_POINTS = ("app", "wsgi")
+COLUMNS = ("import", "create", "first_roll", "second_roll", "first_history")
+
+CHILD = r"""
+import json, sys, time, types
+
+tree, delay, entry = sys.argv[1], float(sys.argv[2]), sys.argv[3]
+
+
+class Blockchain:
+    def __init__(self, *args, **kwargs):
+        time.sleep(delay)
+        self.block_num = 90_000_000
+
+    def get_current_block(self):
+        time.sleep(delay / 10)
+        self.block_num += 1
+        return {
+            "id": self.block_num,
+            "block_id": f"{self.block_num:040x}",
+            "transaction_merkle_root": f"{self.block_num * 7:040x}",
+        }
+
+
+if delay >= 0:
+    nectar = types.ModuleType("nectar")
+    nectar.blockchain = types.ModuleType("nectar.blockchain")
+    nectar.blockchain.Blockchain = Blockchain
+    sys.modules["nectar"] = nectar
+    sys.modules["nectar.blockchain"] = nectar.blockchain
+
+sys.path.insert(0, tree)
+timings = {}
+clock = time.perf_counter
+t = clock()
+if entry == "wsgi":
+    import wsgi
+
+    timings["import"] = clock() - t
+    t = clock()
+    flask_app = wsgi.app
+else:
+    import app
+
+    timings["import"] = clock() - t
+    t = clock()
+    flask_app = app.create_app() if hasattr(app, "create_app") else app.app
+timings["create"] = clock() - t
+client = flask_app.test_client()
+for name, method, url in (
+    ("first_roll", "POST", "/api/roll"),
+    ("second_roll", "POST", "/api/roll"),
+    ("first_history", "GET", "/api/rolls"),
+):
+    t = clock()
+    resp = client.open(url, method=method, json={"dice_type": "d6", "dice_count": 3})
+    timings[name] = clock() - t
+    if resp.status_code != 200:
+        raise SystemExit(f"{method} {url}: HTTP {resp.status_code}")
+print(json.dumps({k: v * 1000 for k, v in timings.items()}))
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Measure app startup latency")
+    p.add_argument("--runs", type=int, default=7, help="fresh processes per tree")
+    p.add_argument(
+        "--hive-delay",
+        type=float,
+        default=0.3,
+        help="seconds the fake Hive node takes to connect (-1: no fake)",
+    )
+    p.add_argument("--store", default="memory://", help="ROLL_STORE for the runs")
+    p.add_argument("--ref", help="also measure this git revision, e.g. HEAD~1")
+    return p.parse_args()
+
+
+def extract(ref: str, directory: str) -> None:
+    archive = subprocess.run(
+        ["git", "-C", str(REPO), "archive", "--format=tar", ref],
+        check=True,
+        capture_output=True,
+    ).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(directory, filter="data")
+
+
+def measure(tree, entry, args) -> dict:
+    """Median milliseconds per column over `args.runs` fresh processes."""
+    env = dict(
+        os.environ,
+        ROLL_STORE=args.store,
+        ROLL_STATS_FLUSH_INTERVAL="3600",
+        PYTHONDONTWRITEBYTECODE="1",
+    )
+    runs = []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(args.runs):
+            out = subprocess.run(
+                [sys.executable, "-c", CHILD, str(tree), str(args.hive_delay), entry],
+                cwd=cwd,
+                env=env,
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {col: statistics.median(run[col] for run in runs) for col in COLUMNS}
+
+
+def report(rows: dict) -> None:
+    print(f"{'tree':<22}" + "".join(f"{col + ' ms':>17}" for col in COLUMNS))
+    for name, result in rows.items():
+        print(f"{name:<22}" + "".join(f"{result[col]:>17.1f}" for col in COLUMNS))
+
+
+def main() -> None:
+    args = parse_args()
+    rows = {}
+    if args.ref:
+        with tempfile.TemporaryDirectory() as tree:
+            extract(args.ref, tree)
+            for entry in ENTRY_POINTS:
+                rows[f"{args.ref} {entry}"] = measure(tree, entry, args)
+    for entry in ENTRY_POINTS:
+        rows[f"working tree {entry}"] = measure(REPO, entry, args)
+    report(rows)
+
+
+if __name__ == "__main__":
+    main()
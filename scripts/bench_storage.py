@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""bench_storage.py
+
+Run the same roll workload against each storage backend and compare them.
+
+Usage:
+    python scripts/bench_storage.py [--rolls 5000] [--store URL ...]
+                                    [--schema compact|legacy|both]
+
+By default the in-memory store and a temporary SQLite database are
+benchmarked; add `--store mongodb://localhost:27017/` to include MongoDB (the
+rolls are written to a scratch `ultimate_dice_bench` database, which is
+dropped before each run). The workload is:
+
+1. single inserts (the synchronous `/api/roll` path),
+2. batched `insert_many` calls (the batch endpoint and write-behind flushes),
+3. random lookups by id (`/roll/<id>`),
+4. walking the whole history page by page (`/api/rolls?before=...`),
+5. filtered first pages, by label and by die, and
+6. streaming every roll in `_id` order (`verify_all.py`).
+
+First, the BSON size of the workload's documents in the legacy and compact
+stored schemas (roll_schema.py) is compared offline, with the time to
+convert between them. MongoDB runs once per `--schema` and then reports the
+collection's stats (document, storage and index sizes); with ``both``, the
+legacy run's collection is also migrated to the compact schema in place
+with migrate_rolls.py and measured again.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import bson
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from migrate_rolls import migrate  # noqa: E402
+
+from provably_fair import provably_fair_roll  # noqa: E402
+from roll_schema import COMPACT, LEGACY, decode_roll, encode_roll  # noqa: E402
+from storage import MongoRollStore, open_store  # noqa: E402
+
+BENCH_DATABASE = "ultimate_dice_bench"
+MONGO_SCHEMES = ("mongodb://", "mongodb+srv://")
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark roll storage backends")
+    p.add_argument("--rolls", type=int, default=5000, help="rolls per insert phase")
+    p.add_argument("--batch", type=int, default=500, help="insert_many batch size")
+    p.add_argument("--page", type=int, default=10, help="history page size")
+    p.add_argument(
+        "--store",
+        action="append",
+        help="store URL to benchmark (repeatable; default: memory and sqlite)",
+    )
+    p.add_argument(
+        "--schema",
+        choices=(COMPACT, LEGACY, "both"),
+        default="both",
+        help="stored roll schema(s) for MongoDB (default: both)",
+    )
+    return p.parse_args()
+
+
+def make_doc(i: int) -> dict:
+    server_seed, client_seed = f"{i // 20:032x}", f"{i:024x}"
+    results, proof = provably_fair_roll("d6", 3, server_seed, client_seed, i, "v2")
+    return {
+        "dice_type": "3xd6" if i % 2 else "1xd20",
+        "roll_result": ",".join(map(str, results)),
+        "proof": proof,
+        "server_seed": server_seed,
+        "client_seed": client_seed,
+        "nonce": i,
+        "algo": "v2",
+        "modifier": 0,
+        "block_num": 90_000_000 + i // 20,
+        "label": "bench" if i % 10 == 0 else None,
+        "timestamp": datetime.utcnow(),
+    }
+
+
+def timed(label: str, ops: int, fn) -> None:
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"  {label:<22} {ops / elapsed:>12,.0f} ops/sec  ({elapsed:.3f}s)")
+
+
+def schema_sizes(docs) -> None:
+    print("\nstored schema (offline)")
+    legacy = [bson.encode(d) for d in docs]
+    t0 = time.perf_counter()
+    compact = [encode_roll(d) for d in docs]
+    encode = time.perf_counter() - t0
+    compact = [bson.encode(d) for d in compact]
+    stored = [bson.decode(d) for d in compact]
+    t0 = time.perf_counter()
+    for d in stored:
+        decode_roll(d)
+    decode = time.perf_counter() - t0
+    before = sum(map(len, legacy)) / len(docs)
+    after = sum(map(len, compact)) / len(docs)
+    print(f"  {'legacy BSON':<22} {before:>12,.1f} bytes/doc")
+    print(
+        f"  {'compact BSON':<22} {after:>12,.1f} bytes/doc  ({after / before - 1:+.0%})"
+    )
+    print(f"  {'encode_roll':<22} {encode / len(docs) * 1e6:>12,.2f} us/doc")
+    print(f"  {'decode_roll':<22} {decode / len(docs) * 1e6:>12,.2f} us/doc")
+
+
+def collection_stats(store) -> None:
+    stats = store.db.command("collStats", store.collection.name)
+    for name in ("count", "avgObjSize", "size", "storageSize", "totalIndexSize"):
+        print(f"  {name:<22} {stats.get(name, 0):>12,}")
+
+
+def open_bench_store(url: str, schema: str):
+    if not url.startswith(MONGO_SCHEMES):
+        return open_store(url)
+    store = MongoRollStore(url, BENCH_DATABASE, schema=schema)
+    store.client.drop_database(BENCH_DATABASE)
+    return store
+
+
+def bench(url: str, args, schema: str = COMPACT):
+    mongo = url.startswith(MONGO_SCHEMES)
+    print(f"\n{url}" + (f" ({schema} schema)" if mongo else ""))
+    store = open_bench_store(url, schema)
+    store.ensure_indexes()
+    singles = [make_doc(i) for i in range(args.rolls)]
+    batched = [make_doc(args.rolls + i) for i in range(args.rolls)]
+    timed("insert", len(singles), lambda: [store.insert(d) for d in singles])
+
+    def insert_batches():
+        for i in range(0, len(batched), args.batch):
+            store.insert_many(batched[i : i + args.batch])
+
+    timed("insert_many", len(batched), insert_batches)
+
+    ids = [d["_id"] for d in singles + batched]
+    lookups = [random.choice(ids) for _ in range(min(5000, len(ids)))]
+    timed("get", len(lookups), lambda: [store.get(i) for i in lookups])
+
+    pages = 0
+
+    def walk():
+        nonlocal pages
+        cursor = None
+        while True:
+            _, cursor, _ = store.page(args.page, before=cursor)
+            pages += 1
+            if cursor is None:
+                return
+
+    timed("page walk (per page)", len(ids) // args.page + 1, walk)
+    for name, filters in (("label", {"label": "bench"}), ("die", {"dice_type": "d6"})):
+        timed(
+            f"{name} first page",
+            1000,
+            lambda: [store.page(args.page, filters=filters) for _ in range(1000)],
+        )
+    timed("stream_all", len(ids), lambda: sum(1 for _ in store.stream_all()))
+    return store
+
+
+def main() -> None:
+    args = parse_args()
+    urls = args.store
+    tmpdir = None
+    if not urls:
+        tmpdir = tempfile.TemporaryDirectory()
+        urls = ["memory://", f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"]
+    schema_sizes([make_doc(i) for i in range(args.rolls)])
+    schemas = (COMPACT, LEGACY) if args.schema == "both" else (args.schema,)
+    for url in urls:
+        if not url.startswith(MONGO_SCHEMES):
+            bench(url, args)
+            continue
+        for schema in schemas:
+            store = bench(url, args, schema)
+            collection_stats(store)
+        if args.schema == "both":
+            t0 = time.perf_counter()
+            done = migrate(store.collection)["documents"]
+            elapsed = time.perf_counter() - t0
+            print(f"\n{url} (legacy migrated to compact)")
+            print(
+                f"  {'migrate':<22} {done / elapsed:>12,.0f} docs/sec  ({elapsed:.3f}s)"
+            )
+            collection_stats(store)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""bench_suite.py
+
+Reproducible benchmarks for the roll, verify and history hot paths.
+
+Usage:
+    python scripts/bench_suite.py [--iterations 2000] [--out results.json]
+                                  [--baseline baseline.json] [--threshold 0.2]
+    python scripts/bench_suite.py --save-baseline baseline.json
+
+Runs fully offline: the app is created with `ROLL_STORE=memory://` (the
+in-process `MemoryRollStore` stands in for MongoDB) and with a local
+`FakeBlockchain` registered as `nectar.blockchain.Blockchain`, so seeds come
+from a deterministic fake head block instead of a Hive node. The store is
+filled with `--history` rolls before the HTTP benchmarks start.
+
+Benchmarks:
+
+1. `provably_fair_roll` at several dice counts,
+2. `POST /api/roll`,
+3. `POST /api/verify` of a stored roll,
+4. `GET /api/rolls` (cached first page and a filtered page),
+5. `GET /roll/<id>` for random stored rolls,
+
+all HTTP ones through Flask's test client. Each benchmark reports ops/sec
+and p50/p95/p99 latency over `--iterations` calls (after a warm-up), plus
+memory allocated per call as measured by `tracemalloc` over a separate,
+shorter run. Results are printed and optionally written as JSON; with
+`--baseline` every benchmark is compared to a previous JSON file and the
+script exits with status 1 if any got slower by more than `--threshold`.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import types
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from provably_fair import CURRENT_VERSION, provably_fair_roll  # noqa: E402
+
+ROLL_DICE_COUNTS = (1, 3, 10, 100, 1000)
+SEED = 1234
+
+
+class FakeBlockchain:
+    """Offline stand-in for `nectar.blockchain.Blockchain`."""
+
+    def __init__(self, *args, **kwargs):
+        self.block_num = 90_000_000
+
+    def get_current_block(self):
+        self.block_num += 1
+        return {
+            "id": self.block_num,
+            "block_id": f"{self.block_num:040x}",
+            "transaction_merkle_root": f"{self.block_num * 7:040x}",
+        }
+
+
+def load_app():
+    """Return app.py and an app on the in-memory store and fake blockchain."""
+    nectar = types.ModuleType("nectar")
+    nectar.blockchain = types.ModuleType("nectar.blockchain")
+    nectar.blockchain.Blockchain = FakeBlockchain
+    sys.modules["nectar"] = nectar
+    sys.modules["nectar.blockchain"] = nectar.blockchain
+    import app
+
+    app.logging.getLogger().setLevel("WARNING")
+    flask_app = app.create_app(
+        {
+            "ROLL_STORE": "memory://",
+            "ROLL_FEED_BACKEND": "memory",
+            "WRITE_BEHIND": False,
+            "ROLL_STATS_FLUSH_INTERVAL": 3600.0,
+        }
+    )
+    return app, flask_app
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark the roll/verify/history paths")
+    p.add_argument("--iterations", type=int, default=2000, help="timed calls each")
+    p.add_argument("--warmup", type=int, default=100, help="untimed calls first")
+    p.add_argument("--alloc-iterations", type=int, default=200)
+    p.add_argument("--history", type=int, default=5000, help="rolls stored first")
+    p.add_argument("--only", action="append", help="run benchmarks with this prefix")
+    p.add_argument("--out", help="write results as JSON")
+    p.add_argument("--baseline", help="compare against a previous JSON results file")
+    p.add_argument("--save-baseline", help="write results to this baseline file")
+    p.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="allowed ops/sec drop vs baseline (default: 0.2 = 20%%)",
+    )
+    return p.parse_args()
+
+
+# ------------------------------------------------------------ measuring
+
+
+def measure(fn, args) -> dict:
+    for _ in range(args.warmup):
+        fn()
+    gc.collect()
+    timings = np.empty(args.iterations, dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i in range(args.iterations):
+        t0 = clock()
+        fn()
+        timings[i] = clock() - t0
+    total = timings.sum() / 1e9
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) / 1000
+
+    gc.collect()
+    tracemalloc.start()
+    peaks = []
+    before = tracemalloc.take_snapshot()
+    for _ in range(args.alloc_iterations):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    calls = args.alloc_iterations
+    return {
+        "ops_per_sec": args.iterations / total,
+        "latency_us": {"p50": p50, "p95": p95, "p99": p99},
+        "alloc_peak_bytes": int(np.median(peaks)),
+        "alloc_retained_bytes": sum(s.size_diff for s in stats) / calls,
+        "alloc_retained_blocks": sum(s.count_diff for s in stats) / calls,
+    }
+
+
+# ----------------------------------------------------------- benchmarks
+
+
+def seed_history(app, flask_app, n: int) -> list:
+    """Fill the store with `n` rolls; returns their documents."""
+    rng = random.Random(SEED)
+    docs = []
+    for i in range(n):
+        server_seed = f"{rng.getrandbits(128):032x}"
+        client_seed = f"{rng.getrandbits(96):024x}"
+        results, proof = provably_fair_roll(
+            "d6", 3, server_seed, client_seed, i, CURRENT_VERSION
+        )
+        docs.append(
+            app.make_roll_doc(
+                "d6",
+                3,
+                results,
+                proof,
+                server_seed,
+                client_seed,
+                i,
+                modifier=0,
+                block_num=90_000_000 + i // 20,
+                label="bench" if i % 10 == 0 else None,
+            )
+        )
+    store = flask_app.extensions["dice"].store
+    for i in range(0, n, 1000):
+        store.insert_many(docs[i : i + 1000])
+    return docs
+
+
+def benchmarks(flask_app, docs):
+    """Yield ``(name, callable)`` pairs in a fixed order."""
+    rng = random.Random(SEED)
+    for count in ROLL_DICE_COUNTS:
+        nonce = iter(range(10**9))
+        yield (
+            f"provably_fair_roll[{count}d6]",
+            lambda count=count, nonce=nonce: provably_fair_roll(
+                "d6", count, "ab" * 16, "cd" * 12, next(nonce), CURRENT_VERSION
+            ),
+        )
+
+    client = flask_app.test_client()
+
+    def call(method, url, expected=200, **kwargs):
+        def run():
+            resp = client.open(url, method=method, **kwargs)
+            if resp.status_code != expected:
+                raise SystemExit(f"{method} {url}: HTTP {resp.status_code}")
+
+        return run
+
+    yield (
+        "POST /api/roll",
+        call("POST", "/api/roll", json={"dice_type": "d6", "dice_count": 3}),
+    )
+    doc = docs[len(docs) // 2]
+    yield (
+        "POST /api/verify",
+        call(
+            "POST",
+            "/api/verify",
+            json={
+                "dice_type": "d6",
+                "dice_count": 3,
+                "server_seed": doc["server_seed"],
+                "client_seed": doc["client_seed"],
+                "nonce": doc["nonce"],
+                "algo": doc["algo"],
+                "result": doc["roll_result"].split(","),
+                "proof": doc["proof"],
+            },
+        ),
+    )
+    yield "GET /api/rolls", call("GET", "/api/rolls")
+    yield "GET /api/rolls?label=bench", call("GET", "/api/rolls?label=bench")
+    ids = [str(d["_id"]) for d in docs]
+
+    def roll_detail():
+        resp = client.get(f"/roll/{rng.choice(ids)}")
+        if resp.status_code != 200:
+            raise SystemExit(f"GET /roll/<id>: HTTP {resp.status_code}")
+
+    yield "GET /roll/<id>", roll_detail
+
+
+# ------------------------------------------------------------ reporting
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print ops/sec changes vs the baseline; returns the regressed names."""
+    regressions = []
+    print(f"\nvs baseline from {baseline.get('created', '?')}")
+    for name, result in results.items():
+        old = baseline["benchmarks"].get(name)
+        if old is None:
+            print(f"  {name:<32} (new)")
+            continue
+        change = result["ops_per_sec"] / old["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"  {name:<32} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main() -> None:
+    args = parse_args()
+    random.seed(SEED)
+    app, flask_app = load_app()
+    docs = seed_history(app, flask_app, args.history)
+    results = {}
+    print(
+        f"{'benchmark':<32} {'ops/sec':>12} {'p50 us':>9} {'p99 us':>9} {'peak B':>9}"
+    )
+    for name, fn in benchmarks(flask_app, docs):
+        if args.only and not any(name.startswith(prefix) for prefix in args.only):
+            continue
+        result = results[name] = measure(fn, args)
+        latency = result["latency_us"]
+        print(
+            f"{name:<32} {result['ops_per_sec']:>12,.0f} {latency['p50']:>9.1f}"
+            f" {latency['p99']:>9.1f} {result['alloc_peak_bytes']:>9,}"
+        )
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "alloc_iterations": args.alloc_iterations,
+            "history": args.history,
+        },
+        "benchmarks": results,
+    }
+    for path in (args.out, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(report, indent=2) + "\n")
+            print(f"Wrote {path}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
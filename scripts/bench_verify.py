@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""bench_verify.py
+
+Verification throughput on block-clustered rolls.
+
+Usage:
+    python scripts/bench_verify.py [--rolls 100000] [--per-block 1,10,50,250]
+                                   [--dice 3] [--shuffle]
+
+With Hive seeds every roll made within one block has the block id as server
+seed, so stored history comes in runs of rolls sharing a seed. For each
+``--per-block`` value the script builds `--rolls` d6 rolls the way
+`api_roll` makes them (server seed = block id, client seed = merkle root
+plus a random salt, nonce = block number) and times:
+
+* ``verify_rows`` — the batch path (`/api/verify/batch`, verify_all.py),
+* ``scalar`` — one `provably_fair_roll` per roll, as `/api/verify` and the
+  roll detail page do.
+
+`--shuffle` interleaves the blocks, as a verify request for ids in random
+order would. The keyed-HMAC cache hit rate is printed when the tree has one.
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import provably_fair  # noqa: E402
+from provably_fair import CURRENT_VERSION, provably_fair_roll  # noqa: E402
+from verification import verify_rows  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Benchmark block-clustered verification")
+    p.add_argument("--rolls", type=int, default=100_000)
+    p.add_argument(
+        "--per-block", default="1,10,50,250", help="rolls per server seed, comma list"
+    )
+    p.add_argument("--dice", type=int, default=3, help="d6 per roll")
+    p.add_argument("--shuffle", action="store_true", help="interleave the blocks")
+    return p.parse_args()
+
+
+def make_rows(n: int, per_block: int, dice: int, shuffle: bool) -> list:
+    rng = random.Random(per_block)
+    rows = []
+    for i in range(n):
+        block_num = 90_000_000 + i // per_block
+        if i % per_block == 0:
+            server_seed = f"{rng.getrandbits(160):040x}"  # the block id
+        client_seed = f"{block_num * 7:040x}{rng.getrandbits(32):08x}"
+        faces, proof = provably_fair_roll(
+            "d6", dice, server_seed, client_seed, block_num, CURRENT_VERSION
+        )
+        rows.append(
+            (
+                str(i),
+                f"{dice}xd6",
+                ",".join(map(str, faces)),
+                proof,
+                server_seed,
+                client_seed,
+                block_num,
+                CURRENT_VERSION,
+                None,
+            )
+        )
+    if shuffle:
+        rng.shuffle(rows)
+    return rows
+
+
+def clear_cache():
+    keyed = getattr(provably_fair, "keyed_hmac", None)
+    if keyed is not None:
+        keyed.cache_clear()
+
+
+def hit_rate() -> str:
+    keyed = getattr(provably_fair, "keyed_hmac", None)
+    if keyed is None:
+        return "-"
+    info = keyed.cache_info()
+    calls = info.hits + info.misses
+    return f"{info.hits / calls:.1%}" if calls else "-"
+
+
+def timed(fn) -> float:
+    clear_cache()
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    args = parse_args()
+    print(
+        f"{args.rolls:,} rolls of {args.dice}d6"
+        f"{', blocks interleaved' if args.shuffle else ''}"
+    )
+    print(f"{'per block':>9} {'verify_rows/s':>14} {'scalar/s':>12} {'cache hits':>11}")
+    for per_block in (int(x) for x in args.per_block.split(",")):
+        rows = make_rows(args.rolls, per_block, args.dice, args.shuffle)
+        outcomes = []
+        bulk = timed(lambda: outcomes.extend(verify_rows(rows)))
+        if not all(outcome.ok for outcome in outcomes):
+            raise SystemExit("verify_rows rejected a valid roll")
+        scalar = timed(
+            lambda: [
+                provably_fair_roll("d6", args.dice, row[4], row[5], row[6], row[7])
+                for row in rows
+            ]
+        )
+        print(
+            f"{per_block:>9} {args.rolls / bulk:>14,.0f} {args.rolls / scalar:>12,.0f}"
+            f" {hit_rate():>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
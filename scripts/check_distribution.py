@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""check_distribution.py
+
+Monte Carlo check of the exact distributions in `distribution.py` against
+the dice expression roller they describe.
+
+Usage:
+    python scripts/check_distribution.py [--rolls 20000] [--alpha 0.001]
+                                         [expression ...]
+
+Each expression (default: a set covering rerolls, explosions, rerolls
+combined with explosions, and keep/drop) is rolled `--rolls` times by
+`dice_expr` over nonces 0, 1, 2, ... of a fixed seed pair, and the totals
+are compared with the exact PMF by a chi-square goodness-of-fit test.
+Totals expected fewer than five times are pooled into one cell. The script
+exits with status 1 if any expression's p-value is below `--alpha`.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dice_expr import compile_expression  # noqa: E402
+from distribution import plan_distribution  # noqa: E402
+from fairness import chi_square  # noqa: E402
+
+EXPRESSIONS = (
+    "3d6",
+    "1d6r1",
+    "2d6ro<2",
+    "1d6!",
+    "1d6r1!",
+    "1d2r1!",
+    "1d4r<2!>3",
+    "2d8r<3!>7+1",
+    "4d6kh3",
+    "4d6r1dl1",
+)
+SERVER_SEED = "ab" * 32
+CLIENT_SEED = "check_distribution"
+MIN_EXPECTED = 5
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Check exact PMFs by simulation")
+    p.add_argument("expressions", nargs="*", default=EXPRESSIONS)
+    p.add_argument("--rolls", type=int, default=20_000, help="rolls per expression")
+    p.add_argument("--alpha", type=float, default=0.001, help="failure threshold")
+    return p.parse_args()
+
+
+def check(expression, rolls):
+    """Return ``(exact mean, sample mean, statistic, df, p_value)``."""
+    plan = compile_expression(expression)
+    dist = plan_distribution(plan)
+    totals = np.array([plan.roll(SERVER_SEED, CLIENT_SEED, n)[0] for n in range(rolls)])
+    if totals.min() < dist.min or totals.max() > dist.max:
+        raise SystemExit(f"{expression}: rolled a total outside the exact support")
+    observed = np.bincount(totals - dist.offset, minlength=len(dist.probs))
+    expected = dist.expected_counts(rolls)
+    small = expected < MIN_EXPECTED
+    observed = np.append(observed[~small], observed[small].sum())
+    expected = np.append(expected[~small], expected[small].sum())
+    statistic, df, p_value = chi_square(observed, expected)
+    return dist.mean(), float(totals.mean()), statistic, df, p_value
+
+
+def main() -> None:
+    args = parse_args()
+    print(
+        f"{'expression':<16} {'exact mean':>11} {'sample mean':>12}"
+        f" {'chi2':>9} {'df':>4} {'p':>8}"
+    )
+    failed = []
+    for expression in args.expressions:
+        exact, sample, statistic, df, p_value = check(expression, args.rolls)
+        print(
+            f"{expression:<16} {exact:>11.4f} {sample:>12.4f}"
+            f" {statistic:>9.1f} {df:>4} {p_value:>8.4f}"
+        )
+        if p_value < args.alpha:
+            failed.append(expression)
+    if failed:
+        print(f"Disagrees with the roller: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
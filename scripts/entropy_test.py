@@ -2,41 +2,50 @@
 """entropy_test.py
 
 Simple Shannon entropy test for dice roll datasets stored in the local
-SQLite database created by the other roll_* scripts.
+SQLite database created by loadgen.py or roll_once.py.
 
 Usage:
     python entropy_test.py <table_name> [--db dice_fairness.db]
+    python entropy_test.py <table_name> --archive rolls.archive
 
 Example:
     python entropy_test.py large_fast_rolls
 
 The script will:
 1. Connect to the SQLite DB (default: dice_fairness.db).
-2. Read every entry in the specified table, assuming a column `result` that
-   contains comma-separated dice face integers (e.g. "4,2,6").
-3. Flatten all dice faces into a single list and compute the Shannon entropy
-   in bits.
+2. Stream the specified table in chunks (see `rollstream.py`), assuming a
+   column `result` that contains comma-separated dice face integers (e.g.
+   "4,2,6"), and count faces with NumPy so memory stays constant. With
+   `--workers N` the table is split into N id ranges counted in parallel.
+   With `--archive` the table's rolls are read from a columnar archive
+   written by archive_rolls.py instead, with no strings to parse.
+3. Compute the Shannon entropy of the face counts in bits.
 4. Print an easy-to-read report comparing the measured entropy to the ideal
-   entropy for a fair die (log2(6) ≈ 2.585 bits).
+   entropy of a fair die of the table's dice type (log2(6) ≈ 2.585 bits for
+   a d6), computed by `distribution.py`.
 
 If the computed entropy is close to the ideal (within ~1-2%), the dataset can
 be considered high-entropy with respect to uniform dice faces. Larger
 relative deviation may indicate bias.
+For hypothesis tests with p-values (chi-square, KS, serial correlation,
+runs, per-position and per-block bias) use `fairness_suite.py`.
 """
 
 import argparse
-import math
-from collections import Counter
-from typing import List
+import os
+import sys
+from pathlib import Path
 
-import dataset
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-# Configuration similar to roll_* scripts
+from rollstream import CHUNK_ROWS, scan_archive, scan_table  # noqa: E402
+
+from distribution import expression_distribution  # noqa: E402
+
+# Configuration matching loadgen.py
 DB_URL = "sqlite:///dice_fairness.db"
 TABLE_NAME = "large_fast_rolls"  # default; can be overridden by CLI
 
-IDEAL_ENTROPY_BITS = math.log2(6)  # ≈ 2.585
-
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -53,51 +62,46 @@ def parse_args() -> argparse.Namespace:
         default=DB_URL,
         help=f"SQLAlchemy DB URL (default: {DB_URL})",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes counting id ranges in parallel (default: one per core)",
+    )
+    parser.add_argument(
+        "--chunk",
+        type=int,
+        default=CHUNK_ROWS,
+        help=f"rows read per query (default: {CHUNK_ROWS})",
+    )
+    parser.add_argument(
+        "--archive",
+        help="read the table from this roll archive (see archive_rolls.py)",
+    )
     return parser.parse_args()
 
 
-def fetch_results(db_url: str, table: str) -> List[int]:
-    """Fetch and flatten dice faces from the specified table using `dataset`."""
-    # dataset requires a proper URL: e.g., sqlite:///foo.db
-    db = dataset.connect(db_url)
-    if table not in db:
-        raise ValueError(f"Table '{table}' not found in database.")
-
-    faces: List[int] = []
-    for row in db[table].all():
-        result_str = row.get("result") or ""
-        faces.extend(int(x) for x in result_str.split(",") if x)
-    return faces
-
-
-def shannon_entropy(values: List[int]) -> float:
-    """Compute Shannon entropy in bits for discrete values."""
-    count = Counter(values)
-    total = len(values)
-    if total == 0:
-        raise ValueError("No data to compute entropy.")
-
-    entropy = 0.0
-    for freq in count.values():
-        p = freq / total
-        entropy -= p * math.log2(p)
-    return entropy
-
-
 def main() -> None:
     args = parse_args()
-    values = fetch_results(args.db, args.table)
+    if args.archive:
+        counts = scan_archive(args.archive, args.table)
+    else:
+        counts = scan_table(args.db, args.table, args.workers, args.chunk)
+    dice_type = counts.dice_type or "d6"
 
-    entropy = shannon_entropy(values)
-    deviation_pct = (entropy - IDEAL_ENTROPY_BITS) / IDEAL_ENTROPY_BITS * 100
+    entropy = counts.entropy()
+    ideal = expression_distribution(f"1{dice_type}").entropy()
+    deviation_pct = (entropy - ideal) / ideal * 100
 
     print("\nEntropy Analysis Report")
     print("=======================")
     print(f"Dataset table     : {args.table}")
-    print(f"Total dice faces  : {len(values):,}")
-    print(f"Unique faces      : {len(set(values))}")
+    print(f"Total dice faces  : {counts.total:,}")
+    print(f"Unique faces      : {len(counts.pmf()[0])}")
+    if len(counts.dice_types) > 1:
+        print(f"Dice types        : {dict(counts.dice_types)} (mixed)")
     print(f"Shannon entropy   : {entropy:.4f} bits")
-    print(f"Ideal entropy (d6): {IDEAL_ENTROPY_BITS:.4f} bits")
+    print(f"Ideal entropy ({dice_type}): {ideal:.4f} bits")
     print(f"Deviation         : {deviation_pct:+.2f}%")
 
     if abs(deviation_pct) <= 2:
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""fairness_suite.py
+
+Run the statistical fairness tests in `fairness.py` over stored rolls and
+write a JSON report with a p-value for every test.
+
+Usage:
+    python scripts/fairness_suite.py [table ...] [--db sqlite:///dice_fairness.db]
+    python scripts/fairness_suite.py --store mongodb://localhost:27017/
+
+Without `--store` the named tables of the local SQLite database written by
+loadgen.py and roll_once.py are tested (default: every table). With
+`--store` the rolls in that roll store are tested instead; dice-expression
+rolls are skipped. Either way each source is read once, in chunks, in storage order.
+
+Per die type the report has chi-square and Kolmogorov-Smirnov tests of the
+face counts, serial correlation at lags 1-3, a runs test, chi-square tests
+of each position within multi-die rolls and a dispersion test of roll
+totals across `block_num`. Tests with p < `--alpha` are listed under
+"suspicious"; with many tests some will land there by chance, so look for
+repeat offenders across runs.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import dataset
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rollstream import CHUNK_ROWS, read_chunks  # noqa: E402
+
+from fairness import DEFAULT_ALPHA, FairnessAccumulator  # noqa: E402
+from provably_fair import parse_dice_type  # noqa: E402
+from storage import open_store  # noqa: E402
+
+DB_URL = "sqlite:///dice_fairness.db"
+FIELDS = {"dice_type": 1, "roll_result": 1, "block_num": 1, "expression": 1}
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Statistical fairness tests for rolls")
+    p.add_argument("tables", nargs="*", help="SQLite tables (default: all)")
+    p.add_argument("--db", default=DB_URL, help=f"SQLAlchemy DB URL ({DB_URL})")
+    p.add_argument("--store", help="test a roll store URL instead of SQLite tables")
+    p.add_argument("--chunk", type=int, default=CHUNK_ROWS, help="rows per chunk")
+    p.add_argument("--alpha", type=float, default=DEFAULT_ALPHA)
+    p.add_argument("--out", help="write the JSON report here instead of stdout")
+    return p.parse_args()
+
+
+def table_chunks(db_url, table, chunk_rows):
+    """Yield ``(die, result, block_num)`` chunks from a roll_* script table."""
+    columns = ("dice_type", "result", "block_num")
+    for rows in read_chunks(db_url, table, columns, chunk_rows=chunk_rows):
+        yield [(die or "d6", result, block) for _, die, result, block in rows]
+
+
+def store_chunks(store, chunk_rows):
+    """Yield ``(die, result, block_num)`` chunks from a roll store."""
+    chunk = []
+    for doc in store.stream_all(batch_size=chunk_rows, fields=FIELDS):
+        # Expression rolls only have a "3xd6" dice_type when their faces are
+        # plain draws of one die
+        die = None
+        try:
+            die, _ = parse_dice_type(doc.get("dice_type") or "")
+        except ValueError:
+            pass
+        chunk.append((die, doc.get("roll_result"), doc.get("block_num")))
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(chunks, alpha):
+    acc = FairnessAccumulator()
+    for chunk in chunks:
+        acc.add_rows(chunk)
+    return acc.report(alpha)
+
+
+def main() -> None:
+    args = parse_args()
+    if args.store:
+        store = open_store(args.store)
+        report = {args.store: run(store_chunks(store, args.chunk), args.alpha)}
+    else:
+        tables = args.tables or dataset.connect(args.db).tables
+        report = {
+            table: run(table_chunks(args.db, table, args.chunk), args.alpha)
+            for table in tables
+        }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    else:
+        print(text)
+    for source, result in report.items():
+        for entry in result["suspicious"]:
+            print(
+                f"{source}: {entry['die']} {entry['test']} p={entry['p_value']:.3g}",
+                file=sys.stderr,
+            )
+
+
+if __name__ == "__main__":
+    main()
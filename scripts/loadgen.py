@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""loadgen.py
+
+Concurrent load generator and data collector for the `/api/roll` endpoint.
+
+Replaces the old roll_fast.py, roll_large.py and roll_slow.py scripts, which
+posted one roll at a time without a session and inserted each row into
+SQLite on its own. Here `--concurrency` asyncio workers each own a pooled
+`requests.Session` (kept-alive connections) and run their requests in a
+thread pool; an optional `--rate` paces the whole run to a target number of
+rolls per second. Results are written to SQLite by a single writer in
+batched transactions, and the run ends with throughput and latency
+percentiles.
+
+Usage:
+    python scripts/loadgen.py [--total 5000 | --duration 60] [--rate 50]
+                              [--concurrency 16] [--dice d6 --count 3]
+                              [--table load_rolls] [--no-store]
+    python scripts/loadgen.py --preset large   # the old roll_large.py run
+
+Presets reproduce the old scripts (same table, label and roll count):
+`fast` (100 rolls), `large` (5000 rolls) and `slow` (100 rolls, one every
+3 seconds). Explicit options override preset values.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dataset
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "http://localhost:8000/api/roll"
+DB_URL = "sqlite:///dice_fairness.db"
+
+PRESETS = {
+    "fast": {"table": "fast_rolls", "label": "fast_3d6", "total": 100},
+    "large": {"table": "large_fast_rolls", "label": "large_fast_3d6", "total": 5000},
+    "slow": {
+        "table": "slow_rolls",
+        "label": "slow_3d6",
+        "total": 100,
+        "rate": 1 / 3,
+        "concurrency": 1,
+    },
+}
+DEFAULTS = {
+    "table": "load_rolls",
+    "label": None,
+    "total": 1000,
+    "rate": None,
+    "concurrency": 16,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Concurrent /api/roll load generator")
+    p.add_argument("--url", default=API_URL, help=f"roll endpoint (default: {API_URL})")
+    p.add_argument("--preset", choices=sorted(PRESETS))
+    p.add_argument("--total", type=int, help="number of rolls (default: 1000)")
+    p.add_argument("--duration", type=float, help="run for N seconds instead")
+    p.add_argument("--rate", type=float, help="target rolls/sec (default: unpaced)")
+    p.add_argument("--concurrency", type=int, help="requests in flight (default: 16)")
+    p.add_argument("--dice", default="d6", help="dice type (default: d6)")
+    p.add_argument("--count", type=int, default=3, help="dice per roll (default: 3)")
+    p.add_argument("--modifier", type=int, default=0)
+    p.add_argument("--label")
+    p.add_argument("--db", default=DB_URL, help=f"SQLAlchemy DB URL ({DB_URL})")
+    p.add_argument("--table", help="SQLite table (default: load_rolls)")
+    p.add_argument("--batch", type=int, default=500, help="rows per SQLite commit")
+    p.add_argument("--timeout", type=float, default=10.0, help="request timeout")
+    p.add_argument("--no-store", action="store_true", help="benchmark only")
+    args = p.parse_args()
+    for name, value in {**DEFAULTS, **PRESETS.get(args.preset, {})}.items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+    if args.duration:
+        args.total = None
+    return args
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.ok = 0
+        self.failed = 0
+
+    def report(self, elapsed: float) -> None:
+        done = self.ok + self.failed
+        print("\nLoad Report")
+        print("===========")
+        print(f"Requests          : {done:,} ({self.ok:,} ok, {self.failed:,} failed)")
+        print(f"Elapsed           : {elapsed:.2f}s")
+        print(
+            f"Throughput        : {self.ok / elapsed if elapsed else 0:,.1f} rolls/sec"
+        )
+        if self.latencies:
+            p50, p95, p99 = np.percentile(self.latencies, [50, 95, 99]) * 1000
+            worst = max(self.latencies) * 1000
+            print(f"Latency p50       : {p50:.1f} ms")
+            print(f"Latency p95       : {p95:.1f} ms")
+            print(f"Latency p99       : {p99:.1f} ms")
+            print(f"Latency max       : {worst:.1f} ms")
+
+
+def make_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def post_roll(session, args, payload):
+    """Blocking request; returns ``(latency_seconds, data or None, error)``."""
+    started = time.perf_counter()
+    try:
+        resp = session.post(args.url, json=payload, timeout=args.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+    except (requests.RequestException, ValueError) as e:
+        return time.perf_counter() - started, None, str(e)
+    latency = time.perf_counter() - started
+    if not data.get("success"):
+        return latency, None, data.get("message")
+    return latency, data, None
+
+
+def row_for(index, args, data):
+    return {
+        "roll_index": index,
+        "dice_type": args.dice,
+        "dice_count": args.count,
+        "modifier": args.modifier,
+        "label": args.label,
+        "result": ",".join(map(str, data.get("result", []))),
+        "proof": data.get("proof"),
+        "server_seed": data.get("server_seed"),
+        "client_seed": data.get("client_seed"),
+        "nonce": data.get("nonce"),
+        "block_num": data.get("block_num"),
+        "roll_id": data.get("roll_id"),
+    }
+
+
+class Writer:
+    """Batch rows into SQLite transactions on one dedicated thread."""
+
+    def __init__(self, db_url, table_name, batch_size):
+        # dataset keeps a connection per thread, so every write goes through
+        # the same single-thread executor
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.db_url = db_url
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.rows = []
+        self.written = 0
+        self.db = None
+
+    def _write(self, rows):
+        if self.db is None:
+            self.db = dataset.connect(self.db_url)
+        table = self.db[self.table_name]
+        self.db.begin()
+        try:
+            table.insert_many(rows, chunk_size=len(rows))
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+    async def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        rows, self.rows = self.rows, []
+        if rows:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._write, rows)
+            self.written += len(rows)
+
+
+async def run(args) -> None:
+    payload = {
+        "dice_type": args.dice,
+        "dice_count": args.count,
+        "modifier": args.modifier,
+        "label": args.label,
+    }
+    stats = Stats()
+    writer = None if args.no_store else Writer(args.db, args.table, args.batch)
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    indexes = asyncio.Queue(maxsize=args.concurrency * 2)
+    started = time.perf_counter()
+
+    async def produce():
+        # Hand out roll indexes, paced to --rate if given
+        i = 0
+        while args.total is None or i < args.total:
+            now = time.perf_counter()
+            if args.duration and now - started >= args.duration:
+                break
+            if args.rate:
+                delay = started + i / args.rate - now
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            i += 1
+            await indexes.put(i)
+        for _ in range(args.concurrency):
+            await indexes.put(None)
+
+    async def work():
+        session = make_session(1)
+        while (index := await indexes.get()) is not None:
+            latency, data, error = await loop.run_in_executor(
+                pool, post_roll, session, args, payload
+            )
+            stats.latencies.append(latency)
+            if error is not None:
+                stats.failed += 1
+                print(f"Roll {index} failed: {error}", file=sys.stderr)
+                continue
+            stats.ok += 1
+            if writer is not None:
+                await writer.add(row_for(index, args, data))
+            if stats.ok % 100 == 0:
+                print(f"Completed {stats.ok} rolls...")
+        session.close()
+
+    await asyncio.gather(produce(), *(work() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    if writer is not None:
+        await writer.flush()
+        print(f"Stored {writer.written:,} rolls in {args.table}")
+    pool.shutdown()
+    stats.report(elapsed)
+
+
+def main() -> None:
+    args = parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""migrate_rolls.py
+
+Rewrite the stored rolls of a MongoDB roll store in place into the compact
+schema of `roll_schema.py`, while the app keeps serving.
+
+Usage:
+    python scripts/migrate_rolls.py [--store mongodb://localhost:27017/]
+                                    [--batch 1000] [--pause 0] [--dry-run]
+    python scripts/migrate_rolls.py --finish
+    python scripts/migrate_rolls.py --downgrade
+
+Documents without a schema version are read in `_id` order, a batch at a
+time, and each is replaced by its compact form in one unordered bulk write
+per batch. A replacement only applies if the document is still in the
+legacy shape and its ``server_seed`` has not changed since it was read (a
+session reveal may set it meanwhile); documents skipped that way are
+picked up by another pass. `--pause` sleeps between batches to leave the
+server room for the app's own traffic. `--dry-run` reports the size change
+without writing anything.
+
+The app reads both shapes throughout, so the migration can be stopped and
+resumed at any point. Once it has finished, run it with `--finish` and
+restart the app: that records that the collection holds no legacy
+documents, so history filters use only the compact fields, and drops the
+``dice_type`` index they no longer need.
+
+`--downgrade` rewrites compact documents back into the legacy shape (run
+the app with ``ROLL_SCHEMA=legacy`` first, so it stops writing new compact
+ones).
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import bson
+from pymongo import ASCENDING, ReplaceOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from history import ensure_indexes  # noqa: E402
+from roll_schema import (  # noqa: E402
+    STATE_COLLECTION,
+    decode_roll,
+    encode_roll,
+    legacy_documents,
+)
+from storage import MongoRollStore  # noqa: E402
+
+STORE_URL = "mongodb://localhost:27017/"
+LEGACY_INDEX = "dice_type_timestamp"
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Migrate stored rolls between schemas")
+    p.add_argument(
+        "--store", default=STORE_URL, help=f"MongoDB URL (default: {STORE_URL})"
+    )
+    p.add_argument("--database", default="ultimate_dice")
+    p.add_argument("--batch", type=int, default=1000, help="documents per write")
+    p.add_argument("--pause", type=float, default=0.0, help="seconds between batches")
+    p.add_argument("--dry-run", action="store_true", help="report sizes only")
+    action = p.add_mutually_exclusive_group()
+    action.add_argument("--finish", action="store_true", help="retire legacy reads")
+    action.add_argument("--downgrade", action="store_true", help="back to legacy")
+    return p.parse_args()
+
+
+def migrate(collection, batch_size=1000, pause=0.0, dry_run=False, downgrade=False):
+    """Rewrite every document of the other shape; returns a summary dict.
+
+    ``documents`` is the number rewritten; ``bytes_before`` and
+    ``bytes_after`` are the total BSON size in each shape of the ``read``
+    documents (a document skipped by one pass is read again by the next).
+    """
+    convert = decode_roll if downgrade else encode_roll
+    pending = {"v": {"$exists": downgrade}}
+    summary = dict.fromkeys(("documents", "read", "bytes_before", "bytes_after"), 0)
+    summary["passes"] = 0
+    while True:
+        summary["passes"] += 1
+        rewritten = 0
+        last_id = None
+        while True:
+            query = dict(pending)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            docs = list(collection.find(query).sort("_id", ASCENDING).limit(batch_size))
+            if not docs:
+                break
+            last_id = docs[-1]["_id"]
+            summary["read"] += len(docs)
+            requests = []
+            for doc in docs:
+                guard = {
+                    "_id": doc["_id"],
+                    "server_seed": doc.get("server_seed"),
+                    **pending,
+                }
+                summary["bytes_before"] += len(bson.encode(doc))
+                # decode_roll works in place, so size the original first
+                doc = convert(doc)
+                summary["bytes_after"] += len(bson.encode(doc))
+                requests.append(ReplaceOne(guard, doc))
+            if dry_run:
+                rewritten += len(requests)
+            else:
+                rewritten += collection.bulk_write(
+                    requests, ordered=False
+                ).modified_count
+                if pause:
+                    time.sleep(pause)
+        summary["documents"] += rewritten
+        # Another pass only for documents skipped by a concurrent update
+        if dry_run or not rewritten or not collection.find_one(pending, {"_id": 1}):
+            return summary
+
+
+def finish(store) -> None:
+    if store.collection.find_one({"v": {"$exists": False}}, {"_id": 1}):
+        raise SystemExit("Legacy documents remain; run the migration again first")
+    ensure_indexes(store.collection, legacy=False)
+    store.db[STATE_COLLECTION].update_one(
+        {"_id": store.collection.name},
+        {"$set": {"legacy_documents": False}},
+        upsert=True,
+    )
+    if LEGACY_INDEX in store.collection.index_information():
+        store.collection.drop_index(LEGACY_INDEX)
+    print("Legacy reads retired; restart the app to use compact-only filters")
+
+
+def main() -> None:
+    args = parse_args()
+    store = MongoRollStore(args.store, args.database)
+    if args.finish:
+        finish(store)
+        return
+    if args.downgrade and not args.dry_run:
+        # Legacy documents need their dice_type index and filters again
+        ensure_indexes(store.collection, legacy=True)
+        store.db[STATE_COLLECTION].delete_one({"_id": store.collection.name})
+    elif not legacy_documents(store.db, store.collection.name):
+        print("Note: --finish has already been run for this collection")
+
+    started = time.perf_counter()
+    summary = migrate(
+        store.collection,
+        batch_size=args.batch,
+        pause=args.pause,
+        dry_run=args.dry_run,
+        downgrade=args.downgrade,
+    )
+    elapsed = time.perf_counter() - started
+    read = summary["read"]
+    before, after = summary["bytes_before"], summary["bytes_after"]
+    verb = "Would rewrite" if args.dry_run else "Rewrote"
+    print(
+        f"{verb} {summary['documents']:,} documents in {elapsed:.1f}s"
+        f" ({summary['passes']} passes)"
+    )
+    if read:
+        print(
+            f"Average BSON size: {before / read:,.0f} -> {after / read:,.0f} bytes"
+            f" ({after / before - 1:+.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
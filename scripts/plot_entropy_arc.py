@@ -12,19 +12,28 @@ This script produces a figure with two panels:
    Wikipedia's entropy page.
 
 Usage:
-    python plot_entropy_arc.py <table_name> [--db dice_fairness.db]
+    python plot_entropy_arc.py <table_name> [--db dice_fairness.db] [--workers N]
+    python plot_entropy_arc.py <table_name> --archive rolls.archive
+
+Faces are counted in streamed chunks by `rollstream.py`, so the table is
+never loaded into memory as a whole. With `--archive` they are counted
+from the memory-mapped columns of a roll archive (see archive_rolls.py).
 
 Dependencies: matplotlib, dataset, numpy.
 """
 
 import argparse
-from collections import Counter
-from typing import List
+import os
+import sys
+from pathlib import Path
 
-import dataset
 import matplotlib.pyplot as plt
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rollstream import CHUNK_ROWS, scan_archive, scan_table  # noqa: E402
+
 # Configuration matching other scripts
 DB_URL = "sqlite:///dice_fairness.db"
 TABLE_NAME = "large_fast_rolls"  # default table used when none provided
@@ -48,22 +57,24 @@ def parse_args() -> argparse.Namespace:
         default="entropy_arc.png",
         help="Output image file (default: entropy_arc.png)",
     )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes counting id ranges in parallel (default: one per core)",
+    )
+    p.add_argument(
+        "--chunk",
+        type=int,
+        default=CHUNK_ROWS,
+        help=f"rows read per query (default: {CHUNK_ROWS})",
+    )
+    p.add_argument(
+        "--archive", help="read the table from this roll archive (archive_rolls.py)"
+    )
     return p.parse_args()
 
 
-def fetch_faces(db_url: str, table: str) -> List[int]:
-    """Return flattened list of dice faces from a table using `dataset`."""
-    db = dataset.connect(db_url)
-    if table not in db:
-        raise ValueError(f"Table '{table}' not found in database.")
-
-    faces: List[int] = []
-    for row in db[table].all():
-        result_str = row.get("result") or ""
-        faces.extend(int(x) for x in result_str.split(",") if x)
-    return faces
-
-
 # ------------------------------ plotting ------------------------------------
 
 
@@ -77,13 +88,13 @@ def binary_entropy(p: np.ndarray) -> np.ndarray:
 
 def main() -> None:
     args = parse_args()
-    faces = fetch_faces(args.db, args.table)
+    if args.archive:
+        counts = scan_archive(args.archive, args.table)
+    else:
+        counts = scan_table(args.db, args.table, args.workers, args.chunk)
 
     # Compute empirical PMF
-    total = len(faces)
-    counts = Counter(faces)
-    faces_sorted = sorted(counts.keys())
-    probs = np.array([counts[f] / total for f in faces_sorted])
+    faces_sorted, probs = counts.pmf()
 
     # ----------------- create figure -----------------
     fig, (ax_pmf, ax_arc) = plt.subplots(1, 2, figsize=(10, 4))
@@ -112,7 +123,8 @@ def main() -> None:
     ax_arc.set_ylim(0, 1.1)
     ax_arc.legend()
 
-    fig.suptitle(f"Entropy visualisation for table '{args.table}'")
+    dice_type = counts.dice_type or "d6"
+    fig.suptitle(f"Entropy visualisation for table '{args.table}' ({dice_type})")
     fig.tight_layout()
     fig.savefig(args.outfile, dpi=150)
     print(f"Saved plot to {args.outfile}")
@@ -1,7 +1,31 @@
+"""plot_fairness.py
+
+Histograms of roll totals against the exact distribution of the dice
+rolled, one plot per table and dice expression.
+
+Usage:
+    python scripts/plot_fairness.py [--db sqlite:///dice_fairness.db]
+    python scripts/plot_fairness.py --archive rolls.archive
+
+With `--archive` every source in a roll archive (see archive_rolls.py) is
+plotted, with totals summed from its memory-mapped faces instead of
+parsed from each row's result string.
+"""
+
+import argparse
+import sys
+from collections import defaultdict
+from pathlib import Path
+
 import dataset
 import matplotlib.pyplot as plt
 import numpy as np
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from distribution import expression_distribution  # noqa: E402
+from roll_archive import RollArchive  # noqa: E402
+
 DB_URL = "sqlite:///dice_fairness.db"
 TABLES = [
     ("fast_rolls", "Fast Rolls"),
@@ -11,64 +35,83 @@ TABLES = [
 ]
 
 
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Plot roll total histograms")
+    p.add_argument("--db", default=DB_URL, help=f"SQLAlchemy DB URL ({DB_URL})")
+    p.add_argument("--archive", help="plot every source of this roll archive")
+    return p.parse_args()
+
+
 def extract_results(table):
-    results = []
+    """Return ``{expression: counts}``, grouped by the dice rolled.
+
+    ``counts[total]`` is the number of rolls with that total.
+    """
+    results = defaultdict(list)
     for row in table.all():
         # 'result' is a comma-separated string of ints (e.g., "4" or "3,6")
         if row.get("result"):
             nums = [
                 int(x) for x in str(row["result"]).split(",") if x.strip().isdigit()
             ]
+            expression = f"{row.get('dice_count') or len(nums)}{row['dice_type']}"
             # If multiple dice, sum for total; else just value
-            results.append(sum(nums))
+            results[expression].append(sum(nums))
+    return {expression: np.bincount(totals) for expression, totals in results.items()}
+
+
+def add_counts(counts, more):
+    if len(more) > len(counts):
+        counts, more = more.copy(), counts
+    counts[: len(more)] += more
+    return counts
+
+
+def archive_results(segments):
+    """Return ``{expression: counts}`` from archive segments; see `extract_results`."""
+    results = {}
+    for segment in segments:
+        for totals, sides, count in segment.totals():
+            keys = (count.astype(np.int64) << 16) | sides
+            for key in np.unique(keys).tolist():
+                if not key & 0xFFFF:
+                    continue  # dice-expression rolls
+                expression = f"{key >> 16}d{key & 0xFFFF}"
+                counts = np.bincount(totals[keys == key])
+                results[expression] = add_counts(
+                    results.get(expression, np.zeros(0, dtype=np.int64)), counts
+                )
     return results
 
 
-def plot_histogram(results, label, filename):
-    if not results:
+def plot_histogram(counts, expression, label, filename):
+    rolls = int(counts.sum())
+    if not rolls:
         print(f"No data for {label}")
         return
-    # Theoretical 3d6 distribution (sum of 3d6, values 3-18)
-    theoretical_counts = {
-        3: 1,
-        4: 3,
-        5: 6,
-        6: 10,
-        7: 15,
-        8: 21,
-        9: 25,
-        10: 27,
-        11: 27,
-        12: 25,
-        13: 21,
-        14: 15,
-        15: 10,
-        16: 6,
-        17: 3,
-        18: 1,
-    }
-    total_permutations = 6**3  # 216
-    theoretical_probs = {
-        k: v / total_permutations for k, v in theoretical_counts.items()
-    }
-    xs = np.arange(3, 19)
-    # Empirical histogram
+    # Exact distribution of the dice total, scaled to the sample size
+    dist = expression_distribution(expression)
+    xs = dist.values
     plt.figure(figsize=(10, 6))
     n, bins, patches = plt.hist(
-        results,
-        bins=np.arange(2.5, 19.5, 1),
+        np.arange(len(counts)),
+        weights=counts,
+        bins=np.arange(dist.min - 0.5, dist.max + 1.5, 1),
         edgecolor="black",
         alpha=0.7,
         label="Empirical",
     )
-    # Theoretical curve (scaled to match sample size)
-    sample_size = len(results)
-    theoretical_freqs = [theoretical_probs.get(x, 0) * sample_size for x in xs]
+    theoretical_freqs = dist.expected_counts(rolls)
     plt.plot(
-        xs, theoretical_freqs, "o-", color="red", label="Theoretical 3d6", linewidth=2
+        xs,
+        theoretical_freqs,
+        "o-",
+        color="red",
+        label=f"Theoretical {expression}",
+        linewidth=2,
     )
     plt.title(f"Dice Roll Distribution: {label}")
-    plt.xlabel("Total Roll Value (3d6)")
+    plt.xlabel(f"Total Roll Value ({expression})")
     plt.ylabel("Frequency")
     plt.grid(axis="y", alpha=0.3)
     plt.legend()
@@ -79,11 +122,30 @@ def plot_histogram(results, label, filename):
 
 
 def main():
-    db = dataset.connect(DB_URL)
-    for table_name, label in TABLES:
-        table = db[table_name]
-        results = extract_results(table)
-        plot_histogram(results, label, f"{table_name}_hist.png")
+    args = parse_args()
+    if args.archive:
+        archive = RollArchive(args.archive)
+        labels = dict(TABLES)
+        sources = [
+            (
+                source,
+                labels.get(source, source),
+                archive_results(archive.select(source)),
+            )
+            for source in archive.sources
+        ]
+    else:
+        db = dataset.connect(args.db)
+        sources = (
+            (table_name, label, extract_results(db[table_name]))
+            for table_name, label in TABLES
+        )
+    for table_name, label, by_expression in sources:
+        if not by_expression:
+            print(f"No data for {label}")
+        for expression, results in sorted(by_expression.items()):
+            suffix = "" if len(by_expression) == 1 else f"_{expression}"
+            plot_histogram(results, expression, label, f"{table_name}{suffix}_hist.png")
 
 
 if __name__ == "__main__":
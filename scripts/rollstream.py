@@ -0,0 +1,176 @@
+"""rollstream.py
+
+Streaming face counts for the dice datasets written by loadgen.py and roll_once.py.
+
+Rows are read from a `dataset` table in fixed-size keyset chunks
+(``WHERE id > :last ORDER BY id LIMIT :n``) as plain tuples, skipping
+`dataset`'s per-row dict conversion, and each chunk's `result` strings are
+parsed by NumPy straight into a `bincount` accumulator, so memory stays
+constant however many faces the table holds.
+
+`FaceCounts` is a mergeable partial state: the table's id range is split
+into one span per worker, each span is counted in its own process and the
+partial counts are added together.
+
+`scan_archive` counts the same table from a columnar roll archive (see
+roll_archive.py and archive_rolls.py) instead: the faces are already parsed
+and memory-mapped, so there are no strings to parse.
+"""
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import dataset
+import numpy as np
+from sqlalchemy import text
+
+from roll_archive import FACE_CHUNK, RollArchive
+
+CHUNK_ROWS = 50_000
+
+
+class FaceCounts:
+    """Counts of each face value, plus the dice types seen per row."""
+
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)  # counts[face]
+        self.rows = 0
+        self.dice_types = Counter()
+
+    def add_results(self, results, dice_types=()):
+        """Count one chunk of comma-separated `result` strings."""
+        self.rows += len(results)
+        self.dice_types.update(dice_types)
+        text = ",".join(r for r in results if r)
+        if not text:
+            return
+        faces = np.fromstring(text, dtype=np.int64, sep=",")
+        if faces.size and faces.min() < 1:
+            raise ValueError("Dice faces must be positive integers")
+        self._add_counts(np.bincount(faces))
+
+    def add_faces(self, faces):
+        """Count an array of already parsed faces (all of them >= 1)."""
+        if len(faces):
+            self._add_counts(np.bincount(faces))
+
+    def _add_counts(self, counts):
+        if len(counts) > len(self.counts):
+            counts = counts.copy()
+            counts[: len(self.counts)] += self.counts
+            self.counts = counts
+        else:
+            self.counts[: len(counts)] += counts
+
+    def merge(self, other):
+        """Add another partial state into this one; returns self."""
+        self._add_counts(other.counts)
+        self.rows += other.rows
+        self.dice_types.update(other.dice_types)
+        return self
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    @property
+    def dice_type(self):
+        """The most common dice type in the data (e.g. "d6"), or None."""
+        common = self.dice_types.most_common(1)
+        return common[0][0] if common else None
+
+    def pmf(self):
+        """Return ``(faces, probabilities)`` for the faces that occurred."""
+        faces = np.nonzero(self.counts)[0]
+        return faces, self.counts[faces] / self.total
+
+    def entropy(self):
+        """Shannon entropy of the face counts in bits."""
+        if not self.total:
+            raise ValueError("No data to compute entropy.")
+        _, probs = self.pmf()
+        return float(-(probs * np.log2(probs)).sum())
+
+
+def _check_table(db, table):
+    if table not in db.tables:
+        raise ValueError(f"Table '{table}' not found in database.")
+
+
+def read_chunks(
+    db_url, table, columns, after_id=0, last_id=None, chunk_rows=CHUNK_ROWS
+):
+    """Yield lists of ``(id, *columns)`` tuples in id order, `chunk_rows` at a time.
+
+    Columns the table does not have are read as NULL.
+    """
+    db = dataset.connect(db_url)
+    _check_table(db, table)
+    existing = db[table].columns
+    select = ", ".join(c if c in existing else "NULL" for c in columns)
+    sql = text(
+        f'SELECT id, {select} FROM "{table}" '
+        "WHERE id > :after AND (:last IS NULL OR id <= :last) ORDER BY id LIMIT :n"
+    )
+    try:
+        while True:
+            params = {"after": after_id, "last": last_id, "n": chunk_rows}
+            rows = db.executable.execute(sql, params).fetchall()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1][0]
+    finally:
+        db.close()
+
+
+def count_span(db_url, table, after_id, last_id, chunk_rows=CHUNK_ROWS):
+    """Count faces in rows with ``after_id < id <= last_id``."""
+    state = FaceCounts()
+    columns = ("result", "dice_type")
+    for rows in read_chunks(db_url, table, columns, after_id, last_id, chunk_rows):
+        _, results, dice_types = zip(*rows)
+        state.add_results([r or "" for r in results], [t or "d6" for t in dice_types])
+    return state
+
+
+def id_spans(db_url, table, parts):
+    """Split the table's id range into up to `parts` ``(after, last]`` spans."""
+    db = dataset.connect(db_url)
+    _check_table(db, table)
+    row = next(iter(db.query(f'SELECT MIN(id) AS lo, MAX(id) AS hi FROM "{table}"')))
+    db.close()
+    if row["lo"] is None:
+        return []
+    lo, hi = row["lo"] - 1, row["hi"]
+    step = max(1, -(-(hi - lo) // parts))
+    return [(start, min(start + step, hi)) for start in range(lo, hi, step)]
+
+
+def scan_table(db_url, table, workers=1, chunk_rows=CHUNK_ROWS):
+    """Return the merged `FaceCounts` for a whole table."""
+    spans = id_spans(db_url, table, workers)
+    state = FaceCounts()
+    if workers <= 1 or len(spans) <= 1:
+        for after_id, last_id in spans:
+            state.merge(count_span(db_url, table, after_id, last_id, chunk_rows))
+        return state
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(count_span, db_url, table, after_id, last_id, chunk_rows)
+            for after_id, last_id in spans
+        ]
+        for future in futures:
+            state.merge(future.result())
+    return state
+
+
+def scan_archive(path, source, chunk_faces=FACE_CHUNK):
+    """Return the `FaceCounts` of one source in a roll archive."""
+    state = FaceCounts()
+    for segment in RollArchive(path).select(source):
+        state.rows += len(segment)
+        state.dice_types.update(segment.die_counts())
+        for faces in segment.face_chunks(chunk_faces):
+            state.add_faces(faces)
+    return state
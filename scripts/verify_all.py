@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""verify_all.py
+
+Re-verify every stored roll in the roll store (by default the
+`ultimate_dice.dice_rolls` MongoDB collection).
+
+Usage:
+    python scripts/verify_all.py [--store mongodb://localhost:27017/]
+                                 [--batch 5000] [--workers N] [--reset]
+
+Rolls are streamed in `_id` order (a server-side cursor for MongoDB, keyset
+batches for SQLite), so memory stays flat no matter how large the store is.
+Each batch of documents is handed to a `ProcessPoolExecutor` worker (one per
+core by default) that re-derives proofs and results with `verify_rows` from
+`verification.py` (the vectorized engine in `roll_engine.py` for plain
+rolls).
+
+Progress is written to a checkpoint file after every completed batch: the
+last `_id` below which everything has been verified. Re-running the script
+resumes from there; pass `--reset` to start over. Every mismatch is appended
+to a JSON-lines report with the roll id and what failed.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage import open_store  # noqa: E402
+from verification import FIELDS, doc_row, verify_rows  # noqa: E402
+
+STORE_URL = "mongodb://localhost:27017/"
+CHECKPOINT = "verify_checkpoint.json"
+REPORT = "verify_mismatches.jsonl"
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Re-verify all stored dice rolls")
+    p.add_argument(
+        "--store", default=STORE_URL, help=f"roll store URL (default: {STORE_URL})"
+    )
+    p.add_argument("--batch", type=int, default=5000, help="documents per task")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--checkpoint", default=CHECKPOINT)
+    p.add_argument("--report", default=REPORT)
+    p.add_argument("--reset", action="store_true", help="ignore the checkpoint")
+    return p.parse_args()
+
+
+def verify_batch(rows):
+    """Verify row tuples (see `verification.py`) in a worker process.
+
+    Returns a list of `(id, reason)` mismatches.
+    """
+    return [
+        (row[0], outcome.reason)
+        for row, outcome in zip(rows, verify_rows(rows))
+        if not outcome.ok
+    ]
+
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"last_id": None, "checked": 0, "mismatches": 0}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, state: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def stream_batches(store, last_id, batch_size: int):
+    """Yield lists of row tuples in `_id` order, starting after `last_id`."""
+    batch = []
+    for doc in store.stream_all(last_id, batch_size=batch_size, fields=FIELDS):
+        batch.append(doc_row(doc))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main() -> None:
+    args = parse_args()
+    if args.reset:
+        for path in (args.checkpoint, args.report):
+            if os.path.exists(path):
+                os.remove(path)
+    state = load_checkpoint(args.checkpoint)
+    store = open_store(args.store)
+    print(f"Resuming after _id {state['last_id']}" if state["last_id"] else "Starting")
+
+    started = time.perf_counter()
+    checked_at_start = state["checked"]
+    pending = deque()  # (future, last_id, size) in submission order
+    with (
+        ProcessPoolExecutor(max_workers=args.workers) as pool,
+        open(args.report, "a") as report,
+    ):
+
+        def drain(block: bool) -> None:
+            # Only advance the checkpoint over a contiguous prefix of finished
+            # batches, so a resume never skips an unverified document.
+            while pending and (block or pending[0][0].done()):
+                future, last_id, size = pending.popleft()
+                for roll_id, reason in future.result():
+                    report.write(json.dumps({"id": roll_id, "reason": reason}) + "\n")
+                    state["mismatches"] += 1
+                report.flush()
+                state["last_id"] = last_id
+                state["checked"] += size
+                save_checkpoint(args.checkpoint, state)
+
+        for batch in stream_batches(store, state["last_id"], args.batch):
+            pending.append((pool.submit(verify_batch, batch), batch[-1][0], len(batch)))
+            # Keep a bounded number of batches in flight
+            if len(pending) >= 2 * args.workers:
+                pending[0][0].result()
+            drain(block=False)
+        drain(block=True)
+
+    elapsed = time.perf_counter() - started
+    done = state["checked"] - checked_at_start
+    print("\nVerification Report")
+    print("===================")
+    print(f"Rolls checked     : {state['checked']:,} ({done:,} this run)")
+    print(f"Mismatches        : {state['mismatches']:,} (see {args.report})")
+    print(f"Throughput        : {done / elapsed if elapsed else 0:,.0f} rolls/sec")
+
+
+if __name__ == "__main__":
+    main()
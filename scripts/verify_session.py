@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""verify_session.py
+
+Verify a closed roll session (see `sessions.py`) from its seed reveal.
+
+Usage:
+    python scripts/verify_session.py <session_id> [--store mongodb://localhost:27017/]
+                                     [--chunk 100000]
+
+Checks that the revealed server seed matches the hash committed when the
+session opened, replays every roll from that one seed, the session's client
+seed and the roll's nonce (vectorized per chunk through `verify_rows`), and
+rebuilds the Merkle tree to compare with the published root. The per-roll
+seeds stored with each roll are ignored.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sessions import build_tree, roll_leaf, seed_hash, tree_root  # noqa: E402
+from storage import open_store  # noqa: E402
+from verification import verify_rows  # noqa: E402
+
+STORE_URL = "mongodb://localhost:27017/"
+FIELDS = {
+    "nonce": 1,
+    "dice_type": 1,
+    "roll_result": 1,
+    "proof": 1,
+    "server_seed": 1,
+    "algo": 1,
+    "expression": 1,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Verify a closed roll session")
+    p.add_argument("session", help="session id")
+    p.add_argument(
+        "--store", default=STORE_URL, help=f"roll store URL (default: {STORE_URL})"
+    )
+    p.add_argument("--chunk", type=int, default=100_000, help="rolls per replay")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    store = open_store(args.store)
+    session = store.get_session(args.session)
+    if session is None:
+        raise SystemExit(f"Session {args.session} not found")
+    if session["status"] != "closed":
+        raise SystemExit(f"Session {args.session} is {session['status']}, not closed")
+    server_seed, client_seed = session["server_seed"], session["client_seed"]
+    if seed_hash(server_seed) != session["server_seed_hash"]:
+        raise SystemExit("Revealed server seed does not match its commitment")
+
+    started = time.perf_counter()
+    leaves, chunk, mismatches = [], [], []
+    checked = skipped = 0
+    last_nonce = None
+
+    def replay():
+        rows = [
+            (
+                str(roll["_id"]),
+                roll["dice_type"],
+                roll["roll_result"],
+                roll["proof"],
+                server_seed,
+                client_seed,
+                roll["nonce"],
+                roll.get("algo"),
+                roll.get("expression"),
+            )
+            for roll in chunk
+        ]
+        for row, outcome in zip(rows, verify_rows(rows)):
+            if not outcome.ok:
+                mismatches.append((row[0], row[6], outcome.reason))
+        chunk.clear()
+
+    rolls = store.session_rolls(session["_id"], batch_size=args.chunk, fields=FIELDS)
+    for roll in rolls:
+        if not roll.get("server_seed"):
+            # Stored after the session closed, so not part of the tree
+            skipped += 1
+            continue
+        if last_nonce is not None and roll["nonce"] <= last_nonce:
+            mismatches.append((str(roll["_id"]), roll["nonce"], "duplicate nonce"))
+        last_nonce = roll["nonce"]
+        leaves.append(roll_leaf(roll))
+        chunk.append(roll)
+        checked += 1
+        if len(chunk) >= args.chunk:
+            replay()
+    replay()
+    root = tree_root(build_tree(leaves))
+    elapsed = time.perf_counter() - started
+
+    print("\nSession Verification Report")
+    print("===========================")
+    print(f"Session            : {args.session}")
+    print(f"Seed commitment    : ok ({session['server_seed_hash']})")
+    print(f"Rolls replayed     : {checked:,} ({session.get('rolls')} published)")
+    if skipped:
+        print(f"Not in tree        : {skipped:,} (stored after close)")
+    print(f"Mismatches         : {len(mismatches):,}")
+    for roll_id, nonce, reason in mismatches[:20]:
+        print(f"  nonce {nonce} ({roll_id}): {reason}")
+    root_ok = root == session.get("merkle_root")
+    print(f"Merkle root        : {'ok' if root_ok else 'MISMATCH'} ({root})")
+    print(f"Elapsed            : {elapsed:.2f}s ({checked / elapsed:,.0f} rolls/sec)")
+    if mismatches or not root_ok or checked != session.get("rolls"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
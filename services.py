@@ -0,0 +1,271 @@
+"""Configuration and per-process clients for the Flask app.
+
+Importing app.py used to open the roll store, connect to a Hive node and
+start background threads, so every script that imported it paid for that
+and gunicorn with ``--preload`` shared the connections between workers.
+`create_app` now only reads the configuration; `Services` builds each
+client or cache the first time a request needs it:
+
+* ``store`` — the roll store from ``ROLL_STORE``,
+* ``seed_provider`` — head-block seeds; Nectar is imported and connected
+  from the refresher thread, never on a request,
+* ``recent_cache``, ``roll_broker``, ``roll_relay``, ``write_behind``,
+  ``roll_stats`` and ``session_trees``, the Merkle trees of recently
+  closed sessions.
+
+Everything built is dropped in a forked child (`os.register_at_fork`), so
+each worker makes its own Mongo client, threads and caches the first time
+it needs them. Optional subsystems (write-behind, Nectar) and the
+NumPy-backed modules are imported only when first used, or up front by
+`Services.preload`, which the server entry point (wsgi.py) calls so that no
+request pays for an import.
+"""
+
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import weakref
+from functools import lru_cache
+
+from block_seed import DEFAULT_MAX_AGE, BlockSeedProvider
+from metrics import Metrics, SamplingProfiler
+from roll_cache import RecentRollsCache
+from roll_feed import CappedCollectionRelay, RollBroker
+from roll_schema import COMPACT, SCHEMAS
+from sessions import TREE_CACHE, session_tree
+from storage import RollStore, open_store
+
+log = logging.getLogger(__name__)
+
+MONGO_SCHEMES = ("mongodb://", "mongodb+srv://")
+# Imported lazily by the views; see Services.preload
+PRELOAD_MODULES = ("roll_stats", "distribution", "verification")
+
+
+def _flag(value):
+    return str(value) == "1"
+
+
+# name -> (environment default, type)
+SETTINGS = {
+    "ROLL_STORE": ("mongodb://localhost:27017/", str),
+    "ROLL_SCHEMA": (COMPACT, str),
+    "BLOCK_SEED_MAX_AGE": (DEFAULT_MAX_AGE, float),
+    "RECENT_CACHE_SIZE": (100, int),
+    "RECENT_CACHE_MAX_AGE": (2, float),
+    "ROLL_FEED_BACKEND": ("memory", str),
+    "WRITE_BEHIND": ("0", _flag),
+    "WRITE_BEHIND_SPILL": ("dice_rolls.spill.jsonl", str),
+    "WRITE_BEHIND_QUEUE": (10000, int),
+    "ROLL_STATS_FLUSH_INTERVAL": (10, float),
+    "METRICS": ("1", _flag),
+    "PROFILE_EVERY": (0, int),
+    "PROFILE_DIR": ("profiles", str),
+}
+
+
+def config_from_env(environ=os.environ):
+    """App settings from environment variables (see the README)."""
+    return {
+        name: kind(environ.get(name, default))
+        for name, (default, kind) in SETTINGS.items()
+    }
+
+
+def check_config(config):
+    """Reject setting combinations that cannot work; raises RuntimeError."""
+    store = config["ROLL_STORE"]
+    mongo = isinstance(store, str) and store.startswith(MONGO_SCHEMES)
+    if config["ROLL_FEED_BACKEND"] == "mongo" and not mongo:
+        raise RuntimeError("ROLL_FEED_BACKEND=mongo needs a MongoDB ROLL_STORE")
+    if config["ROLL_SCHEMA"] not in SCHEMAS:
+        raise RuntimeError(f"ROLL_SCHEMA must be one of: {', '.join(SCHEMAS)}")
+
+
+def installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ValueError:
+        # Already imported without a spec, e.g. a stand-in registered by a test
+        return module in sys.modules
+
+
+class NectarBlockchain:
+    """`nectar.blockchain.Blockchain`, imported and created on first use.
+
+    `BlockSeedProvider` only calls `get_current_block` from its refresher
+    thread, so the slow import and node connection never hold up a request.
+    """
+
+    def __init__(self):
+        self._chain = None
+
+    def get_current_block(self):
+        if self._chain is None:
+            from nectar.blockchain import Blockchain
+
+            self._chain = Blockchain()
+        return self._chain.get_current_block()
+
+
+_live = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for services in list(_live):
+        services.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class Services:
+    def __init__(self, config):
+        check_config(config)
+        self.config = config
+        # Latency histograms for /metrics (METRICS=0 turns them off) and an
+        # opt-in cProfile of every PROFILE_EVERY-th request
+        self.metrics = Metrics(enabled=config["METRICS"])
+        self.profiler = SamplingProfiler(
+            every=config["PROFILE_EVERY"], directory=config["PROFILE_DIR"]
+        )
+        self.reset()
+        _live.add(self)
+
+    def reset(self):
+        """Forget every client and cache; the next access builds new ones."""
+        self._lock = threading.RLock()
+        self._instances = {}
+
+    def _get(self, name, factory):
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = factory()
+            return self._instances[name]
+
+    def preload(self):
+        """Import what the enabled subsystems need, without connecting to anything.
+
+        Under ``gunicorn --preload`` this runs once before the fork and the
+        workers share the imported modules.
+        """
+        modules = list(PRELOAD_MODULES)
+        if self.config["WRITE_BEHIND"]:
+            modules.append("write_behind")
+        if installed("nectar"):
+            modules.append("nectar.blockchain")
+        for name in modules:
+            importlib.import_module(name)
+
+    @property
+    def built(self):
+        """Names of the clients and caches this process has created."""
+        return sorted(self._instances)
+
+    # ------------------------------------------------------------ storage
+
+    @property
+    def store(self):
+        """The roll store; ``ROLL_STORE`` is a URL or, in tests, a `RollStore`."""
+        return self._get("store", self._make_store)
+
+    def _make_store(self):
+        store = self.config["ROLL_STORE"]
+        if isinstance(store, RollStore):
+            return store
+        return open_store(store, schema=self.config["ROLL_SCHEMA"])
+
+    def ensure_indexes(self):
+        """Create the store's indexes once per process; retried until it works."""
+        if self._instances.get("indexes_ready"):
+            return
+        try:
+            self.store.ensure_indexes()
+            self._instances["indexes_ready"] = True
+        except Exception as e:
+            log.warning("Could not ensure roll indexes: %s", e)
+
+    @property
+    def write_behind(self):
+        """The write-behind writer, or None unless WRITE_BEHIND=1."""
+        return self._get("write_behind", self._make_write_behind)
+
+    def _make_write_behind(self):
+        if not self.config["WRITE_BEHIND"]:
+            return None
+        from write_behind import WriteBehindWriter
+
+        writer = WriteBehindWriter(
+            self.store,
+            spill_path=self.config["WRITE_BEHIND_SPILL"],
+            max_queue=self.config["WRITE_BEHIND_QUEUE"],
+        )
+        writer.start()
+        return writer
+
+    @property
+    def roll_stats(self):
+        return self._get("roll_stats", self._make_roll_stats)
+
+    def _make_roll_stats(self):
+        from roll_stats import RollStats
+
+        return RollStats(
+            self.store, flush_interval=self.config["ROLL_STATS_FLUSH_INTERVAL"]
+        )
+
+    # -------------------------------------------------------------- seeds
+
+    @property
+    def seed_provider(self):
+        """Head-block seed cache, or None when Nectar is not installed."""
+        return self._get("seed_provider", self._make_seed_provider)
+
+    def _make_seed_provider(self):
+        if not installed("nectar"):
+            return None
+        return BlockSeedProvider(
+            NectarBlockchain(), max_age=self.config["BLOCK_SEED_MAX_AGE"]
+        )
+
+    # ------------------------------------------------------ caches & feed
+
+    @property
+    def recent_cache(self):
+        return self._get(
+            "recent_cache",
+            lambda: RecentRollsCache(
+                size=self.config["RECENT_CACHE_SIZE"],
+                max_age=self.config["RECENT_CACHE_MAX_AGE"],
+            ),
+        )
+
+    @property
+    def session_trees(self):
+        """``session_tree`` over this app's store, caching recent sessions."""
+        return self._get(
+            "session_trees",
+            lambda: lru_cache(maxsize=TREE_CACHE)(
+                lambda session_id: session_tree(self.store, session_id)
+            ),
+        )
+
+    @property
+    def roll_broker(self):
+        return self._get("roll_broker", RollBroker)
+
+    @property
+    def roll_relay(self):
+        """The cross-worker feed relay, or None unless ROLL_FEED_BACKEND=mongo."""
+        return self._get("roll_relay", self._make_roll_relay)
+
+    def _make_roll_relay(self):
+        if self.config["ROLL_FEED_BACKEND"] != "mongo":
+            return None
+        return CappedCollectionRelay(self.store.db, self.roll_broker)
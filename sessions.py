@@ -0,0 +1,167 @@
+"""Committed roll sessions and their Merkle trees.
+
+A session fixes one secret server seed up front and publishes only its
+SHA-256 (`seed_hash`). Every roll in the session uses that seed, the
+session's client seed and the next nonce (0, 1, 2, ...), so the whole
+session can later be replayed from one seed reveal.
+
+When the session is closed its rolls are hashed into a Merkle tree in nonce
+order and the root is published together with the server seed. A leaf
+commits to one roll::
+
+    sha256(0x00 || "<nonce>:<dice_type>:<roll_result>:<proof>")
+
+and an inner node to its two children, ``sha256(0x01 || left || right)``
+(the prefixes keep leaves and nodes from being confused). A level with an
+odd number of nodes carries its last node up unchanged. An inclusion proof
+for one roll is the list of sibling hashes on the way to the root, so it is
+O(log n) in size and in the work needed to check it with `verify_inclusion`.
+
+Tree levels are kept as single ``bytes`` blobs of 32-byte hashes, so a
+million-roll tree takes about 64 MB rather than millions of small objects.
+"""
+
+import hashlib
+import secrets
+from datetime import datetime
+
+HASH_SIZE = 32
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+TREE_CACHE = 4  # closed sessions whose Merkle trees stay in memory, per app
+# Projection with the fields `roll_leaf` and `session_tree` read
+ROLL_FIELDS = {
+    "nonce": 1,
+    "dice_type": 1,
+    "roll_result": 1,
+    "proof": 1,
+    "server_seed": 1,
+}
+
+
+def seed_hash(server_seed):
+    """The published commitment to a session's server seed."""
+    return hashlib.sha256(server_seed.encode()).hexdigest()
+
+
+def new_session(client_seed=None, label=None, block_num=None):
+    """A fresh, open session document with a secret server seed."""
+    server_seed = secrets.token_hex(32)
+    return {
+        "server_seed": server_seed,
+        "server_seed_hash": seed_hash(server_seed),
+        "client_seed": client_seed or secrets.token_hex(16),
+        "label": label,
+        "block_num": block_num,
+        "status": "open",
+        "next_nonce": 0,
+        "created": datetime.utcnow(),
+    }
+
+
+def public_session(session):
+    """A JSON-friendly view of a session; the seed is hidden until closed."""
+    revealed = session["status"] == "closed"
+    out = {
+        "id": str(session["_id"]),
+        "status": session["status"],
+        "server_seed_hash": session["server_seed_hash"],
+        "server_seed": session["server_seed"] if revealed else None,
+        "client_seed": session["client_seed"],
+        "label": session.get("label"),
+        "block_num": session.get("block_num"),
+        "next_nonce": session["next_nonce"],
+        "created": session["created"].isoformat(),
+    }
+    for key in ("merkle_root", "rolls", "closed_block"):
+        if key in session:
+            out[key] = session[key]
+    if session.get("closed"):
+        out["closed"] = session["closed"].isoformat()
+    return out
+
+
+# ------------------------------------------------------------ merkle tree
+
+
+def leaf_hash(nonce, dice_type, roll_result, proof):
+    data = f"{nonce}:{dice_type}:{roll_result}:{proof}".encode()
+    return hashlib.sha256(LEAF_PREFIX + data).digest()
+
+
+def roll_leaf(roll):
+    """The leaf hash for a stored roll document."""
+    return leaf_hash(
+        roll["nonce"], roll["dice_type"], roll["roll_result"], roll["proof"]
+    )
+
+
+def _node(left, right):
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def build_tree(leaves):
+    """Return the tree's levels, leaves first, each as one bytes blob."""
+    level = b"".join(leaves)
+    levels = [level]
+    while len(level) > HASH_SIZE:
+        count = len(level) // HASH_SIZE
+        hashes = [
+            _node(level[i : i + HASH_SIZE], level[i + HASH_SIZE : i + 2 * HASH_SIZE])
+            for i in range(0, (count - 1) * HASH_SIZE, 2 * HASH_SIZE)
+        ]
+        if count % 2:
+            hashes.append(level[-HASH_SIZE:])
+        level = b"".join(hashes)
+        levels.append(level)
+    return levels
+
+
+def session_tree(store, session_id):
+    """``(nonces, levels)`` of a closed session's Merkle tree in `store`.
+
+    Only rolls whose seed was revealed at close are leaves; a roll still in
+    flight when the session closed is left out everywhere alike.
+    """
+    nonces, leaves = [], []
+    for roll in store.session_rolls(session_id, fields=ROLL_FIELDS):
+        if roll.get("server_seed"):
+            nonces.append(roll["nonce"])
+            leaves.append(roll_leaf(roll))
+    return nonces, build_tree(leaves)
+
+
+def tree_root(levels):
+    """Hex root of a tree from `build_tree` (None for an empty tree)."""
+    top = levels[-1]
+    return top.hex() if top else None
+
+
+def inclusion_proof(levels, index):
+    """Sibling hashes from leaf `index` up to the root.
+
+    Each step is ``{"hash": hex, "side": "left" | "right"}``, the side the
+    sibling is on.
+    """
+    proof = []
+    for level in levels[:-1]:
+        count = len(level) // HASH_SIZE
+        sibling = index ^ 1
+        if sibling < count:
+            start = sibling * HASH_SIZE
+            side = "left" if sibling < index else "right"
+            proof.append({"hash": level[start : start + HASH_SIZE].hex(), "side": side})
+        index //= 2
+    return proof
+
+
+def verify_inclusion(leaf, proof, root):
+    """Check that `leaf` (hex or bytes) hashes up to `root` (hex) via `proof`."""
+    node = bytes.fromhex(leaf) if isinstance(leaf, str) else leaf
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        if step["side"] == "left":
+            node = _node(sibling, node)
+        else:
+            node = _node(node, sibling)
+    return node.hex() == root
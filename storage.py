@@ -0,0 +1,878 @@
+"""Pluggable roll storage backends.
+
+The app talks to a `RollStore` rather than to a Mongo collection directly.
+`open_store` picks a backend from a URL:
+
+* ``mongodb://host:port/`` — `MongoRollStore`, the production backend.
+* ``sqlite:///path/to/rolls.db`` — `SQLiteRollStore`, a single-file
+  database in WAL mode with indexed columns for the history queries.
+* ``memory://`` — `MemoryRollStore`, for tests and throwaway instances.
+
+`open_async_store` returns the insert path for asyncio code (asgi.py):
+`AsyncMongoRollStore` on pymongo's `AsyncMongoClient`, or for the other
+backends `ThreadedAsyncStore`, which runs the synchronous insert in the
+default executor.
+
+Every backend stores and returns the same document shape: a dict whose
+``_id`` is an `ObjectId` assigned before insert and whose ``timestamp`` is a
+naive UTC datetime truncated to milliseconds, as MongoDB stores it. The
+Mongo backends write that shape in the compact stored schema of
+roll_schema.py unless opened with ``schema="legacy"``, and the Mongo store
+reads both.
+"""
+
+import asyncio
+import bisect
+import json
+import sqlite3
+import threading
+
+from bson import json_util
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, AsyncMongoClient, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from history import (
+    DEFAULT_PAGE_SIZE,
+    build_filter,
+    decode_cursor,
+    ensure_indexes,
+    finish_page,
+    page_rolls,
+    to_millis,
+)
+from roll_schema import (
+    COMPACT,
+    decode_roll,
+    encode_roll,
+    legacy_documents,
+    pack_hex,
+    stored_fields,
+)
+
+DUPLICATE_KEY = 11000
+
+
+class StorageError(Exception):
+    """A write could not be completed by the backend."""
+
+
+def _prepare(doc):
+    """Assign an id and truncate the timestamp the way MongoDB would."""
+    doc.setdefault("_id", ObjectId())
+    stored = dict(doc)
+    ts = stored.get("timestamp")
+    if ts is not None:
+        stored["timestamp"] = ts.replace(microsecond=ts.microsecond // 1000 * 1000)
+    return stored
+
+
+def _matches(doc, label=None, dice_type=None, block_min=None, block_max=None):
+    if label is not None and doc.get("label") != label:
+        return False
+    if dice_type:
+        stored = doc.get("dice_type") or ""
+        if "x" in dice_type:
+            if stored != dice_type:
+                return False
+        elif stored.partition("x")[2] != dice_type:
+            return False
+    block_num = doc.get("block_num")
+    if block_min is not None and (block_num is None or block_num < block_min):
+        return False
+    if block_max is not None and (block_num is None or block_num > block_max):
+        return False
+    return True
+
+
+class RollStore:
+    """Interface implemented by every storage backend.
+
+    ``filters`` arguments accept ``label``, ``dice_type`` (``"3xd6"`` or a
+    bare ``"d6"``), ``block_min`` and ``block_max``.
+    """
+
+    def ensure_indexes(self):
+        """Create whatever indexes the history queries need (idempotent)."""
+
+    def insert(self, doc):
+        """Store one roll; assigns ``doc["_id"]`` if missing and returns it."""
+        raise NotImplementedError
+
+    def insert_many(self, docs, ignore_duplicates=False):
+        """Store rolls in one round trip; returns their ids in order."""
+        raise NotImplementedError
+
+    def get(self, roll_id):
+        """Return the roll with the given id (str or ObjectId), or None."""
+        raise NotImplementedError
+
+    def get_many(self, roll_ids, fields=None):
+        """Return ``{str(id): roll}`` for the ids that exist, in one query.
+
+        Unknown and malformed ids are left out. ``fields`` is a projection
+        hint, as for `page`.
+        """
+        raise NotImplementedError
+
+    def recent(self, limit=DEFAULT_PAGE_SIZE):
+        """Return the newest rolls, newest first."""
+        return self.page(limit)[0]
+
+    def page(
+        self,
+        limit=DEFAULT_PAGE_SIZE,
+        before=None,
+        after=None,
+        filters=None,
+        fields=None,
+    ):
+        """Return ``(rolls, next_cursor, prev_cursor)``; see `history.page_rolls`.
+
+        ``fields`` is a projection hint; backends may return whole documents.
+        """
+        raise NotImplementedError
+
+    def stream_all(self, after_id=None, batch_size=1000, fields=None):
+        """Yield every roll in ``_id`` order, starting after ``after_id``."""
+        raise NotImplementedError
+
+    # Running roll statistics (see roll_stats.py). A stats document is
+    # identified by ``(die, period, bucket)`` and holds flat numeric counters
+    # that are only ever incremented, so several workers can add to it.
+
+    def increment_stats(self, updates):
+        """Add ``{(die, period, bucket): {counter: delta}}`` to stored stats."""
+        raise NotImplementedError
+
+    def load_stats(self, period, since=0):
+        """Return stats documents for `period` with ``bucket >= since``."""
+        raise NotImplementedError
+
+    def prune_stats(self, period, before):
+        """Delete stats documents for `period` with ``bucket < before``.
+
+        Raises StorageError if the delete fails.
+        """
+        raise NotImplementedError
+
+    # Committed roll sessions (see sessions.py). Session rolls are ordinary
+    # roll documents with a ``session`` field (the session id as a string)
+    # and the session's nonce.
+
+    def insert_session(self, session):
+        """Store a new session; assigns ``session["_id"]`` and returns it."""
+        raise NotImplementedError
+
+    def get_session(self, session_id):
+        """Return the session with the given id, or None."""
+        raise NotImplementedError
+
+    def reserve_nonces(self, session_id, count):
+        """Claim `count` nonces of an open session; returns the first one.
+
+        Returns None if the session does not exist or is not open.
+        """
+        raise NotImplementedError
+
+    def update_session(self, session_id, fields, status):
+        """Set `fields` if the session's status is `status`; returns success."""
+        raise NotImplementedError
+
+    def session_rolls(self, session_id, batch_size=1000, fields=None):
+        """Yield a session's rolls in nonce order."""
+        raise NotImplementedError
+
+    def reveal_session_rolls(self, session_id, server_seed):
+        """Fill in the revealed server seed on every roll of a session."""
+        raise NotImplementedError
+
+
+def _stats_id(die, period, bucket):
+    return f"{die}:{period}:{bucket}"
+
+
+class MongoRollStore(RollStore):
+    """Rolls in MongoDB, written in the stored `schema` (see roll_schema.py).
+
+    Documents of either stored shape are read back in the logical shape.
+    Until `ensure_indexes` finds that the collection has been migrated,
+    history filters also match legacy documents.
+    """
+
+    def __init__(
+        self,
+        url="mongodb://localhost:27017/",
+        database="ultimate_dice",
+        schema=COMPACT,
+    ):
+        self.client = MongoClient(url)
+        self.db = self.client[database]
+        self.collection = self.db["dice_rolls"]
+        self.stats = self.db["roll_stats"]
+        self.sessions = self.db["roll_sessions"]
+        self.compact = schema == COMPACT
+        self.legacy_docs = True
+
+    def _stored(self, doc):
+        doc.setdefault("_id", ObjectId())
+        return encode_roll(doc) if self.compact else doc
+
+    def ensure_indexes(self):
+        self.legacy_docs = not self.compact or legacy_documents(
+            self.db, self.collection.name
+        )
+        ensure_indexes(self.collection, legacy=self.legacy_docs)
+        self.collection.create_index(
+            [("session", ASCENDING), ("nonce", ASCENDING)],
+            name="session_nonce",
+            partialFilterExpression={"session": {"$exists": True}},
+        )
+        self.stats.create_index(
+            [("period", ASCENDING), ("bucket", ASCENDING)], name="period_bucket"
+        )
+
+    def insert(self, doc):
+        try:
+            self.collection.insert_one(self._stored(doc))
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+        return doc["_id"]
+
+    def insert_many(self, docs, ignore_duplicates=False):
+        stored = [self._stored(doc) for doc in docs]
+        try:
+            self.collection.insert_many(stored, ordered=not ignore_duplicates)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if not ignore_duplicates or any(
+                err.get("code") != DUPLICATE_KEY for err in errors
+            ):
+                raise StorageError(str(e)) from e
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+        return [doc["_id"] for doc in docs]
+
+    def get(self, roll_id):
+        try:
+            return decode_roll(self.collection.find_one({"_id": ObjectId(roll_id)}))
+        except InvalidId:
+            return None
+
+    def get_many(self, roll_ids, fields=None):
+        ids = [ObjectId(i) for i in roll_ids if ObjectId.is_valid(i)]
+        if not ids:
+            return {}
+        cursor = self.collection.find({"_id": {"$in": ids}}, stored_fields(fields))
+        return {str(doc["_id"]): decode_roll(doc) for doc in cursor}
+
+    def page(
+        self,
+        limit=DEFAULT_PAGE_SIZE,
+        before=None,
+        after=None,
+        filters=None,
+        fields=None,
+    ):
+        rolls, next_cursor, prev_cursor = page_rolls(
+            self.collection,
+            limit=limit,
+            before=before,
+            after=after,
+            query=build_filter(**(filters or {}), legacy=self.legacy_docs),
+            fields=stored_fields(fields),
+        )
+        return [decode_roll(doc) for doc in rolls], next_cursor, prev_cursor
+
+    def stream_all(self, after_id=None, batch_size=1000, fields=None):
+        query = {"_id": {"$gt": ObjectId(after_id)}} if after_id else {}
+        cursor = self.collection.find(query, stored_fields(fields))
+        for doc in cursor.sort("_id", ASCENDING).batch_size(batch_size):
+            yield decode_roll(doc)
+
+    def increment_stats(self, updates):
+        if not updates:
+            return
+        requests = [
+            UpdateOne(
+                {"_id": _stats_id(die, period, bucket)},
+                {
+                    "$setOnInsert": {"die": die, "period": period, "bucket": bucket},
+                    "$inc": counters,
+                },
+                upsert=True,
+            )
+            for (die, period, bucket), counters in updates.items()
+        ]
+        try:
+            self.stats.bulk_write(requests, ordered=False)
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+
+    def load_stats(self, period, since=0):
+        query = {"period": period, "bucket": {"$gte": since}}
+        return list(self.stats.find(query, {"_id": 0}))
+
+    def prune_stats(self, period, before):
+        try:
+            self.stats.delete_many({"period": period, "bucket": {"$lt": before}})
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+
+    def insert_session(self, session):
+        session.setdefault("_id", ObjectId())
+        try:
+            self.sessions.insert_one(session)
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+        return session["_id"]
+
+    def get_session(self, session_id):
+        try:
+            return self.sessions.find_one({"_id": ObjectId(session_id)})
+        except InvalidId:
+            return None
+
+    def reserve_nonces(self, session_id, count):
+        try:
+            before = self.sessions.find_one_and_update(
+                {"_id": ObjectId(session_id), "status": "open"},
+                {"$inc": {"next_nonce": count}},
+                projection={"next_nonce": 1},
+            )
+        except InvalidId:
+            return None
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+        return before["next_nonce"] if before else None
+
+    def update_session(self, session_id, fields, status):
+        try:
+            result = self.sessions.update_one(
+                {"_id": ObjectId(session_id), "status": status}, {"$set": fields}
+            )
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+        return result.matched_count == 1
+
+    def session_rolls(self, session_id, batch_size=1000, fields=None):
+        cursor = self.collection.find(
+            {"session": str(session_id)}, stored_fields(fields)
+        )
+        for doc in cursor.sort("nonce", ASCENDING).batch_size(batch_size):
+            yield decode_roll(doc)
+
+    def reveal_session_rolls(self, session_id, server_seed):
+        session = str(session_id)
+        try:
+            # Each roll keeps its own stored shape, whichever schema writes
+            self.collection.update_many(
+                {"session": session, "v": {"$exists": True}},
+                {"$set": {"server_seed": pack_hex(server_seed)}},
+            )
+            self.collection.update_many(
+                {"session": session, "v": {"$exists": False}},
+                {"$set": {"server_seed": server_seed}},
+            )
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+
+
+class MemoryRollStore(RollStore):
+    def __init__(self):
+        self._docs = {}
+        self._order = []  # sorted (timestamp_ms, id_hex) keys
+        self._stats = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def insert(self, doc):
+        return self.insert_many([doc])[0]
+
+    def insert_many(self, docs, ignore_duplicates=False):
+        with self._lock:
+            for doc in docs:
+                stored = _prepare(doc)
+                key = str(stored["_id"])
+                if key in self._docs:
+                    if ignore_duplicates:
+                        continue
+                    raise StorageError(f"Duplicate roll id {key}")
+                self._docs[key] = stored
+                bisect.insort(self._order, (to_millis(stored["timestamp"]), key))
+        return [doc["_id"] for doc in docs]
+
+    def get(self, roll_id):
+        return self._docs.get(str(roll_id))
+
+    def get_many(self, roll_ids, fields=None):
+        docs = (self._docs.get(str(roll_id)) for roll_id in roll_ids)
+        return {str(doc["_id"]): doc for doc in docs if doc is not None}
+
+    def page(
+        self,
+        limit=DEFAULT_PAGE_SIZE,
+        before=None,
+        after=None,
+        filters=None,
+        fields=None,
+    ):
+        with self._lock:
+            order = list(self._order)
+        newer = after is not None
+        boundary = after if newer else before
+        if boundary is not None:
+            ts, oid = decode_cursor(boundary)
+            key = (to_millis(ts), str(oid))
+            if newer:
+                order = order[bisect.bisect_right(order, key) :]
+            else:
+                order = order[: bisect.bisect_left(order, key)]
+        if not newer:
+            order.reverse()
+        rolls = []
+        for _, key in order:
+            doc = self._docs[key]
+            if _matches(doc, **(filters or {})):
+                rolls.append(doc)
+                if len(rolls) > limit:
+                    break
+        return finish_page(rolls, limit, before, after)
+
+    def stream_all(self, after_id=None, batch_size=1000, fields=None):
+        keys = sorted(self._docs)
+        start = bisect.bisect_right(keys, str(after_id)) if after_id else 0
+        for key in keys[start:]:
+            yield self._docs[key]
+
+    def increment_stats(self, updates):
+        with self._lock:
+            for (die, period, bucket), counters in updates.items():
+                doc = self._stats.setdefault(
+                    _stats_id(die, period, bucket),
+                    {"die": die, "period": period, "bucket": bucket},
+                )
+                for name, delta in counters.items():
+                    doc[name] = doc.get(name, 0) + delta
+
+    def load_stats(self, period, since=0):
+        with self._lock:
+            return [
+                dict(doc)
+                for doc in self._stats.values()
+                if doc["period"] == period and doc["bucket"] >= since
+            ]
+
+    def prune_stats(self, period, before):
+        with self._lock:
+            for key, doc in list(self._stats.items()):
+                if doc["period"] == period and doc["bucket"] < before:
+                    del self._stats[key]
+
+    def insert_session(self, session):
+        session.setdefault("_id", ObjectId())
+        with self._lock:
+            self._sessions[str(session["_id"])] = dict(session)
+        return session["_id"]
+
+    def get_session(self, session_id):
+        with self._lock:
+            session = self._sessions.get(str(session_id))
+            return dict(session) if session else None
+
+    def reserve_nonces(self, session_id, count):
+        with self._lock:
+            session = self._sessions.get(str(session_id))
+            if session is None or session["status"] != "open":
+                return None
+            first = session["next_nonce"]
+            session["next_nonce"] += count
+            return first
+
+    def update_session(self, session_id, fields, status):
+        with self._lock:
+            session = self._sessions.get(str(session_id))
+            if session is None or session["status"] != status:
+                return False
+            session.update(fields)
+            return True
+
+    def session_rolls(self, session_id, batch_size=1000, fields=None):
+        with self._lock:
+            key = str(session_id)
+            docs = [d for d in self._docs.values() if d.get("session") == key]
+        yield from sorted(docs, key=lambda doc: doc["nonce"])
+
+    def reveal_session_rolls(self, session_id, server_seed):
+        key = str(session_id)
+        with self._lock:
+            for doc in self._docs.values():
+                if doc.get("session") == key:
+                    doc["server_seed"] = server_seed
+
+
+class SQLiteRollStore(RollStore):
+    """SQLite backend: one connection per thread, WAL journal, indexed columns.
+
+    The full document is kept as extended JSON next to the columns used for
+    filtering and ordering. Statements are fixed strings with parameters, so
+    sqlite3's per-connection statement cache reuses the prepared statements.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS rolls (
+            id TEXT PRIMARY KEY,
+            ts INTEGER NOT NULL,
+            dice_type TEXT,
+            die TEXT,
+            label TEXT,
+            block_num INTEGER,
+            doc TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS rolls_ts ON rolls (ts DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS rolls_label ON rolls (label, ts DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS rolls_dice ON rolls (dice_type, ts DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS rolls_die ON rolls (die, ts DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS rolls_block ON rolls (block_num)",
+        """CREATE TABLE IF NOT EXISTS roll_stats (
+            id TEXT PRIMARY KEY,
+            die TEXT NOT NULL,
+            period TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            counters TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS roll_stats_period ON roll_stats (period, bucket)",
+        """CREATE TABLE IF NOT EXISTS roll_sessions (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            doc TEXT NOT NULL
+        )""",
+        # Session rolls are found through an index on the stored document,
+        # so existing databases need no new column
+        """CREATE INDEX IF NOT EXISTS rolls_session ON rolls (
+            json_extract(doc, '$.session'), json_extract(doc, '$.nonce')
+        ) WHERE json_extract(doc, '$.session') IS NOT NULL""",
+    )
+    INSERT = "INSERT INTO rolls VALUES (?, ?, ?, ?, ?, ?, ?)"
+    INSERT_IGNORE = "INSERT OR IGNORE INTO rolls VALUES (?, ?, ?, ?, ?, ?, ?)"
+    MAX_PARAMS = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.ensure_indexes()
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def ensure_indexes(self):
+        with self.conn as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    @staticmethod
+    def _row(doc):
+        stored = _prepare(doc)
+        dice_type = stored.get("dice_type")
+        return (
+            str(stored["_id"]),
+            to_millis(stored["timestamp"]),
+            dice_type,
+            dice_type.partition("x")[2] or None if dice_type else None,
+            stored.get("label"),
+            stored.get("block_num"),
+            json_util.dumps(stored),
+        )
+
+    def insert(self, doc):
+        return self.insert_many([doc])[0]
+
+    def insert_many(self, docs, ignore_duplicates=False):
+        sql = self.INSERT_IGNORE if ignore_duplicates else self.INSERT
+        try:
+            with self.conn as conn:
+                conn.executemany(sql, [self._row(doc) for doc in docs])
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+        return [doc["_id"] for doc in docs]
+
+    def get(self, roll_id):
+        row = self.conn.execute(
+            "SELECT doc FROM rolls WHERE id = ?", (str(roll_id),)
+        ).fetchone()
+        return json_util.loads(row[0]) if row else None
+
+    def get_many(self, roll_ids, fields=None):
+        ids = list(dict.fromkeys(str(roll_id) for roll_id in roll_ids))
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), self.MAX_PARAMS):
+            chunk = ids[start : start + self.MAX_PARAMS]
+            marks = ", ".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT id, doc FROM rolls WHERE id IN ({marks})", chunk
+            )
+            found.update((key, json_util.loads(doc)) for key, doc in rows)
+        return found
+
+    def page(
+        self,
+        limit=DEFAULT_PAGE_SIZE,
+        before=None,
+        after=None,
+        filters=None,
+        fields=None,
+    ):
+        filters = filters or {}
+        where, params = [], []
+        if filters.get("label") is not None:
+            where.append("label = ?")
+            params.append(filters["label"])
+        dice_type = filters.get("dice_type")
+        if dice_type:
+            where.append("dice_type = ?" if "x" in dice_type else "die = ?")
+            params.append(dice_type)
+        if filters.get("block_min") is not None:
+            where.append("block_num >= ?")
+            params.append(filters["block_min"])
+        if filters.get("block_max") is not None:
+            where.append("block_num <= ?")
+            params.append(filters["block_max"])
+        newer = after is not None
+        boundary = after if newer else before
+        op, direction = (">", "ASC") if newer else ("<", "DESC")
+        if boundary is not None:
+            ts, oid = decode_cursor(boundary)
+            where.append(f"(ts {op} ? OR (ts = ? AND id {op} ?))")
+            params.extend([to_millis(ts), to_millis(ts), str(oid)])
+        sql = "SELECT doc FROM rolls"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY ts {direction}, id {direction} LIMIT ?"
+        params.append(limit + 1)
+        rolls = [json_util.loads(row[0]) for row in self.conn.execute(sql, params)]
+        return finish_page(rolls, limit, before, after)
+
+    def stream_all(self, after_id=None, batch_size=1000, fields=None):
+        last = str(after_id) if after_id else ""
+        while True:
+            rows = self.conn.execute(
+                "SELECT id, doc FROM rolls WHERE id > ? ORDER BY id LIMIT ?",
+                (last, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for _, doc in rows:
+                yield json_util.loads(doc)
+            last = rows[-1][0]
+
+    def increment_stats(self, updates):
+        if not updates:
+            return
+        try:
+            with self.conn as conn:
+                # Take the write lock up front so concurrent read-modify-write
+                # increments from other processes cannot interleave
+                conn.execute("BEGIN IMMEDIATE")
+                for (die, period, bucket), counters in updates.items():
+                    key = _stats_id(die, period, bucket)
+                    row = conn.execute(
+                        "SELECT counters FROM roll_stats WHERE id = ?", (key,)
+                    ).fetchone()
+                    merged = json.loads(row[0]) if row else {}
+                    for name, delta in counters.items():
+                        merged[name] = merged.get(name, 0) + delta
+                    conn.execute(
+                        "INSERT OR REPLACE INTO roll_stats VALUES (?, ?, ?, ?, ?)",
+                        (key, die, period, bucket, json.dumps(merged)),
+                    )
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def load_stats(self, period, since=0):
+        rows = self.conn.execute(
+            "SELECT die, bucket, counters FROM roll_stats"
+            " WHERE period = ? AND bucket >= ?",
+            (period, since),
+        )
+        return [
+            {"die": die, "period": period, "bucket": bucket, **json.loads(counters)}
+            for die, bucket, counters in rows
+        ]
+
+    def prune_stats(self, period, before):
+        try:
+            with self.conn as conn:
+                conn.execute(
+                    "DELETE FROM roll_stats WHERE period = ? AND bucket < ?",
+                    (period, before),
+                )
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def insert_session(self, session):
+        session.setdefault("_id", ObjectId())
+        try:
+            with self.conn as conn:
+                conn.execute(
+                    "INSERT INTO roll_sessions VALUES (?, ?, ?)",
+                    (str(session["_id"]), session["status"], json_util.dumps(session)),
+                )
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+        return session["_id"]
+
+    def get_session(self, session_id):
+        row = self.conn.execute(
+            "SELECT doc FROM roll_sessions WHERE id = ?", (str(session_id),)
+        ).fetchone()
+        return json_util.loads(row[0]) if row else None
+
+    def _modify_session(self, session_id, status, change):
+        # Read-modify-write under the write lock, as in increment_stats
+        try:
+            with self.conn as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT doc FROM roll_sessions WHERE id = ? AND status = ?",
+                    (str(session_id), status),
+                ).fetchone()
+                if row is None:
+                    return None
+                session = json_util.loads(row[0])
+                result = change(session)
+                conn.execute(
+                    "UPDATE roll_sessions SET status = ?, doc = ? WHERE id = ?",
+                    (session["status"], json_util.dumps(session), str(session_id)),
+                )
+                return result
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def reserve_nonces(self, session_id, count):
+        def claim(session):
+            first = session["next_nonce"]
+            session["next_nonce"] += count
+            return first
+
+        return self._modify_session(session_id, "open", claim)
+
+    def update_session(self, session_id, fields, status):
+        def apply(session):
+            session.update(fields)
+            return True
+
+        return bool(self._modify_session(session_id, status, apply))
+
+    def session_rolls(self, session_id, batch_size=1000, fields=None):
+        # With a projection the fields are read with json_extract, which skips
+        # parsing whole documents; they must be plain JSON values (no dates)
+        names = [name for name in fields or () if name not in ("_id", "nonce")]
+        if fields:
+            select = "".join(f", json_extract(doc, '$.{name}')" for name in names)
+        else:
+            select = ", doc"
+        sql = (
+            f"SELECT id, json_extract(doc, '$.nonce'){select} FROM rolls"
+            " WHERE json_extract(doc, '$.session') = ?"
+            " AND json_extract(doc, '$.nonce') > ?"
+            " ORDER BY json_extract(doc, '$.nonce') LIMIT ?"
+        )
+        last = -1
+        while True:
+            rows = self.conn.execute(
+                sql, (str(session_id), last, batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                if fields:
+                    yield {"_id": row[0], "nonce": row[1], **dict(zip(names, row[2:]))}
+                else:
+                    yield json_util.loads(row[2])
+            last = rows[-1][1]
+
+    def reveal_session_rolls(self, session_id, server_seed):
+        try:
+            with self.conn as conn:
+                conn.execute(
+                    "UPDATE rolls SET doc = json_set(doc, '$.server_seed', ?)"
+                    " WHERE json_extract(doc, '$.session') = ?",
+                    (server_seed, str(session_id)),
+                )
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+
+def open_store(url, schema=COMPACT):
+    """Return the `RollStore` for a mongodb://, sqlite:/// or memory:// URL.
+
+    `schema` is the stored roll schema for MongoDB (see roll_schema.py).
+    """
+    if url.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoRollStore(url, schema=schema)
+    if url.startswith("sqlite:///"):
+        return SQLiteRollStore(url[len("sqlite:///") :])
+    if url.startswith("memory://"):
+        return MemoryRollStore()
+    raise ValueError(f"Unsupported roll store URL: {url}")
+
+
+class AsyncMongoRollStore:
+    """Roll inserts through pymongo's asyncio client."""
+
+    def __init__(
+        self,
+        url="mongodb://localhost:27017/",
+        database="ultimate_dice",
+        schema=COMPACT,
+    ):
+        self.client = AsyncMongoClient(url)
+        self.db = self.client[database]
+        self.collection = self.db["dice_rolls"]
+        self.compact = schema == COMPACT
+
+    async def insert(self, doc):
+        doc.setdefault("_id", ObjectId())
+        try:
+            await self.collection.insert_one(encode_roll(doc) if self.compact else doc)
+        except PyMongoError as e:
+            raise StorageError(str(e)) from e
+        return doc["_id"]
+
+    async def close(self):
+        await self.client.close()
+
+
+class ThreadedAsyncStore:
+    """A synchronous `RollStore` whose inserts run in the default executor."""
+
+    def __init__(self, store):
+        self.store = store
+
+    async def insert(self, doc):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.store.insert, doc)
+
+    async def close(self):
+        pass
+
+
+def open_async_store(url, store=None, schema=COMPACT):
+    """Return the asyncio insert path for a store URL.
+
+    `store` is the synchronous store for the same URL, if one is open; it is
+    wrapped for the SQLite and memory backends (a memory store has to be
+    shared to be seen at all).
+    """
+    if url.startswith(("mongodb://", "mongodb+srv://")):
+        return AsyncMongoRollStore(url, schema=schema)
+    return ThreadedAsyncStore(store or open_store(url))
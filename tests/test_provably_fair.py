@@ -0,0 +1,47 @@
+"""KeyedHmac must stay byte-for-byte equal to the standard library HMAC,
+or every v2 proof changes."""
+
+import hashlib
+import hmac
+import unittest
+
+from provably_fair import KeyedHmac, keyed_hmac, roll_proof
+
+KEYS = {
+    "empty": b"",
+    "short": b"key",
+    "seed": b"ab" * 16,
+    "one below a block": b"k" * 63,
+    "one block": b"k" * 64,
+    "one above a block": b"k" * 65,
+    "several blocks": bytes(range(256)) * 2,
+}
+MESSAGES = (b"", b"client:0", b"m" * 64, b"m" * 1000)
+
+
+class KeyedHmacTest(unittest.TestCase):
+    def test_matches_hmac_new(self):
+        for name, key in KEYS.items():
+            keyed = KeyedHmac(key)
+            for message in MESSAGES:
+                with self.subTest(key=name, message_length=len(message)):
+                    expected = hmac.new(key, message, hashlib.sha256).digest()
+                    self.assertEqual(keyed.digest(message), expected)
+
+    def test_instance_is_reusable(self):
+        keyed = KeyedHmac(b"key")
+        first = keyed.digest(b"a")
+        keyed.digest(b"b")
+        self.assertEqual(keyed.digest(b"a"), first)
+
+    def test_roll_proof(self):
+        server_seed = "ab" * 16
+        expected = hmac.new(
+            server_seed.encode(), b"client:7", hashlib.sha256
+        ).hexdigest()
+        self.assertEqual(roll_proof(server_seed, "client", 7), expected)
+        self.assertIs(keyed_hmac(server_seed), keyed_hmac(server_seed))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""Re-verify many stored or submitted rolls in one pass.
+
+A roll to check is a row tuple::
+
+    (id, dice_type, result, proof, server_seed, client_seed, nonce, algo,
+     expression)
+
+with ``dice_type`` in stored form (``"3xd6"``) and ``result`` the stored
+comma-separated faces. `doc_row` builds one from a roll document.
+
+`verify_rows` groups plain rolls by die, count and algorithm. Groups of at
+least `VECTOR_THRESHOLD` rolls go through the NumPy engine's `bulk_verify`;
+below that its array setup costs more than it saves, so they are recomputed
+one at a time with `provably_fair_roll`. Within a group rolls are ordered by
+server seed, so all rolls of one Hive block (or batch, or session) reuse
+one keyed HMAC state however the input was ordered. Dice-expression rolls
+are always recomputed one at a time.
+"""
+
+from collections import defaultdict
+from typing import NamedTuple
+
+from dice_expr import roll_expression
+from provably_fair import ROLL_V1, parse_dice_type, provably_fair_roll
+from roll_engine import bulk_verify
+
+VECTOR_THRESHOLD = 32
+
+# Projection with the fields `doc_row` reads
+FIELDS = {
+    "dice_type": 1,
+    "roll_result": 1,
+    "proof": 1,
+    "server_seed": 1,
+    "client_seed": 1,
+    "nonce": 1,
+    "algo": 1,
+    "expression": 1,
+}
+
+
+class Outcome(NamedTuple):
+    proof_ok: bool
+    result_ok: bool
+    error: str | None = None
+
+    @property
+    def ok(self):
+        return self.proof_ok and self.result_ok
+
+    @property
+    def reason(self):
+        """Why the roll failed, or None if it verified."""
+        if self.error:
+            return self.error
+        if not self.proof_ok:
+            return "proof mismatch"
+        if not self.result_ok:
+            return "result mismatch"
+        return None
+
+
+def doc_row(doc):
+    """The row tuple for a stored roll document."""
+    return (
+        str(doc["_id"]),
+        doc.get("dice_type") or "",
+        doc.get("roll_result"),
+        doc.get("proof") or "",
+        doc.get("server_seed") or "",
+        doc.get("client_seed") or "",
+        doc.get("nonce", 0),
+        doc.get("algo"),
+        doc.get("expression"),
+    )
+
+
+def _failed(error):
+    return Outcome(False, False, error)
+
+
+def verify_expression(row):
+    """Check one dice-expression roll."""
+    _, _, result, proof, server, client, nonce, _, expression = row
+    try:
+        _, _, kept, _, recomputed = roll_expression(expression, server, client, nonce)
+    except ValueError as e:
+        return _failed(str(e))
+    return Outcome(recomputed == proof, ",".join(map(str, kept)) == result)
+
+
+def verify_rows(rows, vector_threshold=VECTOR_THRESHOLD):
+    """Return one `Outcome` per row, in order."""
+    outcomes = [None] * len(rows)
+    groups = defaultdict(list)  # (die, count, algo) -> row indexes
+    for i, row in enumerate(rows):
+        if not row[4]:
+            # Session rolls carry their seed only once the session is closed
+            outcomes[i] = _failed("server seed not revealed")
+            continue
+        if not all(isinstance(value, str) for value in row[3:6]):
+            # Rows are grouped by seed below, which needs comparable seeds
+            outcomes[i] = _failed("proof and seeds must be strings")
+            continue
+        if row[8]:
+            outcomes[i] = verify_expression(row)
+            continue
+        try:
+            dice_type, dice_count = parse_dice_type(row[1])
+        except ValueError:
+            outcomes[i] = _failed(f"unparseable dice_type {row[1]!r}")
+            continue
+        groups[(dice_type, dice_count, row[7] or ROLL_V1)].append(i)
+    for (dice_type, dice_count, algo), indexes in groups.items():
+        indexes.sort(key=lambda i: rows[i][4])
+        group = [rows[i] for i in indexes]
+        if len(group) >= vector_threshold:
+            checked = _verify_vectorized(dice_type, dice_count, algo, group)
+        else:
+            checked = _verify_scalar(dice_type, dice_count, algo, group)
+        for i, outcome in zip(indexes, checked):
+            outcomes[i] = outcome
+    return outcomes
+
+
+def _parse_faces(result):
+    # Malformed results become an empty roll, which never matches
+    try:
+        return [int(x) for x in (result or "").split(",") if x]
+    except ValueError:
+        return []
+
+
+def _verify_vectorized(dice_type, dice_count, algo, group):
+    _, _, results, proofs, servers, clients, nonces, _, _ = zip(*group)
+    try:
+        faces = [_parse_faces(r) for r in results]
+        proof_ok, result_ok = bulk_verify(
+            dice_type, dice_count, servers, clients, nonces, proofs, faces, algo
+        )
+    except ValueError as e:
+        return [_failed(str(e))] * len(group)
+    return [Outcome(bool(p), bool(r)) for p, r in zip(proof_ok, result_ok)]
+
+
+def _verify_scalar(dice_type, dice_count, algo, group):
+    outcomes = []
+    for _, _, result, proof, server, client, nonce, _, _ in group:
+        try:
+            faces, recomputed = provably_fair_roll(
+                dice_type, dice_count, server, client, nonce, algo
+            )
+        except ValueError as e:
+            outcomes.append(_failed(str(e)))
+            continue
+        outcomes.append(
+            Outcome(recomputed == proof, ",".join(map(str, faces)) == result)
+        )
+    return outcomes
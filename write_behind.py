@@ -0,0 +1,228 @@
+"""Write-behind persistence for roll documents.
+
+In write-behind mode `api_roll` does not wait for the roll store. Each roll
+gets its `ObjectId` on the client side and is put on a bounded in-memory
+queue; a background thread drains the queue with one ``insert_many`` per batch
+once a batch fills up or a short interval passes.
+
+When the queue is full, `submit` waits up to `put_timeout` seconds and then
+raises `queue.Full`, so callers can shed load instead of growing memory
+without bound. Batches that cannot be written (Mongo down, network error) are
+appended to a local JSON-lines spill file and replayed later, both at startup
+and once writes succeed again. Batches are inserted ignoring duplicate ids,
+so a batch that was only partly written before a crash is safe to replay.
+
+Every worker process of a deployment shares the spill file, so appends and
+replays hold an exclusive `flock` on a ``.lock`` file next to it. Lines that
+cannot be parsed (a line torn by a crash mid-append) are moved to a ``.bad``
+file next to it instead of blocking the replay of the rest.
+"""
+
+import atexit
+import fcntl
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from bson import json_util
+from bson.errors import BSONError
+from bson.objectid import ObjectId
+
+from storage import StorageError
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindWriter:
+    def __init__(
+        self,
+        store,
+        spill_path="dice_rolls.spill.jsonl",
+        max_queue=10000,
+        batch_size=500,
+        flush_interval=0.2,
+        put_timeout=1.0,
+        replay_interval=30.0,
+    ):
+        self.store = store
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.replay_interval = replay_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spill_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.flushed = 0
+        self.flush_batches = 0
+        self.flush_seconds = 0.0
+        self.last_flush_ms = None
+        self.spilled = 0
+        self.replayed = 0
+        self.rejected = 0
+
+    # ------------------------------------------------------------------ API
+
+    def start(self):
+        """Start the flusher for this process (after fork, too)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+            atexit.register(self.flush)
+
+    def submit(self, doc):
+        """Queue a roll document; assigns and returns its `_id`."""
+        self.start()
+        doc.setdefault("_id", ObjectId())
+        try:
+            self._queue.put(doc, timeout=self.put_timeout)
+        except queue.Full:
+            self.rejected += 1
+            raise
+        return doc["_id"]
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far has been written or spilled."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "flushed": self.flushed,
+            "flush_batches": self.flush_batches,
+            "avg_flush_ms": round(1000 * self.flush_seconds / self.flush_batches, 3)
+            if self.flush_batches
+            else None,
+            "last_flush_ms": self.last_flush_ms,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "spill_pending": os.path.exists(self.spill_path),
+        }
+
+    # ------------------------------------------------------------- flushing
+
+    def _run(self):
+        try:
+            self.replay()
+        except Exception:
+            log.exception("Write-behind replay crashed")
+        last_replay = time.monotonic()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                ok = self._flush(batch)
+                if ok and time.monotonic() - last_replay > self.replay_interval:
+                    last_replay = time.monotonic()
+                    self.replay()
+            except Exception:
+                # Keep the flusher alive; later batches still get written
+                log.exception("Write-behind flush crashed")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _insert(self, docs):
+        self.store.insert_many(docs, ignore_duplicates=True)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            self._insert(batch)
+        except StorageError as e:
+            log.warning(
+                "Write-behind flush failed, spilling %d rolls: %s", len(batch), e
+            )
+            self._spill(batch)
+            return False
+        elapsed = time.perf_counter() - started
+        self.flushed += len(batch)
+        self.flush_batches += 1
+        self.flush_seconds += elapsed
+        self.last_flush_ms = round(elapsed * 1000, 3)
+        return True
+
+    # ---------------------------------------------------------------- spill
+
+    @contextmanager
+    def _spill_locked(self):
+        """Hold the spill file against other threads and other processes."""
+        with self._spill_lock, open(self.spill_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _spill(self, docs):
+        data = "".join(json_util.dumps(doc) + "\n" for doc in docs).encode()
+        with self._spill_locked(), open(self.spill_path, "ab+") as f:
+            # Start on a fresh line if a crash tore the previous append
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.spilled += len(docs)
+
+    def _read_spill(self):
+        """Parse the spill file, moving unparsable lines to the ``.bad`` file."""
+        docs, good, bad = [], [], []
+        with open(self.spill_path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                line = line.rstrip("\n") + "\n"
+                try:
+                    docs.append(json_util.loads(line))
+                    good.append(line)
+                except (ValueError, BSONError):
+                    bad.append(line)
+        if bad:
+            log.error(
+                "Moving %d unreadable spilled lines to %s.bad",
+                len(bad),
+                self.spill_path,
+            )
+            with open(self.spill_path + ".bad", "a") as f:
+                f.writelines(bad)
+            with open(self.spill_path, "w") as f:
+                f.writelines(good)
+        return docs
+
+    def replay(self):
+        """Insert spilled rolls; the spill file is removed once all are written."""
+        with self._spill_locked():
+            if not os.path.exists(self.spill_path):
+                return 0
+            docs = self._read_spill()
+            try:
+                for i in range(0, len(docs), self.batch_size):
+                    self._insert(docs[i : i + self.batch_size])
+            except StorageError as e:
+                log.warning("Write-behind replay failed: %s", e)
+                return 0
+            os.remove(self.spill_path)
+        self.replayed += len(docs)
+        log.info("Replayed %d spilled rolls", len(docs))
+        return len(docs)
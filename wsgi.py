@@ -1,4 +1,7 @@
-from app import app
+from app import create_app
+
+app = create_app()
+app.extensions["dice"].preload()
 
 if __name__ == "__main__":
     app.run()